@@ -316,7 +316,15 @@ def get_networks_for_instance_from_cache(instance):
     return get_networks_for_instance_from_nw_info(nw_info)
 
 
-def get_networks_for_instance(context, instance):
+def has_nw_info_cache(instance):
+    """Returns whether the network info cache of an instance is filled."""
+    try:
+        return bool(instance['info_cache']['network_info'])
+    except (KeyError, AttributeError, TypeError):
+        return False
+
+
+def get_networks_for_instance(context, instance, fallback=True):
     """Returns a prepared nw_info list for passing into the view
     builders
 
@@ -326,6 +334,9 @@ def get_networks_for_instance(context, instance):
                 'floating_ips': [{'addr': '172.16.0.1', 'version': 4},
                                  {'addr': '172.16.2.1', 'version': 4}]},
      ...}
+
+    If the cache of the instance is empty and fallback is False, no
+    networks are returned instead of asking the network api.
     """
 
     try:
@@ -337,6 +348,9 @@ def get_networks_for_instance(context, instance):
         #                network api
         pass
 
+    if not fallback:
+        return {}
+
     network_api = network.API()
 
     try:
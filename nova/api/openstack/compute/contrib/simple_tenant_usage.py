@@ -105,8 +105,33 @@ class SimpleTenantUsageController(object):
             # instance hasn't launched, so no charge
             return 0
 
+    def _tenant_totals_for_period(self, context, period_start, period_stop,
+                                  tenant_id=None):
+        """Like _tenant_usages_for_period without server_usages, but summed
+        by the database rather than instance by instance."""
+        compute_api = api.API()
+        usages = compute_api.get_usage_by_window(context,
+                                                 period_start,
+                                                 period_stop,
+                                                 tenant_id)
+        rval = []
+        for usage in usages:
+            summary = {}
+            summary['tenant_id'] = usage['project_id']
+            summary['total_local_gb_usage'] = usage['total_local_gb_usage']
+            summary['total_vcpus_usage'] = usage['total_vcpus_usage']
+            summary['total_memory_mb_usage'] = usage['total_memory_mb_usage']
+            summary['total_hours'] = usage['total_hours']
+            summary['start'] = period_start
+            summary['stop'] = period_stop
+            rval.append(summary)
+        return rval
+
     def _tenant_usages_for_period(self, context, period_start,
                                   period_stop, tenant_id=None, detailed=True):
+        if not detailed:
+            return self._tenant_totals_for_period(context, period_start,
+                                                  period_stop, tenant_id)
 
         compute_api = api.API()
         instances = compute_api.get_active_by_window(context,
@@ -19,6 +19,7 @@ Module dedicated functions/classes dealing with rate limiting requests.
 
 import collections
 import copy
+import hashlib
 import httplib
 import json
 import math
@@ -31,11 +32,17 @@ import webob.exc
 from nova.api.openstack.compute.views import limits as limits_views
 from nova.api.openstack import wsgi
 from nova.api.openstack import xmlutil
+from nova import flags
+from nova import log as logging
 from nova import quota
 from nova import utils
 from nova import wsgi as base_wsgi
 
 
+FLAGS = flags.FLAGS
+LOG = logging.getLogger('nova.api.openstack.compute.limits')
+
+
 # Convenience constants for the limits dictionary passed to Limiter().
 PER_SECOND = 1
 PER_MINUTE = 60
@@ -123,6 +130,7 @@ class Limit(object):
         self.verb = verb
         self.uri = uri
         self.regex = regex
+        self._regex = None
         self.value = int(value)
         self.unit = unit
         self.unit_string = self.display_unit().lower()
@@ -140,6 +148,48 @@ class Limit(object):
         self.error_message = _("Only %(value)s %(verb)s request(s) can be "\
             "made to %(uri)s every %(unit_string)s." % self.__dict__)
 
+    def __deepcopy__(self, memo):
+        # Compiled patterns cannot be deep copied.  Every other
+        # attribute is immutable, so a shallow copy is enough.
+        result = copy.copy(self)
+        memo[id(self)] = result
+        return result
+
+    def matches(self, verb, url):
+        """Return True if this limit applies to the given request."""
+        if self.verb != verb:
+            return False
+        # Compiled on first use, so that limits are still listed when
+        # their regex is invalid.
+        if self._regex is None:
+            self._regex = re.compile(self.regex)
+        return self._regex.match(url) is not None
+
+    def leak(self, water_level, last_request, now):
+        """Return the water level of a bucket drained until `now`."""
+        if last_request is None:
+            return 0
+        return max(water_level - (now - last_request), 0)
+
+    def fill(self, water_level, last_request, now):
+        """
+        Add a request to a bucket last filled at `last_request`.
+
+        @return: Tuple of the new water level and the delay (in seconds)
+                 before the request may be made, or None if it may be
+                 made now.
+        """
+        water_level = self.leak(water_level, last_request, now)
+        difference = water_level + self.request_value - self.capacity
+        if difference > 0:
+            return water_level, difference
+        return water_level + self.request_value, None
+
+    def get_remaining(self, water_level):
+        """Return the number of requests a bucket still has room for."""
+        cap = self.capacity
+        return math.floor(((cap - water_level) / cap) * self.value)
+
     def __call__(self, verb, url):
         """
         Represents a call to this limit from a relevant request.
@@ -147,7 +197,7 @@ class Limit(object):
         @param verb: string http verb (POST, GET, etc.)
         @param url: string URL
         """
-        if self.verb != verb or not re.match(self.regex, url):
+        if not self.matches(verb, url):
             return
 
         now = self._get_time()
@@ -155,28 +205,22 @@ class Limit(object):
         if self.last_request is None:
             self.last_request = now
 
-        leak_value = now - self.last_request
-
-        self.water_level -= leak_value
-        self.water_level = max(self.water_level, 0)
-        self.water_level += self.request_value
-
-        difference = self.water_level - self.capacity
-
+        self.water_level, delay = self.fill(self.water_level,
+                                            self.last_request, now)
         self.last_request = now
 
-        if difference > 0:
-            self.water_level -= self.request_value
-            self.next_request = now + difference
-            return difference
-
-        cap = self.capacity
-        water = self.water_level
-        val = self.value
+        if delay:
+            self.next_request = now + delay
+            return delay
 
-        self.remaining = math.floor(((cap - water) / cap) * val)
+        self.remaining = self.get_remaining(self.water_level)
         self.next_request = now
 
+    def is_idle(self):
+        """Return True if the bucket of this limit has drained."""
+        return self.leak(self.water_level, self.last_request,
+                         self._get_time()) == 0
+
     def _get_time(self):
         """Retrieve the current time. Broken out for testability."""
         return time.time()
@@ -276,6 +320,10 @@ class Limiter(object):
     Rate-limit checking class which handles limits in memory.
     """
 
+    # Number of checks between scans for users whose buckets have all
+    # drained, which are then dropped to keep memory use bounded.
+    PRUNE_INTERVAL = 1000
+
     def __init__(self, limits, **kwargs):
         """
         Initialize the new `Limiter`.
@@ -284,12 +332,23 @@ class Limiter(object):
         """
         self.limits = copy.deepcopy(limits)
         self.levels = collections.defaultdict(lambda: copy.deepcopy(limits))
+        self.user_limits = {}
+        self._checks = 0
 
         # Pick up any per-user limit information
         for key, value in kwargs.items():
             if key.startswith('user:'):
                 username = key[5:]
-                self.levels[username] = self.parse_limits(value)
+                self.user_limits[username] = self.parse_limits(value)
+                self.levels[username] = self.user_limits[username]
+
+    def _prune(self):
+        """Drop the buckets of users who have not made requests lately."""
+        for username, limits in self.levels.items():
+            if username in self.user_limits:
+                continue
+            if all(limit.is_idle() for limit in limits):
+                del self.levels[username]
 
     def get_limits(self, username=None):
         """
@@ -303,6 +362,11 @@ class Limiter(object):
 
         @return: Tuple of delay (in seconds) and error message (or None, None)
         """
+        self._checks += 1
+        if self._checks >= self.PRUNE_INTERVAL:
+            self._checks = 0
+            self._prune()
+
         delays = []
 
         for limit in self.levels[username]:
@@ -377,6 +441,117 @@ class Limiter(object):
         return result
 
 
+class MemcachedLimiter(Limiter):
+    """
+    Rate-limit checking class which keeps the buckets in memcached, so that
+    every API worker using the same memcached_servers shares them.
+
+    Each bucket is updated with a compare-and-set, so concurrent requests
+    are counted exactly once.  Buckets expire once they would have drained,
+    so idle users take no space.
+    """
+
+    # Number of times a contended bucket update is retried before the
+    # request is let through.
+    CAS_RETRIES = 10
+
+    # Number of compare-and-set ids the client may hold before they are
+    # cleared.
+    MAX_CAS_IDS = 10000
+
+    def __init__(self, limits, **kwargs):
+        super(MemcachedLimiter, self).__init__(limits, **kwargs)
+        if FLAGS.memcached_servers:
+            import memcache
+        else:
+            from nova.testing.fake import memcache
+        self._cache = memcache.Client(FLAGS.memcached_servers, debug=0,
+                                      cache_cas=True)
+
+    def _get_user_limits(self, username):
+        return self.user_limits.get(username, self.limits)
+
+    @staticmethod
+    def _get_key(username, limit):
+        rule = '\0'.join([utils.utf8(username or ''), limit.verb,
+                           utils.utf8(limit.regex), str(limit.value),
+                           str(limit.unit)])
+        return 'ratelimit-%s' % hashlib.md5(rule).hexdigest()
+
+    @staticmethod
+    def _load(value):
+        water_level, last_request = value.split(' ')
+        return float(water_level), float(last_request)
+
+    def _fill(self, key, limit, now):
+        """Add a request to the shared bucket and return the delay."""
+        expire = int(math.ceil(limit.capacity))
+        for attempt in xrange(self.CAS_RETRIES):
+            value = self._cache.gets(key)
+            if value is None:
+                water_level, delay = limit.fill(0, None, now)
+                stored = self._cache.add(key, '%r %r' % (water_level, now),
+                                         time=expire)
+            else:
+                water_level, last_request = self._load(value)
+                water_level, delay = limit.fill(water_level, last_request,
+                                                now)
+                stored = self._cache.cas(key, '%r %r' % (water_level, now),
+                                         time=expire)
+            if stored:
+                return delay
+
+        LOG.warn(_("Could not update rate limit bucket %s, allowing the "
+                   "request"), key)
+
+    def check_for_delay(self, verb, url, username=None):
+        """
+        Check the given verb/user/user triplet for limit.
+
+        @return: Tuple of delay (in seconds) and error message (or None, None)
+        """
+        if len(getattr(self._cache, 'cas_ids', ())) > self.MAX_CAS_IDS:
+            self._cache.reset_cas()
+
+        delays = []
+
+        for limit in self._get_user_limits(username):
+            if not limit.matches(verb, url):
+                continue
+            now = limit._get_time()
+            delay = self._fill(self._get_key(username, limit), limit, now)
+            if delay:
+                delays.append((delay, limit.error_message))
+
+        if delays:
+            delays.sort()
+            return delays[0]
+
+        return None, None
+
+    def get_limits(self, username=None):
+        """
+        Return the limits for a given user.
+        """
+        limits = self._get_user_limits(username)
+        keys = [self._get_key(username, limit) for limit in limits]
+        values = self._cache.get_multi(keys)
+
+        result = []
+        for key, limit in zip(keys, limits):
+            now = limit._get_time()
+            water_level = 0
+            if key in values:
+                water_level, last_request = self._load(values[key])
+                water_level = limit.leak(water_level, last_request, now)
+            display = limit.display()
+            display['remaining'] = int(limit.get_remaining(water_level))
+            wait = water_level + limit.request_value - limit.capacity
+            display['resetTime'] = int(now + max(wait, 0))
+            result.append(display)
+        return result
+
+
 class WsgiLimiter(object):
     """
     Rate-limit checking from a WSGI application. Uses an in-memory `Limiter`.
@@ -22,11 +22,14 @@ from nova.api.openstack import common
 from nova.api.openstack.compute.views import addresses as views_addresses
 from nova.api.openstack.compute.views import flavors as views_flavors
 from nova.api.openstack.compute.views import images as views_images
+from nova import flags
 from nova import log as logging
+from nova import network
 from nova import utils
 
 
 LOG = logging.getLogger('nova.api.openstack.compute.views.servers')
+FLAGS = flags.FLAGS
 
 
 class ViewBuilder(common.ViewBuilder):
@@ -120,6 +123,7 @@ class ViewBuilder(common.ViewBuilder):
 
     def detail(self, request, instances):
         """Detailed view of a list of instance."""
+        self._refresh_nw_info_caches(request, instances)
         return self._list_view(self.show, request, instances)
 
     def _list_view(self, func, request, servers):
@@ -151,9 +155,34 @@ class ViewBuilder(common.ViewBuilder):
             sha_hash = hashlib.sha224(project + host)  # pylint: disable=E1101
             return sha_hash.hexdigest()
 
+    def _refresh_nw_info_caches(self, request, instances):
+        """Refresh the empty network info caches of instances.
+
+        The network service is asked once to fill the caches of all of
+        the instances in the background, instead of once per instance
+        while they are shown.  Those instances have no addresses until
+        their cache is filled, so this is only done when
+        osapi_refresh_nw_info_in_background is set.
+        """
+        if not FLAGS.osapi_refresh_nw_info_in_background:
+            return
+
+        stale = [instance for instance in instances
+                 if not (instance.get("_is_precooked") or
+                         common.has_nw_info_cache(instance))]
+        if not stale:
+            return
+
+        context = request.environ["nova.context"]
+        network.API().refresh_instance_nw_info_caches(context, stale)
+        request.environ["nova.nw_info_refreshing"] = set(
+                instance["uuid"] for instance in stale)
+
     def _get_addresses(self, request, instance):
         context = request.environ["nova.context"]
-        networks = common.get_networks_for_instance(context, instance)
+        refreshing = request.environ.get("nova.nw_info_refreshing", ())
+        networks = common.get_networks_for_instance(context, instance,
+                fallback=instance["uuid"] not in refreshing)
         return self._address_builder.index(networks)["addresses"]
 
     def _get_image(self, request, instance):
@@ -24,7 +24,9 @@ import webob
 from webob import exc
 
 from nova import exception
+from nova import flags
 from nova import log as logging
+from nova.openstack.common import cfg
 from nova import utils
 from nova import wsgi
 
@@ -36,6 +38,21 @@ XMLNS_ATOM = 'http://www.w3.org/2005/Atom'
 
 LOG = logging.getLogger('nova.api.openstack.wsgi')
 
+streaming_opts = [
+    cfg.IntOpt('streaming_response_threshold',
+               default=100,
+               help='Responses holding a collection of at least this many '
+                    'items are serialized and sent a batch at a time; '
+                    '0 disables streaming'),
+    cfg.IntOpt('streaming_response_batch_size',
+               default=100,
+               help='Number of collection items serialized per chunk of a '
+                    'streamed response'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(streaming_opts)
+
 # The vendor content types should serialize identically to the non-vendor
 # content types. So to avoid littering the code with both options, we
 # map the vendor to the other when looking up the type
@@ -232,6 +249,34 @@ class JSONDictSerializer(DictSerializer):
     def default(self, data):
         return utils.dumps(data)
 
+    def serialize_iter(self, data, key, batch_size=100):
+        """Serialize data a few items of data[key] at a time.
+
+        Returns an iterator over chunks of the JSON, in which the items
+        of the list data[key] are dumped batch_size at a time.
+        """
+
+        return self._serialize_iter(data, key, batch_size)
+
+    def _serialize_iter(self, data, key, batch_size):
+        yield '{%s: [' % utils.dumps(key)
+
+        sep = ''
+        batch = []
+        for item in data[key]:
+            batch.append(utils.dumps(item))
+            if len(batch) >= batch_size:
+                yield sep + ', '.join(batch)
+                sep = ', '
+                batch = []
+        if batch:
+            yield sep + ', '.join(batch)
+
+        # The other keys are usually small, such as collection links
+        rest = ''.join(', %s: %s' % (utils.dumps(k), utils.dumps(v))
+                       for k, v in data.items() if k != key)
+        yield ']%s}' % rest
+
 
 class XMLDictSerializer(DictSerializer):
 
@@ -500,10 +545,31 @@ class ResponseObject(object):
             response.headers[hdr] = value
         response.headers['Content-Type'] = content_type
         if self.obj is not None:
-            response.body = serializer.serialize(self.obj)
+            body_iter = self._serialize_iter(serializer)
+            if body_iter is not None:
+                # No Content-Length, so the body is sent chunked as it
+                # is serialized
+                response.app_iter = body_iter
+            else:
+                response.body = serializer.serialize(self.obj)
 
         return response
 
+    def _serialize_iter(self, serializer):
+        """Serializes a large collection a batch at a time.
+
+        Returns an iterator over the chunks of the serialized object if
+        it holds a collection of at least streaming_response_threshold
+        items and the serializer can stream it.  Returns None otherwise.
+        """
+
+        key = _get_stream_key(self.obj)
+        if key is None or not hasattr(serializer, 'serialize_iter'):
+            return None
+
+        return _abort_on_error(serializer.serialize_iter(self.obj, key,
+                FLAGS.streaming_response_batch_size))
+
     @property
     def code(self):
         """Retrieve the response status."""
@@ -517,6 +583,37 @@ class ResponseObject(object):
         return self._headers.copy()
 
 
+def _abort_on_error(chunks):
+    """Logs an error serializing a streamed response, and re-raises it.
+
+    The status and headers are sent by then, so the error cannot be
+    reported to the client.  The server drops the connection instead of
+    ending the body, so the client sees a broken response rather than a
+    truncated one which looks complete.
+    """
+
+    try:
+        for chunk in chunks:
+            yield chunk
+    except Exception:
+        LOG.exception(_('Failed to serialize a streamed response'))
+        raise
+
+
+def _get_stream_key(obj):
+    """Return the key of the collection to stream in obj, or None."""
+
+    if not FLAGS.streaming_response_threshold or type(obj) is not dict:
+        return None
+
+    for key, value in obj.items():
+        if (isinstance(value, list) and
+            len(value) >= FLAGS.streaming_response_threshold):
+            return key
+
+    return None
+
+
 def action_peek_json(body):
     """Determine action to invoke."""
 
@@ -131,9 +131,27 @@ class ConstantSelector(object):
         return self.value
 
 
+# Comment marking where the items go when streaming a list
+_STREAM_MARKER = 'nova-stream-items'
+
+# Render functions compiled by _compile_renderer(), keyed by the tuple of
+# sibling template elements they render.  Cleared whenever a template
+# element which has been compiled is changed.
+_RENDERERS = {}
+
+
 class TemplateElement(object):
     """Represent an element in the template."""
 
+    # Set once this element is part of a compiled render function
+    _compiled = False
+
+    def _changed(self):
+        """Drop compiled render functions, which may include this element."""
+
+        if self._compiled:
+            _RENDERERS.clear()
+
     def __init__(self, tag, attrib=None, selector=None, subselector=None,
                  **extra):
         """Initialize an element.
@@ -219,6 +237,7 @@ class TemplateElement(object):
 
         self._children.append(elem)
         self._childmap[elem.tag] = elem
+        self._changed()
 
     def extend(self, elems):
         """Append children to the element."""
@@ -240,6 +259,7 @@ class TemplateElement(object):
         # Update the children
         self._children.extend(elemlist)
         self._childmap.update(elemmap)
+        self._changed()
 
     def insert(self, idx, elem):
         """Insert a child element at the given index."""
@@ -253,6 +273,7 @@ class TemplateElement(object):
 
         self._children.insert(idx, elem)
         self._childmap[elem.tag] = elem
+        self._changed()
 
     def remove(self, elem):
         """Remove a child element."""
@@ -266,6 +287,7 @@ class TemplateElement(object):
 
         self._children.remove(elem)
         del self._childmap[elem.tag]
+        self._changed()
 
     def get(self, key):
         """Get an attribute.
@@ -296,6 +318,7 @@ class TemplateElement(object):
             value = Selector(value)
 
         self.attrib[key] = value
+        self._changed()
 
     def keys(self):
         """Return the attribute names."""
@@ -453,9 +476,11 @@ class TemplateElement(object):
             value = Selector(value)
 
         self._text = value
+        self._changed()
 
     def _text_del(self):
         self._text = None
+        self._changed()
 
     text = property(_text_get, _text_set, _text_del)
 
@@ -489,6 +514,170 @@ class TemplateElement(object):
                 (' '.join(contents), ''.join(children), self.tag))
 
 
+def _overrides(obj, *names):
+    """Determine whether obj overrides any of the named methods."""
+
+    cls = type(obj)
+    for name in names:
+        if getattr(cls, name).im_func is not \
+                getattr(TemplateElement, name).im_func:
+            return True
+    return False
+
+
+def _compile_selector(selector):
+    """Specialize a selector.
+
+    Returns a callable equivalent to the selector.  Selectors
+    consisting of a single index are turned into a plain index
+    operation.
+    """
+
+    if type(selector) is not Selector or len(selector.chain) != 1 or \
+            callable(selector.chain[0]):
+        return selector
+
+    index = selector.chain[0]
+
+    def select(obj, do_raise=False):
+        try:
+            return obj[index]
+        except (KeyError, IndexError):
+            if do_raise:
+                raise KeyError(index)
+            return None
+
+    return select
+
+
+def _get_renderer(siblings):
+    """Return the compiled render function for a list of siblings.
+
+    The template tree is compiled the first time it is used, and the
+    render function is reused afterwards.
+    """
+
+    key = tuple(siblings)
+    try:
+        return _RENDERERS[key]
+    except KeyError:
+        render = _RENDERERS[key] = _compile_renderer(siblings)
+        return render
+
+
+def _compile_renderer(siblings):
+    """Compile a list of sibling template elements.
+
+    Returns a function taking the parent etree.Element, the object
+    and the namespace dictionary, which renders the siblings and all
+    of their descendants and returns the rendered (etree.Element,
+    datum) pairs, like TemplateElement.render().  The merging of the
+    children of the siblings is done once, here, rather than each time
+    an object is rendered.
+    """
+
+    element = siblings[0]
+    patches = siblings[1:]
+
+    # Determine the children and their siblings
+    children = []
+    seen = set()
+    for idx, sibling in enumerate(siblings):
+        sibling._compiled = True
+        for child in sibling:
+            # Have we handled this child already?
+            if child.tag in seen:
+                continue
+            seen.add(child.tag)
+
+            # Determine the child's siblings
+            nieces = [child]
+            for sib in siblings[idx + 1:]:
+                if child.tag in sib:
+                    nieces.append(sib[child.tag])
+
+            children.append(_compile_renderer(nieces))
+
+    def render_children(elems):
+        for render_child in children:
+            for elem, datum in elems:
+                render_child(elem, datum, None)
+
+    # Subclasses overriding the rendering methods are rendered the
+    # general way
+    if (_overrides(element, 'render', '_render', 'apply') or
+        [patch for patch in patches if _overrides(patch, 'apply')]):
+        def render(parent, obj, nsmap):
+            elems = element.render(parent, obj, patches, nsmap)
+            render_children(elems)
+            return elems
+
+        render.element = element
+        render.children = children
+        return render
+
+    # Gather what is needed to render the element...
+    selector = element.selector
+    subselector = element.subselector
+    will_render = element.will_render
+    tag = element.tag
+    tag_is_callable = callable(tag)
+    texts = [sib.text for sib in siblings if sib.text is not None]
+    text = texts[-1] if texts else None
+    attribs = [(key, _compile_selector(value))
+               for sib in siblings for key, value in sib.attrib.items()]
+
+    def make_elem(parent, datum, nsmap):
+        tagname = tag(datum) if tag_is_callable else tag
+        if parent is None:
+            return etree.Element(tagname, nsmap=nsmap)
+        return etree.SubElement(parent, tagname, nsmap=nsmap)
+
+    def render(parent, obj, nsmap):
+        # First, get the datum we're rendering
+        data = None if obj is None else selector(obj)
+
+        # Check if we should render at all
+        if not will_render(data):
+            return []
+        elif data is None:
+            elems = [(make_elem(parent, None, nsmap), None)]
+            render_children(elems)
+            return elems
+
+        # Make the data into a list if it isn't already
+        if not isinstance(data, list):
+            data = [data]
+        elif parent is None:
+            raise ValueError(_('root element selecting a list'))
+
+        elems = []
+        for datum in data:
+            if subselector is not None:
+                datum = subselector(datum)
+            elem = make_elem(parent, datum, nsmap)
+            elems.append((elem, datum))
+            if datum is None:
+                continue
+
+            # Apply the text and attributes
+            if text is not None:
+                elem.text = unicode(text(datum))
+            for key, value in attribs:
+                try:
+                    elem.set(key, unicode(value(datum, True)))
+                except KeyError:
+                    # Attribute has no value, so don't include it
+                    pass
+
+        render_children(elems)
+        return elems
+
+    render.element = element
+    render.children = children
+    return render
+
+
 def SubTemplateElement(parent, tag, attrib=None, selector=None,
                        subselector=None, **extra):
     """Create a template element as a child of another.
@@ -545,27 +734,7 @@ class Template(object):
                       rendered.
         """
 
-        # First step, render the element
-        elems = siblings[0].render(parent, obj, siblings[1:], nsmap)
-
-        # Now, recurse to all child elements
-        seen = set()
-        for idx, sibling in enumerate(siblings):
-            for child in sibling:
-                # Have we handled this child already?
-                if child.tag in seen:
-                    continue
-                seen.add(child.tag)
-
-                # Determine the child's siblings
-                nieces = [child]
-                for sib in siblings[idx + 1:]:
-                    if child.tag in sib:
-                        nieces.append(sib[child.tag])
-
-                # Now we recurse for every data element
-                for elem, datum in elems:
-                    self._serialize(elem, datum, nieces)
+        elems = _get_renderer(siblings)(parent, obj, nsmap)
 
         # Return the first element; at the top level, this will be the
         # root element
@@ -592,6 +761,88 @@ class Template(object):
         # Serialize it into XML
         return etree.tostring(elem, *args, **kwargs)
 
+    def serialize_iter(self, obj, key, batch_size=100):
+        """Serialize an object a few items at a time.
+
+        Returns an iterator over chunks of the serialized XML, in which
+        the items of the list obj[key] are rendered batch_size at a
+        time, so that the element tree of the whole list never exists at
+        once.  Returns None if the template does not render obj[key] as
+        the children of its root element.
+
+        :param obj: The object to serialize.
+        :param key: The key of the list to render incrementally.
+        """
+
+        if self.root is None:
+            return None
+
+        siblings = self._siblings()
+        nsmap = self._nsmap()
+        render = _get_renderer(siblings)
+
+        # The root element must render the object itself, and one of
+        # its children must render the list
+        if render.element.selector.__class__ is not Selector or \
+                render.element.selector.chain:
+            return None
+        for render_item in render.children:
+            selector = render_item.element.selector
+            if (selector.__class__ is Selector and
+                selector.chain == (key,) and
+                not callable(render_item.element.tag)):
+                break
+        else:
+            return None
+
+        # Render everything but the list, with a marker where the list
+        # items go; the marker item may not render, and then the list
+        # cannot be streamed
+        head_obj = dict(obj)
+        head_obj[key] = [{}]
+        try:
+            root = render(None, head_obj, nsmap)[0][0]
+        except Exception:
+            return None
+        for elem in root:
+            if elem.tag == render_item.element.tag:
+                root.replace(elem, etree.Comment(_STREAM_MARKER))
+                break
+        else:
+            return None
+        head, tail = etree.tostring(root, **self.serialize_options).split(
+                '<!--%s-->' % _STREAM_MARKER)
+
+        return self._serialize_iter(head, tail, root, obj[key], key,
+                                    batch_size, render_item)
+
+    def _serialize_iter(self, head, tail, root, items, key, batch_size,
+                        render_item):
+        yield head
+
+        # Render the items batch_size at a time into a copy of the root
+        # element, to get the same namespace prefixes
+        batch = []
+        for item in items:
+            batch.append(item)
+            if len(batch) >= batch_size:
+                yield self._serialize_items(root, key, batch, render_item)
+                batch = []
+        if batch:
+            yield self._serialize_items(root, key, batch, render_item)
+
+        yield tail
+
+    def _serialize_items(self, root, key, items, render_item):
+        parent = etree.Element(root.tag, nsmap=root.nsmap)
+        render_item(parent, {key: items}, None)
+        if not len(parent):
+            return ''
+
+        # Strip the start and end tags of the parent
+        text = etree.tostring(parent, encoding='UTF-8')
+        return text[text.index('>') + 1:text.rindex('</')]
+
     def make_tree(self, obj):
         """Create a tree.
 
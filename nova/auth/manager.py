@@ -23,10 +23,12 @@ Keystone is the recommended solution for auth management.
 Nova authentication management
 """
 
+import hashlib
 import os
 import shutil
 import string  # pylint: disable=W0402
 import tempfile
+import time
 import uuid
 import zipfile
 
@@ -89,6 +91,14 @@ auth_opts = [
     cfg.StrOpt('auth_driver',
                default='nova.auth.dbdriver.DbDriver',
                help='Driver that auth manager uses'),
+    cfg.IntOpt('auth_cache_ttl',
+               default=60,
+               help='Number of seconds the user and project an access key '
+                    'resolves to are cached for in each process, and the '
+                    'roles of a user in memcached_servers. Changes made '
+                    'through the auth manager invalidate both at once for '
+                    'every process sharing those servers. 0 or no '
+                    'memcached_servers disables the cache'),
     ]
 
 FLAGS = flags.FLAGS
@@ -233,6 +243,9 @@ class AuthManager(object):
 
     _instance = None
     mc = None
+    # Cache key -> (expiry time, user, project).  Users hold their secret
+    # key, so they are only cached in memory and never in memcached.
+    _access_cache = {}
 
     def __new__(cls, *args, **kwargs):
         """Returns the AuthManager singleton"""
@@ -292,38 +305,8 @@ class AuthManager(object):
         @return: User and project that the request represents.
         """
         # TODO(vish): check for valid timestamp
-        (access_key, _sep, project_id) = access.partition(':')
-
-        LOG.debug(_('Looking up user: %r'), access_key)
-        user = self.get_user_from_access_key(access_key)
-        LOG.debug('user: %r', user)
-        if user is None:
-            LOG.audit(_("Failed authorization for access key %s"), access_key)
-            raise exception.AccessKeyNotFound(access_key=access_key)
+        (user, project) = self._get_user_and_project(access)
 
-        # NOTE(vish): if we stop using project name as id we need better
-        #             logic to find a default project for user
-        if project_id == '':
-            LOG.debug(_("Using project name = user name (%s)"), user.name)
-            project_id = user.name
-
-        project = self.get_project(project_id)
-        if project is None:
-            pjid = project_id
-            uname = user.name
-            LOG.audit(_("failed authorization: no project named %(pjid)s"
-                    " (user=%(uname)s)") % locals())
-            raise exception.ProjectNotFound(project_id=project_id)
-        if not self.is_admin(user) and not self.is_project_member(user,
-                                                                  project):
-            uname = user.name
-            uid = user.id
-            pjname = project.name
-            pjid = project.id
-            LOG.audit(_("Failed authorization: user %(uname)s not admin"
-                    " and not member of project %(pjname)s") % locals())
-            raise exception.ProjectMembershipNotFound(project_id=pjid,
-                                                      user_id=uid)
         if check_type == 's3':
             sign = signer.Signer(user.secret.encode())
             expected_signature = sign.s3_authorization(headers, verb, path)
@@ -358,6 +341,81 @@ class AuthManager(object):
                                                  user=user)
         return (user, project)
 
+    def _auth_cache_key(self, *parts):
+        """Builds a cache key valid until the auth data next changes"""
+        generation = self.mc.get('authcache-generation')
+        if generation is None:
+            self.mc.add('authcache-generation', '0')
+            generation = self.mc.get('authcache-generation') or '0'
+        # Access keys are chosen by users and may contain characters
+        # memcached does not allow in keys.
+        digest = hashlib.sha1(utils.utf8(':'.join(parts))).hexdigest()
+        return 'authcache-%s-%s' % (generation, digest)
+
+    def _clear_auth_cache(self):
+        """Invalidates every cached access key and role lookup"""
+        if self.mc.incr('authcache-generation') is None:
+            self.mc.set('authcache-generation', '1')
+
+    @staticmethod
+    def _auth_cache_enabled():
+        """Returns whether lookups are cached, which needs memcached"""
+        return FLAGS.auth_cache_ttl > 0 and bool(FLAGS.memcached_servers)
+
+    def _get_user_and_project(self, access):
+        """Resolves an access key to the user and project it represents
+
+        Successful lookups are cached in this process for
+        FLAGS.auth_cache_ttl seconds.
+        """
+        if self._auth_cache_enabled():
+            cache_key = self._auth_cache_key('access', access)
+            cached = self._access_cache.get(cache_key)
+            if cached is not None and cached[0] > time.time():
+                return cached[1:]
+
+        (access_key, _sep, project_id) = access.partition(':')
+
+        LOG.debug(_('Looking up user: %r'), access_key)
+        user = self.get_user_from_access_key(access_key)
+        LOG.debug('user: %r', user)
+        if user is None:
+            LOG.audit(_("Failed authorization for access key %s"), access_key)
+            raise exception.AccessKeyNotFound(access_key=access_key)
+
+        # NOTE(vish): if we stop using project name as id we need better
+        #             logic to find a default project for user
+        if project_id == '':
+            LOG.debug(_("Using project name = user name (%s)"), user.name)
+            project_id = user.name
+
+        project = self.get_project(project_id)
+        if project is None:
+            pjid = project_id
+            uname = user.name
+            LOG.audit(_("failed authorization: no project named %(pjid)s"
+                    " (user=%(uname)s)") % locals())
+            raise exception.ProjectNotFound(project_id=project_id)
+        if not self.is_admin(user) and not self.is_project_member(user,
+                                                                  project):
+            uname = user.name
+            uid = user.id
+            pjname = project.name
+            pjid = project.id
+            LOG.audit(_("Failed authorization: user %(uname)s not admin"
+                    " and not member of project %(pjname)s") % locals())
+            raise exception.ProjectMembershipNotFound(project_id=pjid,
+                                                      user_id=uid)
+
+        if self._auth_cache_enabled():
+            now = time.time()
+            for key, cached in self._access_cache.items():
+                if cached[0] <= now:
+                    del self._access_cache[key]
+            self._access_cache[cache_key] = (now + FLAGS.auth_cache_ttl,
+                                             user, project)
+        return (user, project)
+
     def get_access_key(self, user, project):
         """Get an access key that includes user and project"""
         if not isinstance(user, User):
@@ -494,6 +552,7 @@ class AuthManager(object):
         with self.driver() as drv:
             self._clear_mc_key(uid, role, pid)
             drv.add_role(uid, role, pid)
+        self._clear_auth_cache()
 
     def remove_role(self, user, role, project=None):
         """Removes role for user
@@ -523,6 +582,7 @@ class AuthManager(object):
         with self.driver() as drv:
             self._clear_mc_key(uid, role, pid)
             drv.remove_role(uid, role, pid)
+        self._clear_auth_cache()
 
     @staticmethod
     def get_roles(project_roles=True):
@@ -540,11 +600,21 @@ class AuthManager(object):
 
     def get_active_roles(self, user, project=None):
         """Get all active roles for context"""
+        if self._auth_cache_enabled():
+            cache_key = self._auth_cache_key('roles', User.safe_id(user),
+                                             Project.safe_id(project) or '')
+            active_roles = self.mc.get(cache_key)
+            if active_roles is not None:
+                return active_roles
         if project:
             roles = FLAGS.allowed_roles + ['projectmanager']
         else:
             roles = FLAGS.global_roles
-        return [role for role in roles if self.has_role(user, role, project)]
+        active_roles = [role for role in roles
+                        if self.has_role(user, role, project)]
+        if self._auth_cache_enabled():
+            self.mc.set(cache_key, active_roles, time=FLAGS.auth_cache_ttl)
+        return active_roles
 
     def get_project(self, pid):
         """Get project object by id"""
@@ -616,6 +686,7 @@ class AuthManager(object):
             drv.modify_project(Project.safe_id(project),
                                manager_user,
                                description)
+        self._clear_auth_cache()
 
     def add_to_project(self, user, project):
         """Add user to project"""
@@ -623,8 +694,10 @@ class AuthManager(object):
         pid = Project.safe_id(project)
         LOG.audit(_("Adding user %(uid)s to project %(pid)s") % locals())
         with self.driver() as drv:
-            return drv.add_to_project(User.safe_id(user),
-                                      Project.safe_id(project))
+            result = drv.add_to_project(User.safe_id(user),
+                                        Project.safe_id(project))
+        self._clear_auth_cache()
+        return result
 
     def is_project_manager(self, user, project):
         """Checks if user is project manager"""
@@ -644,7 +717,9 @@ class AuthManager(object):
         pid = Project.safe_id(project)
         LOG.audit(_("Remove user %(uid)s from project %(pid)s") % locals())
         with self.driver() as drv:
-            return drv.remove_from_project(uid, pid)
+            result = drv.remove_from_project(uid, pid)
+        self._clear_auth_cache()
+        return result
 
     @staticmethod
     def get_project_vpn_data(project):
@@ -675,6 +750,7 @@ class AuthManager(object):
         LOG.audit(_("Deleting project %s"), Project.safe_id(project))
         with self.driver() as drv:
             drv.delete_project(Project.safe_id(project))
+        self._clear_auth_cache()
 
     def get_user(self, uid):
         """Retrieves a user by id"""
@@ -732,6 +808,8 @@ class AuthManager(object):
                 rvadmin = rv.admin
                 LOG.audit(_("Created user %(rvname)s"
                         " (admin: %(rvadmin)r)") % locals())
+                # The access key may have belonged to a deleted user
+                self._clear_auth_cache()
                 return rv
 
     def delete_user(self, user):
@@ -744,6 +822,7 @@ class AuthManager(object):
                                         uid)
         with self.driver() as drv:
             drv.delete_user(uid)
+        self._clear_auth_cache()
 
     def modify_user(self, user, access_key=None, secret_key=None, admin=None):
         """Modify credentials for a user"""
@@ -757,6 +836,7 @@ class AuthManager(object):
                     " for user %(uid)s") % locals())
         with self.driver() as drv:
             drv.modify_user(uid, access_key, secret_key, admin)
+        self._clear_auth_cache()
 
     def get_credentials(self, user, project=None, use_dmz=True):
         """Get credential zip for user in project"""
@@ -18,6 +18,7 @@
 """Common Policy Engine Implementation"""
 
 import json
+import re
 import urllib
 import urllib2
 
@@ -45,6 +46,14 @@ def reset():
     _BRAIN = None
 
 
+def get_brain():
+    """Return the brain used by enforce(), creating a Brain() if not set."""
+    global _BRAIN
+    if not _BRAIN:
+        _BRAIN = Brain()
+    return _BRAIN
+
+
 def enforce(match_list, target_dict, credentials_dict):
     """Enforces authorization of some rules against credentials.
 
@@ -94,39 +103,152 @@ def enforce(match_list, target_dict, credentials_dict):
     :raises NotAuthorized if the check fails
 
     """
-    global _BRAIN
-    if not _BRAIN:
-        _BRAIN = Brain()
-    if not _BRAIN.check(match_list, target_dict, credentials_dict):
+    if not get_brain().check(match_list, target_dict, credentials_dict):
         raise NotAuthorized()
 
 
+_TARGET_KEY_RE = re.compile(r'%\((\w+)\)')
+
+
+def _allow(target_dict, cred_dict):
+    return True
+
+
+def _deny(target_dict, cred_dict):
+    return False
+
+
+def _merge_target_keys(keys_list):
+    """Union of the target keys used by several checks.
+
+    None means that a check may use any part of the target.
+
+    """
+    result = set()
+    for keys in keys_list:
+        if keys is None:
+            return None
+        result.update(keys)
+    return tuple(sorted(result))
+
+
 class Brain(object):
-    """Implements policy checking."""
+    """Implements policy checking.
+
+    Match lists are compiled into nested functions the first time they are
+    checked, so the rules are only parsed once per brain.  A compiled match
+    list is a tuple of the function checking it and the keys of the target
+    dict it depends on (None if it may depend on the whole target), which
+    lets callers cache decisions.
+
+    """
     @classmethod
     def load_json(cls, data, default_rule=None):
         """Init a brain using json instead of a rules dictionary."""
         rules_dict = json.loads(data)
-        return cls(rules=rules_dict, default_rule=default_rule)
+        brain = cls(rules=rules_dict, default_rule=default_rule)
+        brain.compile_rules()
+        return brain
 
     def __init__(self, rules=None, default_rule=None):
         self.rules = rules or {}
         self.default_rule = default_rule
+        self._compiled_rules = {}
+        self._compiled_lists = {}
 
     def add_rule(self, key, match):
         self.rules[key] = match
+        self._compiled_rules = {}
+        self._compiled_lists = {}
+
+    def compile_rules(self):
+        """Compile every rule of this brain."""
+        for name in self.rules:
+            self._compile_rule(name)
+
+    def compile(self, match_list):
+        """Compile a match list.
+
+        :returns: tuple of a function taking (target_dict, cred_dict) and
+                  returning True if the check passes, and the target keys
+                  the result depends on
+
+        """
+        try:
+            return self._compiled_lists[match_list]
+        except KeyError:
+            compiled = self._compile(match_list)
+            self._compiled_lists[match_list] = compiled
+            return compiled
+        except TypeError:
+            # Match lists loaded from json are not hashable.
+            return self._compile(match_list)
+
+    def _compile(self, match_list):
+        if not match_list:
+            return _allow, ()
 
-    def _check(self, match, target_dict, cred_dict):
+        or_checks = []
+        keys_list = []
+        for and_list in match_list:
+            if isinstance(and_list, basestring):
+                and_list = (and_list,)
+            and_checks = []
+            for item in and_list:
+                check, keys = self._compile_match(item)
+                and_checks.append(check)
+                keys_list.append(keys)
+            or_checks.append(and_checks)
+
+        def check(target_dict, cred_dict):
+            for and_checks in or_checks:
+                for and_check in and_checks:
+                    if not and_check(target_dict, cred_dict):
+                        break
+                else:
+                    return True
+            return False
+
+        return check, _merge_target_keys(keys_list)
+
+    def _compile_match(self, match):
         match_kind, match_value = match.split(':', 1)
+        if match_kind == 'rule':
+            return self._compile_rule(match_value)
+
+        f = getattr(self, '_check_%s' % match_kind, None)
+        if f is None:
+            f = self._check_generic
+            match_value = match
+            keys = tuple(_TARGET_KEY_RE.findall(match))
+        elif match_kind == 'role':
+            keys = ()
+        else:
+            keys = None
+
+        def check(target_dict, cred_dict):
+            return f(match_value, target_dict, cred_dict)
+
+        return check, keys
+
+    def _compile_rule(self, name):
+        try:
+            return self._compiled_rules[name]
+        except KeyError:
+            pass
+
         try:
-            f = getattr(self, '_check_%s' % match_kind)
-        except AttributeError:
-            if not self._check_generic(match, target_dict, cred_dict):
-                return False
+            match_list = self.rules[name]
+        except KeyError:
+            if self.default_rule and name != self.default_rule:
+                compiled = self._compile_rule(self.default_rule)
+            else:
+                compiled = _deny, ()
         else:
-            if not f(match_value, target_dict, cred_dict):
-                return False
-        return True
+            compiled = self._compile(match_list)
+
+        self._compiled_rules[name] = compiled
+        return compiled
 
     def check(self, match_list, target_dict, cred_dict):
         """Checks authorization of some rules against credentials.
@@ -140,27 +262,13 @@ class Brain(object):
         :returns: True if the check passes
 
         """
-        if not match_list:
-            return True
-        for and_list in match_list:
-            if isinstance(and_list, basestring):
-                and_list = (and_list,)
-            if all([self._check(item, target_dict, cred_dict)
-                    for item in and_list]):
-                return True
-        return False
+        check, _keys = self.compile(match_list)
+        return check(target_dict, cred_dict)
 
     def _check_rule(self, match, target_dict, cred_dict):
         """Recursively checks credentials based on the brains rules."""
-        try:
-            new_match_list = self.rules[match]
-        except KeyError:
-            if self.default_rule and match != self.default_rule:
-                new_match_list = ('rule:%s' % self.default_rule,)
-            else:
-                return False
-
-        return self.check(new_match_list, target_dict, cred_dict)
+        check, _keys = self._compile_rule(match)
+        return check(target_dict, cred_dict)
 
     def _check_role(self, match, target_dict, cred_dict):
         """Check that there is a matching role in the cred dict."""
@@ -20,6 +20,7 @@
 """Handles all requests relating to compute resources (e.g. guest vms,
 networking and storage of vms, and compute hosts on which they run)."""
 
+import datetime
 import functools
 import re
 import time
@@ -50,12 +51,18 @@ from nova import volume
 
 LOG = logging.getLogger('nova.compute.api')
 
+tenant_usage_rollups_opt = cfg.BoolOpt('tenant_usage_rollups',
+        default=False,
+        help='Answer the closed days of tenant usage requests from daily '
+             'rollups, which are stored the first time a day is asked for')
+
 find_host_timeout_opt = cfg.StrOpt('find_host_timeout',
         default=30,
         help='Timeout after NN seconds when looking for a host.')
 
 FLAGS = flags.FLAGS
 FLAGS.register_opt(find_host_timeout_opt)
+FLAGS.register_opt(tenant_usage_rollups_opt)
 flags.DECLARE('enable_zone_routing', 'nova.scheduler.api')
 flags.DECLARE('consoleauth_topic', 'nova.consoleauth')
 
@@ -339,38 +346,65 @@ class API(base.Base):
 
         LOG.debug(_("Going to run %s instances...") % num_instances)
 
-        if create_instance_here:
-            instance = self.create_db_entry_for_new_instance(
-                    context, instance_type, image, base_options,
-                    security_group, block_device_mapping)
-            # Tells scheduler we created the instance already.
-            base_options['uuid'] = instance['uuid']
-            rpc_method = rpc.cast
-        else:
-            # We need to wait for the scheduler to create the instance
-            # DB entries, because the instance *could* be # created in
-            # a child zone.
-            rpc_method = rpc.call
-
-        # TODO(comstud): We should use rpc.multicall when we can
-        # retrieve the full instance dictionary from the scheduler.
-        # Otherwise, we could exceed the AMQP max message size limit.
-        # This would require the schedulers' schedule_run_instances
-        # methods to return an iterator vs a list.
-        instances = self._schedule_run_instance(
-                rpc_method,
-                context, base_options,
-                instance_type, zone_blob,
-                availability_zone, injected_files,
-                admin_password, image,
-                num_instances, requested_networks,
-                block_device_mapping, security_group,
-                filter_properties)
+        reservations = self._reserve_instance_quota(context, num_instances,
+                                                    instance_type)
+        try:
+            if create_instance_here:
+                instance = self.create_db_entry_for_new_instance(
+                        context, instance_type, image, base_options,
+                        security_group, block_device_mapping)
+                # Tells scheduler we created the instance already.
+                base_options['uuid'] = instance['uuid']
+                rpc_method = rpc.cast
+            else:
+                # We need to wait for the scheduler to create the instance
+                # DB entries, because the instance *could* be # created in
+                # a child zone.
+                rpc_method = rpc.call
+
+            # TODO(comstud): We should use rpc.multicall when we can
+            # retrieve the full instance dictionary from the scheduler.
+            # Otherwise, we could exceed the AMQP max message size limit.
+            # This would require the schedulers' schedule_run_instances
+            # methods to return an iterator vs a list.
+            instances = self._schedule_run_instance(
+                    rpc_method,
+                    context, base_options,
+                    instance_type, zone_blob,
+                    availability_zone, injected_files,
+                    admin_password, image,
+                    num_instances, requested_networks,
+                    block_device_mapping, security_group,
+                    filter_properties)
+        except Exception:
+            with utils.save_and_reraise_exception():
+                quota.rollback(context, reservations)
+
+        quota.commit(context, reservations)
 
         if create_instance_here:
             return ([instance], reservation_id)
         return (instances, reservation_id)
 
+    def _reserve_instance_quota(self, context, num_instances, instance_type):
+        """Reserve quota for num_instances instances of instance_type.
+
+        allowed_instances() has already checked the quota; reserving it
+        re-checks atomically so that parallel requests cannot overshoot.
+        """
+        try:
+            return quota.reserve(context,
+                    instances=num_instances,
+                    cores=num_instances * instance_type['vcpus'],
+                    ram=num_instances * instance_type['memory_mb'])
+        except exception.OverQuota:
+            pid = context.project_id
+            LOG.warn(_("Quota exceeded for %(pid)s,"
+                    " tried to run %(num_instances)s instances") % locals())
+            message = _("Instance quota exceeded. You cannot run any "
+                        "more instances of this type.")
+            raise exception.QuotaError(message, "InstanceLimitExceeded")
+
     @staticmethod
     def _volume_size(instance_type, virtual_name):
         size = 0
@@ -849,6 +883,7 @@ class API(base.Base):
             LOG.warning(_("No host for instance %s, deleting immediately"),
                         instance["uuid"])
             self.db.instance_destroy(context, instance['id'])
+            quota.release_instance(context, instance)
 
     def _delete(self, context, instance):
         host = instance['host']
@@ -862,6 +897,7 @@ class API(base.Base):
                                        instance)
         else:
             self.db.instance_destroy(context, instance['id'])
+            quota.release_instance(context, instance)
 
     # NOTE(jerdfelt): The API implies that only ACTIVE and ERROR are
     # allowed but the EC2 API appears to allow from RESCUED and STOPPED
@@ -962,6 +998,67 @@ class API(base.Base):
         return self.db.instance_get_active_by_window(context, begin, end,
                                                      project_id)
 
+    # Like get_active_by_window, the caller checks the policy
+    def get_usage_by_window(self, context, begin, end, project_id=None):
+        """Get the hours, vcpu, memory and disk usage of each project over
+        a window.
+
+        With the tenant_usage_rollups flag, the days of the window that are
+        over are read from the daily rollups, and the rest scanned."""
+        usages = {}
+
+        def _add(rows):
+            for row in rows:
+                if not row['project_id']:
+                    continue
+                if project_id and row['project_id'] != project_id:
+                    continue
+                usage = usages.setdefault(row['project_id'],
+                                          {'project_id': row['project_id']})
+                for key in ('total_hours', 'total_vcpus_usage',
+                            'total_memory_mb_usage', 'total_local_gb_usage'):
+                    usage[key] = usage.get(key, 0) + row[key]
+
+        windows = [(begin, end)]
+        if FLAGS.tenant_usage_rollups:
+            first_day = datetime.datetime(begin.year, begin.month, begin.day)
+            if first_day < begin:
+                first_day += datetime.timedelta(days=1)
+            closed = min(end, utils.utcnow())
+            last_day = datetime.datetime(closed.year, closed.month,
+                                         closed.day)
+            if first_day < last_day:
+                windows = [(begin, first_day), (last_day, end)]
+                _add(self._get_usage_rollups(context, first_day, last_day))
+
+        for window_begin, window_end in windows:
+            if window_begin < window_end:
+                _add(self.db.tenant_usage_get_by_window(context,
+                                                        window_begin,
+                                                        window_end,
+                                                        project_id))
+        return usages.values()
+
+    def _get_usage_rollups(self, context, first_day, last_day):
+        """Get the rollups of the days from first_day until last_day,
+        rolling up the days that haven't been yet."""
+        admin_context = context.elevated()
+        rollups = self.db.tenant_usage_rollup_get_by_window(admin_context,
+                                                            first_day,
+                                                            last_day)
+        rolled_up = set(rollup['period_start'] for rollup in rollups)
+        day = first_day
+        while day < last_day:
+            next_day = day + datetime.timedelta(days=1)
+            if day not in rolled_up:
+                day_usages = self.db.tenant_usage_get_by_window(
+                        admin_context, day, next_day)
+                self.db.tenant_usage_rollup_create(admin_context, day,
+                                                   day_usages)
+                rollups.extend(day_usages)
+            day = next_day
+        return rollups
+
     #NOTE(bcwaldon): this doesn't really belong in this class
     def get_instance_type(self, context, instance_type_id):
         """Get an instance type by instance type id."""
@@ -59,6 +59,7 @@ from nova import network
 from nova.network import model as network_model
 from nova.notifier import api as notifier
 from nova.openstack.common import cfg
+from nova import quota
 from nova import rpc
 from nova import utils
 from nova.virt import driver
@@ -116,6 +117,16 @@ compute_opts = [
                default=3600,
                help="Number of periodic scheduler ticks to wait between "
                     "runs of the image cache manager."),
+    cfg.IntOpt("sync_power_state_event_interval",
+               default=10,
+               help="Number of periodic scheduler ticks to wait between "
+                    "runs of the power state sync when the hypervisor "
+                    "reports the power state changes as they happen."),
+    cfg.BoolOpt("overlap_boot_phases",
+                default=True,
+                help="Allocate networks, set up block devices and fetch the "
+                     "image of a new instance concurrently rather than one "
+                     "after another."),
     ]
 
 FLAGS = flags.FLAGS
@@ -202,6 +213,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         self.network_manager = utils.import_object(FLAGS.network_manager)
         self._last_host_check = 0
         self._last_bw_usage_poll = 0
+        self._power_state_events = False
+        self._power_state_ticks_to_skip = 0
 
         super(ComputeManager, self).__init__(service_name="compute",
                                              *args, **kwargs)
@@ -218,6 +231,8 @@ class ComputeManager(manager.SchedulerDependentManager):
     def init_host(self):
         """Initialization for a standalone compute service."""
         self.driver.init_host(host=self.host)
+        self._power_state_events = self.driver.register_event_listener(
+                self.handle_power_state_event)
         context = nova.context.get_admin_context()
         instances = self.db.instance_get_all_by_host(context, self.host)
         for instance in instances:
@@ -412,19 +427,42 @@ class ComputeManager(manager.SchedulerDependentManager):
             image_meta = self._check_image_size(context, instance)
             self._start_building(context, instance)
             self._notify_about_instance_usage(instance, "create.start")
-            network_info = self._allocate_network(context, instance,
-                                                  requested_networks)
+            timings = {}
+            if FLAGS.overlap_boot_phases:
+                (network_info, block_device_info,
+                 prefetch) = self._prepare_concurrently(context, instance,
+                        image_meta, requested_networks, timings)
+            else:
+                prefetch = None
+                network_info = self._timed(timings, 'network',
+                        self._allocate_network, context, instance,
+                        requested_networks)
+                try:
+                    block_device_info = self._timed(timings, 'block_device',
+                            self._prep_block_device, context, instance)
+                except Exception:
+                    with utils.save_and_reraise_exception():
+                        self._deallocate_network(context, instance)
             try:
-                block_device_info = self._prep_block_device(context, instance)
-                instance = self._spawn(context, instance, image_meta,
+                instance = self._timed(timings, 'spawn', self._spawn,
+                                       context, instance, image_meta,
                                        network_info, block_device_info,
                                        injected_files, admin_password)
             except Exception:
                 with utils.save_and_reraise_exception():
                     self._deallocate_network(context, instance)
+            if prefetch is not None:
+                # Normally long finished, but its timing has to be in
+                # create.end whatever order the green threads ran in
+                prefetch.wait()
 
+            LOG.info(_("Instance %(instance_uuid)s boot phase timings: "
+                       "%(timings)s") % locals())
+            usage_info = utils.usage_from_instance(instance,
+                                                   network_info=network_info,
+                                                   boot_timings=timings)
             self._notify_about_instance_usage(instance, "create.end",
-                                              network_info=network_info)
+                                              usage_info=usage_info)
 
             if self._is_instance_terminated(instance_uuid):
                 raise exception.InstanceNotFound
@@ -438,6 +476,65 @@ class ComputeManager(manager.SchedulerDependentManager):
             with utils.save_and_reraise_exception():
                 self._set_instance_error_state(context, instance_uuid)
 
+    @staticmethod
+    def _timed(timings, phase, func, *args, **kwargs):
+        """Run func, recording how many seconds it took in timings"""
+        start = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings[phase] = round(time.time() - start, 3)
+
+    def _prepare_concurrently(self, context, instance, image_meta,
+                              requested_networks, timings):
+        """Allocate networks and set up block devices side by side while
+        the image is fetched into the hypervisor's cache.
+
+        The network allocation is rolled back if block device setup fails.
+        A failed image prefetch is only logged; spawn fetches the image
+        itself and reports the error. The prefetch green thread is returned
+        along with the network and block device info so the caller can
+        collect its timing.
+        """
+        prefetch = greenthread.spawn(self._timed, timings, 'image_prefetch',
+                                     self._prefetch_image, context, instance,
+                                     image_meta)
+        allocation = greenthread.spawn(self._timed, timings, 'network',
+                                       self._allocate_network, context,
+                                       instance, requested_networks)
+        try:
+            block_device_info = self._timed(timings, 'block_device',
+                                            self._prep_block_device,
+                                            context, instance)
+        except Exception:
+            with utils.save_and_reraise_exception():
+                try:
+                    allocation.wait()
+                except Exception:
+                    # _allocate_network already logged the failure
+                    pass
+                else:
+                    self._deallocate_network(context, instance)
+                # Leave the task state pointing at the failed phase
+                self._instance_update(context, instance['uuid'],
+                        task_state=task_states.BLOCK_DEVICE_MAPPING)
+        try:
+            network_info = allocation.wait()
+        except Exception:
+            with utils.save_and_reraise_exception():
+                self._instance_update(context, instance['uuid'],
+                                      task_state=task_states.NETWORKING)
+        return network_info, block_device_info, prefetch
+
+    def _prefetch_image(self, context, instance, image_meta):
+        """Fetch the image of a new instance ahead of spawn"""
+        try:
+            self.driver.prefetch_image(context, instance, image_meta)
+        except Exception:
+            LOG.warn(_("Unable to prefetch image for instance %s, it will "
+                       "be fetched when spawning"), instance['uuid'],
+                     exc_info=True)
+
     def _check_instance_not_already_created(self, context, instance):
         """Ensure an instance with the same name is not already present."""
         if self.driver.instance_exists(instance['name']):
@@ -637,6 +734,7 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         if instance['power_state'] == power_state.SHUTOFF:
             self.db.instance_destroy(context, instance_id)
+            quota.release_instance(context, instance)
             raise exception.Error(_('trying to destroy already destroyed'
                                     ' instance: %s') % instance_uuid)
         # NOTE(vish) get bdms before destroying the instance
@@ -681,6 +779,7 @@ class ComputeManager(manager.SchedulerDependentManager):
                               terminated_at=utils.utcnow())
 
         self.db.instance_destroy(context, instance_id)
+        quota.release_instance(context, instance)
         self._notify_about_instance_usage(instance, "delete.end")
 
     @exception.wrap_exception(notifier=notifier, publisher_id=publisher_id())
@@ -1158,6 +1257,8 @@ class ComputeManager(manager.SchedulerDependentManager):
         old_instance_type = migration_ref['old_instance_type_id']
         instance_type = instance_types.get_instance_type(old_instance_type)
 
+        quota.resize_instance(context, instance_ref, instance_type)
+
         # Just roll back the record. There's no need to resize down since
         # the 'old' VM already has the preferred attributes
         self._instance_update(context,
@@ -1275,6 +1376,7 @@ class ComputeManager(manager.SchedulerDependentManager):
         if old_instance_type_id != new_instance_type_id:
             instance_type = instance_types.get_instance_type(
                     new_instance_type_id)
+            quota.resize_instance(context, instance_ref, instance_type)
             instance_ref = self._instance_update(
                     context,
                     instance_ref.uuid,
@@ -2076,17 +2178,27 @@ class ComputeManager(manager.SchedulerDependentManager):
                 # they just don't get the info in the usage events.
                 return
 
+            if not bw_usage:
+                return
+
+            # Resolve every mac address with a single network call
+            # and write all of the usage rows in one transaction.
+            macs = [usage['mac_address'] for usage in bw_usage]
+            vifs = self.network_api.get_vifs_by_mac_addresses(context, macs)
+            instance_ids = dict((vif['address'], vif['instance_id'])
+                                for vif in vifs)
+
+            usages = []
             for usage in bw_usage:
                 mac = usage['mac_address']
-                vif = self.network_api.get_vif_by_mac_address(context, mac)
-                if not vif:
+                if mac not in instance_ids:
                     continue
+                usages.append(dict(instance_id=instance_ids[mac],
+                                   mac=mac,
+                                   bw_in=usage['bw_in'],
+                                   bw_out=usage['bw_out']))
 
-                self.db.bw_usage_update(context,
-                                        vif['instance_id'],
-                                        mac,
-                                        start_time,
-                                        usage['bw_in'], usage['bw_out'])
+            self.db.bw_usage_update_bulk(context, start_time, usages)
 
     @manager.periodic_task
     def _report_driver_status(self, context):
@@ -2109,7 +2221,18 @@ class ComputeManager(manager.SchedulerDependentManager):
         then it will be set to power_state.NOSTATE, because it doesn't exist
         on the hypervisor.
 
+        When the hypervisor reports the power state changes as they happen,
+        this only runs every sync_power_state_event_interval ticks, to catch
+        any change that was missed.
+
         """
+        if self._power_state_events:
+            if self._power_state_ticks_to_skip > 0:
+                self._power_state_ticks_to_skip -= 1
+                return
+            self._power_state_ticks_to_skip = \
+                    FLAGS.sync_power_state_event_interval
+
         vm_instances = self.driver.list_instances_detail()
         vm_instances = dict((vm.name, vm) for vm in vm_instances)
         db_instances = self.db.instance_get_all_by_host(context, self.host)
@@ -2123,7 +2246,6 @@ class ComputeManager(manager.SchedulerDependentManager):
 
         for db_instance in db_instances:
             name = db_instance["name"]
-            db_power_state = db_instance['power_state']
             vm_instance = vm_instances.get(name)
 
             if vm_instance is None:
@@ -2131,19 +2253,44 @@ class ComputeManager(manager.SchedulerDependentManager):
             else:
                 vm_power_state = vm_instance.state
 
-            if vm_power_state == db_power_state:
-                continue
+            self._sync_instance_power_state(context, db_instance,
+                                            vm_power_state)
 
-            if (vm_power_state in (power_state.NOSTATE, power_state.SHUTOFF)
-                and db_instance['vm_state'] == vm_states.ACTIVE):
-                self._instance_update(context,
-                                      db_instance["id"],
-                                      power_state=vm_power_state,
-                                      vm_state=vm_states.SHUTOFF)
-            else:
-                self._instance_update(context,
-                                      db_instance["id"],
-                                      power_state=vm_power_state)
+    def _sync_instance_power_state(self, context, db_instance,
+                                   vm_power_state):
+        """Record the power state the hypervisor has for an instance."""
+        if vm_power_state == db_instance['power_state']:
+            return
+
+        if (vm_power_state in (power_state.NOSTATE, power_state.SHUTOFF)
+            and db_instance['vm_state'] == vm_states.ACTIVE):
+            self._instance_update(context,
+                                  db_instance["id"],
+                                  power_state=vm_power_state,
+                                  vm_state=vm_states.SHUTOFF)
+        else:
+            self._instance_update(context,
+                                  db_instance["id"],
+                                  power_state=vm_power_state)
+
+    def handle_power_state_event(self, instance_uuid, vm_power_state):
+        """Record a power state change reported by the hypervisor."""
+        context = nova.context.get_admin_context()
+        try:
+            db_instance = self.db.instance_get_by_uuid(context, instance_uuid)
+        except exception.NotFound:
+            # Instances being deleted are stopped on the way out
+            return
+
+        if db_instance['host'] != self.host or db_instance['task_state']:
+            # Instances which are moving or in the middle of an
+            # operation are left to the operation, which sets the
+            # power state it ends with.
+            return
+
+        LOG.debug(_('Power state of %(instance_uuid)s changed to '
+                    '%(vm_power_state)s'), locals())
+        self._sync_instance_power_state(context, db_instance, vm_power_state)
 
     @manager.periodic_task
     def _reclaim_queued_deletes(self, context):
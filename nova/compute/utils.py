@@ -22,31 +22,42 @@ from nova import context
 from nova import db
 from nova import exception
 from nova import flags
+from nova import log as logging
 from nova import network
 from nova.network import model as network_model
 from nova.notifier import api as notifier_api
+from nova.openstack.common import cfg
 from nova import utils
 
 
-FLAGS = flags.FLAGS
+usage_audit_opts = [
+    cfg.IntOpt('usage_audit_page_size',
+               default=500,
+               help='Number of instances instance-usage-audit reads, '
+                    'and notifies about, at a time'),
+    cfg.IntOpt('usage_audit_shard_count',
+               default=1,
+               help='Number of instance-usage-audit runs sharing the '
+                    'instances between them'),
+    cfg.IntOpt('usage_audit_shard_index',
+               default=0,
+               help='Which of the usage_audit_shard_count shards this '
+                    'instance-usage-audit run handles'),
+    cfg.StrOpt('usage_audit_state_file',
+               default=None,
+               help='File where instance-usage-audit records its progress, '
+                    'so an interrupted run resumes where it stopped'),
+    ]
 
+FLAGS = flags.FLAGS
+FLAGS.register_opts(usage_audit_opts)
 
-def notify_usage_exists(instance_ref, current_period=False):
-    """ Generates 'exists' notification for an instance for usage auditing
-        purposes.
+LOG = logging.getLogger('nova.compute.utils')
 
-        Generates usage for last completed period, unless 'current_period'
-        is True."""
-    admin_context = context.get_admin_context()
-    begin, end = utils.current_audit_period()
-    bw = {}
-    if current_period:
-        audit_start = end
-        audit_end = utils.utcnow()
-    else:
-        audit_start = begin
-        audit_end = end
 
+def _usage_exists_info(admin_context, instance_ref, audit_start, audit_end,
+                       bw_usages):
+    """Builds the payload of an 'exists' notification."""
     if (instance_ref.get('info_cache') and
         instance_ref['info_cache'].get('network_info')):
 
@@ -56,9 +67,8 @@ def notify_usage_exists(instance_ref, current_period=False):
         nw_info = network.API().get_instance_nw_info(admin_context,
                                                          instance_ref)
 
-    for b in db.bw_usage_get_by_instance(admin_context,
-                                         instance_ref['id'],
-                                         audit_start):
+    bw = {}
+    for b in bw_usages:
         label = 'net-name-not-found-%s' % b['mac']
         for vif in nw_info:
             if vif['address'] == b['mac']:
@@ -66,16 +76,103 @@ def notify_usage_exists(instance_ref, current_period=False):
                 break
 
         bw[label] = dict(bw_in=b.bw_in, bw_out=b.bw_out)
-    usage_info = utils.usage_from_instance(instance_ref,
+    return utils.usage_from_instance(instance_ref,
                           audit_period_beginning=str(audit_start),
                           audit_period_ending=str(audit_end),
                           bandwidth=bw)
+
+
+def notify_usage_exists(instance_ref, current_period=False):
+    """ Generates 'exists' notification for an instance for usage auditing
+        purposes.
+
+        Generates usage for last completed period, unless 'current_period'
+        is True."""
+    admin_context = context.get_admin_context()
+    begin, end = utils.current_audit_period()
+    if current_period:
+        audit_start = end
+        audit_end = utils.utcnow()
+    else:
+        audit_start = begin
+        audit_end = end
+
+    bw_usages = db.bw_usage_get_by_instance(admin_context,
+                                            instance_ref['id'],
+                                            audit_start)
+    usage_info = _usage_exists_info(admin_context, instance_ref,
+                                    audit_start, audit_end, bw_usages)
     notifier_api.notify('compute.%s' % FLAGS.host,
                         'compute.instance.exists',
                         notifier_api.INFO,
                         usage_info)
 
 
+def notify_usage_exists_in_window(admin_context, begin, end, marker=None,
+                                  shard=None, page_size=None,
+                                  progress=None):
+    """Generates 'exists' notifications for every instance active between
+    begin and end.
+
+    Instances are read page_size at a time in id order, starting after the
+    instance whose id is marker, so memory use doesn't grow with the number
+    of instances.  The bandwidth usage of a page is read with one query and
+    its notifications are sent together.  shard is an (index, count) tuple
+    as taken by db.instance_get_active_by_window_joined.  After each page
+    progress, if given, is called with the id of its last instance, which
+    is the marker to pass to resume from there.
+
+    Returns the number of notifications sent.
+    """
+    page_size = page_size or FLAGS.usage_audit_page_size
+    count = 0
+    while True:
+        instances = db.instance_get_active_by_window_joined(admin_context,
+                begin, end, marker=marker, limit=page_size, shard=shard)
+        if not instances:
+            break
+
+        bw_usages = {}
+        filters = {'instance_id': [instance['id'] for instance in instances],
+                   'start_period': begin}
+        for b in db.bw_usage_get_all_by_filters(admin_context, filters):
+            bw_usages.setdefault(b['instance_id'], []).append(b)
+
+        payloads = [_usage_exists_info(admin_context, instance, begin, end,
+                                       bw_usages.get(instance['id'], []))
+                    for instance in instances]
+        notifier_api.notify_many('compute.%s' % FLAGS.host,
+                                 'compute.instance.exists',
+                                 notifier_api.INFO,
+                                 payloads)
+        count += len(instances)
+        marker = instances[-1]['id']
+        if progress:
+            progress(marker)
+        if len(instances) < page_size:
+            break
+    return count
+
+
+def update_instance_progress(context, instance, step, total_steps):
+    """Update instance progress percent to reflect current step number
+    """
+    # FIXME(sirp): for now we're taking a KISS approach to instance
+    # progress:
+    # Divide the action's workflow into discrete steps and "bump" the
+    # instance's progress field as each step is completed.
+    #
+    # For a first cut this should be fine, however, for large VM images,
+    # the _create_disks step begins to dominate the equation. A
+    # better approximation would use the percentage of the VM image that
+    # has been streamed to the destination host.
+    progress = round(float(step) / total_steps * 100)
+    instance_uuid = instance['uuid']
+    LOG.debug(_("Updating instance '%(instance_uuid)s' progress to"
+                " %(progress)d") % locals())
+    db.instance_update(context, instance_uuid, {'progress': progress})
+
+
 def legacy_network_info(network_model):
     """
     Return the legacy network_info representation of the network_model
@@ -520,6 +520,11 @@ def virtual_interface_get_by_address(context, address):
     return IMPL.virtual_interface_get_by_address(context, address)
 
 
+def virtual_interface_get_by_addresses(context, addresses):
+    """Gets the virtual interfaces for a list of mac addresses."""
+    return IMPL.virtual_interface_get_by_addresses(context, addresses)
+
+
 def virtual_interface_get_by_uuid(context, vif_uuid):
     """Gets a virtual interface from the table filtering on vif uuid."""
     return IMPL.virtual_interface_get_by_uuid(context, vif_uuid)
@@ -609,12 +614,18 @@ def instance_get_active_by_window(context, begin, end=None, project_id=None):
 
 
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None):
+                                         project_id=None, marker=None,
+                                         limit=None, shard=None):
     """Get instances and joins active during a certain time window.
 
-    Specifying a project_id will filter for a certain project."""
+    Specifying a project_id will filter for a certain project.
+    With a limit, at most limit instances are returned in id order,
+    starting after the instance whose id is marker.  shard is an
+    (index, count) tuple keeping only the instances whose id modulo
+    count is index."""
     return IMPL.instance_get_active_by_window_joined(context, begin, end,
-                                              project_id)
+                                              project_id, marker=marker,
+                                              limit=limit, shard=shard)
 
 
 def instance_get_all_by_user(context, user_id):
@@ -983,6 +994,39 @@ def quota_destroy_all_by_project(context, project_id):
 ###################
 
 
+def quota_usage_get_all_by_project(context, project_id):
+    """Retrieve all usage associated with a given project."""
+    return IMPL.quota_usage_get_all_by_project(context, project_id)
+
+
+def quota_reserve(context, project_id, deltas, quotas, expire, max_age):
+    """Check quotas and reserve resource usage for a project.
+
+    Returns a list of reservation uuids.  Raises OverQuota if any of the
+    positive deltas would take the project over its quota.
+    """
+    return IMPL.quota_reserve(context, project_id, deltas, quotas,
+                              expire, max_age)
+
+
+def reservation_commit(context, reservations):
+    """Commit quota reservations, moving them from reserved to in_use."""
+    return IMPL.reservation_commit(context, reservations)
+
+
+def reservation_rollback(context, reservations):
+    """Roll back quota reservations, releasing the reserved usage."""
+    return IMPL.reservation_rollback(context, reservations)
+
+
+def reservation_expire(context):
+    """Roll back all quota reservations which have expired."""
+    return IMPL.reservation_expire(context)
+
+
+###################
+
+
 def volume_allocate_iscsi_target(context, volume_id, host):
     """Atomically allocate a free iscsi_target from the pool."""
     return IMPL.volume_allocate_iscsi_target(context, volume_id, host)
@@ -1163,6 +1207,15 @@ def security_group_get_by_instance(context, instance_id):
     return IMPL.security_group_get_by_instance(context, instance_id)
 
 
+def security_group_get_by_instances(context, instance_ids):
+    """Get the security groups of several instances at once.
+
+    Returns a dict mapping each instance id to its security groups, with
+    their rules and the instances of the groups the rules grant access to.
+    """
+    return IMPL.security_group_get_by_instances(context, instance_ids)
+
+
 def security_group_exists(context, project_id, group_name):
     """Indicates if a group name exists in a project."""
     return IMPL.security_group_exists(context, project_id, group_name)
@@ -1552,6 +1605,38 @@ def bw_usage_update(context,
                                 bw_in, bw_out)
 
 
+def bw_usage_update_bulk(context, start_period, usages):
+    """Update cached bw usage for many interfaces at once.
+
+    :param usages: list of dicts with instance_id, mac, bw_in and bw_out
+    Creates new records as needed."""
+    return IMPL.bw_usage_update_bulk(context, start_period, usages)
+
+
+####################
+
+
+def tenant_usage_get_by_window(context, begin, end, project_id=None):
+    """Return the hours, vcpu, memory and disk usage of each project over
+    a window, summed by the database.
+
+    Specifying a project_id will filter for a certain project."""
+    return IMPL.tenant_usage_get_by_window(context, begin, end, project_id)
+
+
+def tenant_usage_rollup_get_by_window(context, begin, end):
+    """Return the daily usage rollups starting within a window."""
+    return IMPL.tenant_usage_rollup_get_by_window(context, begin, end)
+
+
+def tenant_usage_rollup_create(context, period_start, usages):
+    """Record the usage of every project over the day from period_start.
+
+    :param usages: list of dicts as returned by tenant_usage_get_by_window
+    Does nothing if the day has already been rolled up."""
+    return IMPL.tenant_usage_rollup_create(context, period_start, usages)
+
+
 ####################
 
 
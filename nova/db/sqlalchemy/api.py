@@ -40,7 +40,10 @@ from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import joinedload
 from sqlalchemy.orm import joinedload_all
 from sqlalchemy.sql import func
+from sqlalchemy.sql.expression import case
 from sqlalchemy.sql.expression import desc
+from sqlalchemy.sql.expression import extract
+from sqlalchemy.sql.expression import literal
 from sqlalchemy.sql.expression import literal_column
 
 FLAGS = flags.FLAGS
@@ -1254,6 +1257,19 @@ def virtual_interface_get_by_address(context, address):
     return vif_ref
 
 
+@require_context
+def virtual_interface_get_by_addresses(context, addresses):
+    """Gets the virtual interfaces for a list of mac addresses.
+
+    :param addresses: = list of mac addresses to look up
+    """
+    if not addresses:
+        return []
+    return _virtual_interface_query(context).\
+                   filter(models.VirtualInterface.address.in_(addresses)).\
+                   all()
+
+
 @require_context
 def virtual_interface_get_by_uuid(context, vif_uuid):
     """Gets a virtual interface from the table.
@@ -1597,12 +1613,14 @@ def instance_get_active_by_window(context, begin, end=None, project_id=None):
 
 @require_admin_context
 def instance_get_active_by_window_joined(context, begin, end=None,
-                                         project_id=None):
+                                         project_id=None, marker=None,
+                                         limit=None, shard=None):
     """Return instances and joins that were active during window."""
     session = get_session()
     query = session.query(models.Instance)
 
-    query = query.options(joinedload('security_groups')).\
+    query = query.options(joinedload('info_cache')).\
+                  options(joinedload('security_groups')).\
                   options(joinedload('instance_type')).\
                   filter(or_(models.Instance.terminated_at == None,
                              models.Instance.terminated_at > begin))
@@ -1610,6 +1628,13 @@ def instance_get_active_by_window_joined(context, begin, end=None,
         query = query.filter(models.Instance.launched_at < end)
     if project_id:
         query = query.filter_by(project_id=project_id)
+    if shard and shard[1] > 1:
+        index, count = shard
+        query = query.filter(models.Instance.id % count == index)
+    if marker is not None:
+        query = query.filter(models.Instance.id > marker)
+    if limit is not None:
+        query = query.order_by(models.Instance.id).limit(limit)
 
     return query.all()
 
@@ -2342,6 +2367,213 @@ def quota_destroy_all_by_project(context, project_id):
 ###################
 
 
+def _sync_instances(context, project_id, session):
+    result = model_query(context,
+                         func.count(models.Instance.id),
+                         func.sum(models.Instance.vcpus),
+                         func.sum(models.Instance.memory_mb),
+                         session=session,
+                         read_deleted="no").\
+                     filter_by(project_id=project_id).\
+                     first()
+    return dict(instances=result[0] or 0,
+                cores=result[1] or 0,
+                ram=result[2] or 0)
+
+
+def _sync_volumes(context, project_id, session):
+    result = model_query(context,
+                         func.count(models.Volume.id),
+                         func.sum(models.Volume.size),
+                         session=session,
+                         read_deleted="no").\
+                     filter_by(project_id=project_id).\
+                     first()
+    return dict(volumes=result[0] or 0,
+                gigabytes=result[1] or 0)
+
+
+def _sync_floating_ips(context, project_id, session):
+    count = model_query(context, models.FloatingIp, session=session,
+                        read_deleted="no").\
+                    filter_by(project_id=project_id).\
+                    filter_by(auto_assigned=False).\
+                    count()
+    return dict(floating_ips=count)
+
+
+# Maps each resource tracked in quota_usages to the function which
+# recounts it from the records it describes.
+QUOTA_SYNC_FUNCTIONS = {
+    'instances': _sync_instances,
+    'cores': _sync_instances,
+    'ram': _sync_instances,
+    'volumes': _sync_volumes,
+    'gigabytes': _sync_volumes,
+    'floating_ips': _sync_floating_ips,
+}
+
+
+@require_context
+def quota_usage_get_all_by_project(context, project_id):
+    authorize_project_context(context, project_id)
+
+    rows = model_query(context, models.QuotaUsage, read_deleted="no").\
+                   filter_by(project_id=project_id).\
+                   all()
+
+    result = {'project_id': project_id}
+    for row in rows:
+        result[row.resource] = dict(in_use=row.in_use, reserved=row.reserved)
+
+    return result
+
+
+def _quota_usage_create(context, project_id, resource, in_use, reserved,
+                        session):
+    usage_ref = models.QuotaUsage()
+    usage_ref.project_id = project_id
+    usage_ref.resource = resource
+    usage_ref.in_use = in_use
+    usage_ref.reserved = reserved
+    usage_ref.save(session=session)
+    return usage_ref
+
+
+# The quota usage operations below use with_lockmode() so that
+# concurrent reservations for a project are serialized.  This only works
+# reliably with engines that support row-level locking.
+
+@require_context
+def quota_reserve(context, project_id, deltas, quotas, expire, max_age):
+    elevated = context.elevated()
+    session = get_session()
+    with session.begin():
+        rows = model_query(elevated, models.QuotaUsage, session=session,
+                           read_deleted="no").\
+                       filter_by(project_id=project_id).\
+                       with_lockmode('update').\
+                       all()
+        usages = dict((row.resource, row) for row in rows)
+
+        # Recount a resource from its records the first time it is
+        # reserved, and again whenever its usage is older than
+        # max_age, so that any drift is corrected.  Releases are
+        # applied after the records are gone, so they never recount
+        # and are dropped for resources which are not tracked yet.
+        syncs = set()
+        for resource, delta in deltas.iteritems():
+            usage = usages.get(resource)
+            if delta <= 0:
+                continue
+            if (usage is None or
+                (max_age and utils.is_older_than(
+                        usage.updated_at or usage.created_at, max_age))):
+                syncs.add(QUOTA_SYNC_FUNCTIONS[resource])
+
+        for sync in syncs:
+            for resource, in_use in sync(elevated, project_id,
+                                         session).iteritems():
+                usage = usages.get(resource)
+                if usage is None:
+                    usages[resource] = _quota_usage_create(elevated,
+                                                           project_id,
+                                                           resource,
+                                                           in_use, 0,
+                                                           session)
+                else:
+                    usage.in_use = in_use
+                    usage.save(session=session)
+
+        overs = [resource for resource, delta in deltas.iteritems()
+                 if delta > 0 and quotas.get(resource) is not None and
+                    usages[resource].total + delta > quotas[resource]]
+        if overs:
+            raise exception.OverQuota(overs)
+
+        reservations = []
+        for resource, delta in deltas.iteritems():
+            usage = usages.get(resource)
+            if usage is None:
+                continue
+            reservation = models.Reservation()
+            reservation.uuid = str(utils.gen_uuid())
+            reservation.usage_id = usage.id
+            reservation.project_id = project_id
+            reservation.resource = resource
+            reservation.delta = delta
+            reservation.expire = expire
+            reservation.save(session=session)
+            reservations.append(reservation.uuid)
+
+            # Only increases are held as reserved; releases are not
+            # applied until they are committed.
+            if delta > 0:
+                usage.reserved += delta
+                usage.save(session=session)
+
+    return reservations
+
+
+def _reservation_finish(context, reservations, commit):
+    if not reservations:
+        return
+
+    session = get_session()
+    with session.begin():
+        # Lock the usage rows before the reservations, in the same
+        # order as quota_reserve, to avoid deadlocks.
+        usage_ids = [row.usage_id for row in
+                     model_query(context, models.Reservation.usage_id,
+                                 session=session, read_deleted="no").\
+                         filter(models.Reservation.uuid.in_(reservations)).\
+                         all()]
+        if not usage_ids:
+            return
+        usages = model_query(context, models.QuotaUsage, session=session,
+                             read_deleted="no").\
+                         filter(models.QuotaUsage.id.in_(set(usage_ids))).\
+                         with_lockmode('update').\
+                         all()
+        usages = dict((usage.id, usage) for usage in usages)
+
+        reservation_refs = model_query(context, models.Reservation,
+                                       session=session, read_deleted="no").\
+                         filter(models.Reservation.uuid.in_(reservations)).\
+                         with_lockmode('update').\
+                         all()
+        for reservation in reservation_refs:
+            usage = usages[reservation.usage_id]
+            if reservation.delta > 0:
+                usage.reserved = max(0, usage.reserved - reservation.delta)
+            if commit:
+                usage.in_use = max(0, usage.in_use + reservation.delta)
+            usage.save(session=session)
+            reservation.delete(session=session)
+
+
+@require_context
+def reservation_commit(context, reservations):
+    _reservation_finish(context.elevated(), reservations, commit=True)
+
+
+@require_context
+def reservation_rollback(context, reservations):
+    _reservation_finish(context.elevated(), reservations, commit=False)
+
+
+@require_admin_context
+def reservation_expire(context):
+    rows = model_query(context, models.Reservation.uuid,
+                       read_deleted="no").\
+                   filter(models.Reservation.expire < utils.utcnow()).\
+                   all()
+    _reservation_finish(context, [row.uuid for row in rows], commit=False)
+
+
+###################
+
+
 @require_admin_context
 def volume_allocate_iscsi_target(context, volume_id, host):
     session = get_session()
@@ -2807,6 +3039,42 @@ def security_group_get_by_instance(context, instance_id):
                    all()
 
 
+@require_context
+def security_group_get_by_instances(context, instance_ids):
+    result = dict((instance_id, []) for instance_id in instance_ids)
+    if not instance_ids:
+        return result
+
+    session = get_session()
+    memberships = model_query(context,
+                              models.SecurityGroupInstanceAssociation,
+                              session=session, read_deleted="no").\
+                  filter(models.SecurityGroupInstanceAssociation.instance_id.\
+                         in_(instance_ids)).\
+                  order_by(models.SecurityGroupInstanceAssociation.\
+                           security_group_id).\
+                  all()
+    if not memberships:
+        return result
+
+    security_group_ids = set(membership.security_group_id
+                             for membership in memberships)
+    security_groups = _security_group_get_query(context, session=session,
+                                                read_deleted="no").\
+                          filter(models.SecurityGroup.id.\
+                                 in_(security_group_ids)).\
+                          options(joinedload_all(
+                                  'rules.grantee_group.instances')).\
+                          all()
+    security_groups = dict((group.id, group) for group in security_groups)
+
+    for membership in memberships:
+        security_group = security_groups.get(membership.security_group_id)
+        if security_group:
+            result[membership.instance_id].append(security_group)
+    return result
+
+
 @require_context
 def security_group_exists(context, project_id, group_name):
     try:
@@ -3735,6 +4003,120 @@ def bw_usage_update(context,
         bwusage.save(session=session)
 
 
+@require_context
+def bw_usage_update_bulk(context, start_period, usages):
+    if not usages:
+        return
+
+    session = get_session()
+    with session.begin():
+        instance_ids = set(usage['instance_id'] for usage in usages)
+        existing = model_query(context, models.BandwidthUsage,
+                               session=session, read_deleted="yes").\
+                       filter(models.BandwidthUsage.instance_id.in_(
+                           instance_ids)).\
+                       filter_by(start_period=start_period).\
+                       all()
+        bwusages = dict(((bwusage.instance_id, bwusage.mac), bwusage)
+                        for bwusage in existing)
+
+        now = utils.utcnow()
+        for usage in usages:
+            key = (usage['instance_id'], usage['mac'])
+            bwusage = bwusages.get(key)
+            if not bwusage:
+                bwusage = models.BandwidthUsage()
+                bwusage.instance_id = usage['instance_id']
+                bwusage.start_period = start_period
+                bwusage.mac = usage['mac']
+                bwusages[key] = bwusage
+                session.add(bwusage)
+
+            bwusage.last_refreshed = now
+            bwusage.bw_in = usage['bw_in']
+            bwusage.bw_out = usage['bw_out']
+
+
+####################
+
+
+def _seconds_between(session, start, stop):
+    """SQL expression for the number of seconds from start to stop."""
+    dialect = session.get_bind().dialect.name
+    if dialect == 'mysql':
+        return func.timestampdiff(literal_column('SECOND'), start, stop)
+    if dialect == 'postgresql':
+        return extract('epoch', stop - start)
+    return (func.julianday(stop) - func.julianday(start)) * 86400.0
+
+
+@require_context
+def tenant_usage_get_by_window(context, begin, end, project_id=None):
+    session = get_session()
+    instance = models.Instance
+    instance_type = models.InstanceTypes
+
+    # Same window as instance_get_active_by_window, and the same
+    # hours as SimpleTenantUsageController._hours_for: from the later
+    # of launch and begin to the earlier of termination and end.
+    start = case([(instance.launched_at > begin, instance.launched_at)],
+                 else_=literal(begin))
+    stop = case([(and_(instance.terminated_at != None,
+                       instance.terminated_at < end),
+                  instance.terminated_at)],
+                else_=literal(end))
+    hours = _seconds_between(session, start, stop) / 3600.0
+    local_gb = instance_type.root_gb + instance_type.ephemeral_gb
+
+    query = session.query(instance.project_id,
+                          func.sum(hours),
+                          func.sum(hours * instance_type.vcpus),
+                          func.sum(hours * instance_type.memory_mb),
+                          func.sum(hours * local_gb)).\
+                    join((instance_type,
+                          instance.instance_type_id == instance_type.id)).\
+                    filter(instance.launched_at != None).\
+                    filter(instance.launched_at < end).\
+                    filter(or_(instance.terminated_at == None,
+                               instance.terminated_at > begin))
+    if project_id:
+        query = query.filter(instance.project_id == project_id)
+    query = query.group_by(instance.project_id)
+
+    return [{'project_id': row[0],
+             'total_hours': row[1] or 0,
+             'total_vcpus_usage': row[2] or 0,
+             'total_memory_mb_usage': row[3] or 0,
+             'total_local_gb_usage': row[4] or 0}
+            for row in query.all()]
+
+
+@require_admin_context
+def tenant_usage_rollup_get_by_window(context, begin, end):
+    return model_query(context, models.TenantUsageRollup,
+                       read_deleted="no").\
+                   filter(models.TenantUsageRollup.period_start >= begin).\
+                   filter(models.TenantUsageRollup.period_start < end).\
+                   all()
+
+
+@require_admin_context
+def tenant_usage_rollup_create(context, period_start, usages):
+    session = get_session()
+    rows = [dict(usage, period_start=period_start) for usage in usages]
+    # Marks the day as rolled up even if nobody used anything
+    rows.append({'period_start': period_start, 'project_id': ''})
+    try:
+        with session.begin():
+            for row in rows:
+                rollup_ref = models.TenantUsageRollup()
+                rollup_ref.update(row)
+                session.add(rollup_ref)
+    except (IntegrityError, exception.DBError):
+        # Another API worker rolled up the same day first
+        LOG.debug(_('Usage of %s already rolled up'), period_start)
+
+
 ####################
 
 
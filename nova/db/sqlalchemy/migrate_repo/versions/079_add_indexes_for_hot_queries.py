@@ -0,0 +1,64 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Index, MetaData, Table
+
+meta = MetaData()
+
+# (table, index name, columns) for the columns the periodic tasks,
+# network allocation and server listing filter on.
+INDEXES = [
+    ('instances', 'instances_host_deleted_idx', ('host', 'deleted')),
+    ('fixed_ips', 'fixed_ips_network_host_instance_reserved_idx',
+     ('network_id', 'host', 'instance_id', 'reserved')),
+    ('fixed_ips', 'fixed_ips_instance_id_idx', ('instance_id',)),
+    ('fixed_ips', 'fixed_ips_address_idx', ('address',)),
+    ('virtual_interfaces', 'virtual_interfaces_instance_id_idx',
+     ('instance_id',)),
+    ('floating_ips', 'floating_ips_address_idx', ('address',)),
+    ('floating_ips', 'floating_ips_fixed_ip_id_idx', ('fixed_ip_id',)),
+    ('security_group_instance_association',
+     'security_group_instance_association_instance_id_idx',
+     ('instance_id',)),
+    ('block_device_mapping', 'block_device_mapping_instance_id_idx',
+     ('instance_id',)),
+    ('bw_usage_cache', 'bw_usage_cache_instance_start_period_mac_idx',
+     ('instance_id', 'start_period', 'mac')),
+    ('services', 'services_host_topic_idx', ('host', 'topic')),
+    ]
+
+
+def _indexes():
+    tables = {}
+    for table_name, index_name, column_names in INDEXES:
+        if table_name not in tables:
+            tables[table_name] = Table(table_name, meta, autoload=True)
+        table = tables[table_name]
+        columns = [getattr(table.c, name) for name in column_names]
+        yield Index(index_name, *columns)
+
+
+def upgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for index in _indexes():
+        index.create(migrate_engine)
+
+
+def downgrade(migrate_engine):
+    meta.bind = migrate_engine
+    for index in _indexes():
+        index.drop(migrate_engine)
@@ -0,0 +1,65 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+from sqlalchemy import Boolean, Column, DateTime, Float, Integer
+from sqlalchemy import MetaData, String, Table, UniqueConstraint
+
+from nova import log as logging
+
+meta = MetaData()
+
+#
+# New Tables
+#
+tenant_usage_rollups = Table('tenant_usage_rollups', meta,
+        Column('created_at', DateTime(timezone=False)),
+        Column('updated_at', DateTime(timezone=False)),
+        Column('deleted_at', DateTime(timezone=False)),
+        Column('deleted', Boolean(create_constraint=True, name=None),
+               default=False),
+        Column('id', Integer(), primary_key=True, nullable=False),
+        Column('period_start', DateTime(timezone=False), nullable=False),
+        Column('project_id',
+               String(length=255, convert_unicode=False, assert_unicode=None,
+                      unicode_error=None, _warn_on_bytestring=False),
+               nullable=False),
+        Column('total_hours', Float(), nullable=False),
+        Column('total_vcpus_usage', Float(), nullable=False),
+        Column('total_memory_mb_usage', Float(), nullable=False),
+        Column('total_local_gb_usage', Float(), nullable=False),
+        UniqueConstraint('period_start', 'project_id',
+                         name='uniq_tenant_usage_rollups0period_project'),
+        mysql_engine='InnoDB',
+        mysql_charset='utf8',
+        )
+
+
+def upgrade(migrate_engine):
+    # Upgrade operations go here. Don't create your own engine;
+    # bind migrate_engine to your metadata
+    meta.bind = migrate_engine
+    try:
+        tenant_usage_rollups.create()
+    except Exception:
+        logging.info(repr(tenant_usage_rollups))
+        raise
+
+
+def downgrade(migrate_engine):
+    # Operations to reverse the above upgrade go here.
+    meta.bind = migrate_engine
+    tenant_usage_rollups.drop()
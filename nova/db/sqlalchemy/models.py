@@ -464,6 +464,43 @@ class Quota(BASE, NovaBase):
     hard_limit = Column(Integer, nullable=True)
 
 
+class QuotaUsage(BASE, NovaBase):
+    """Represents the current usage of a resource by a project.
+
+    in_use counts committed usage, reserved counts usage that has been
+    reserved by a request which has not yet committed or rolled back.
+    """
+
+    __tablename__ = 'quota_usages'
+    id = Column(Integer, primary_key=True)
+
+    project_id = Column(String(255), index=True)
+    resource = Column(String(255))
+
+    in_use = Column(Integer, nullable=False, default=0)
+    reserved = Column(Integer, nullable=False, default=0)
+
+    @property
+    def total(self):
+        return self.in_use + self.reserved
+
+
+class Reservation(BASE, NovaBase):
+    """Represents a pending change to a project's usage of a resource."""
+
+    __tablename__ = 'reservations'
+    id = Column(Integer, primary_key=True)
+    uuid = Column(String(36), nullable=False)
+
+    usage_id = Column(Integer, ForeignKey('quota_usages.id'), nullable=False)
+
+    project_id = Column(String(255), index=True)
+    resource = Column(String(255))
+
+    delta = Column(Integer, nullable=False)
+    expire = Column(DateTime, nullable=False)
+
+
 class Snapshot(BASE, NovaBase):
     """Represents a block storage device that can be attached to a vm."""
     __tablename__ = 'snapshots'
@@ -938,6 +975,22 @@ class BandwidthUsage(BASE, NovaBase):
     bw_out = Column(BigInteger)
 
 
+class TenantUsageRollup(BASE, NovaBase):
+    """Usage of a project over one closed day, as summed by
+    tenant_usage_get_by_window.  Every rolled up day also has a row with
+    an empty project_id, so days without usage aren't scanned again."""
+    __tablename__ = 'tenant_usage_rollups'
+    __table_args__ = (schema.UniqueConstraint("period_start", "project_id"),
+                      {'mysql_engine': 'InnoDB'})
+    id = Column(Integer, primary_key=True, nullable=False)
+    period_start = Column(DateTime, nullable=False)
+    project_id = Column(String(255), nullable=False)
+    total_hours = Column(Float, nullable=False, default=0)
+    total_vcpus_usage = Column(Float, nullable=False, default=0)
+    total_memory_mb_usage = Column(Float, nullable=False, default=0)
+    total_local_gb_usage = Column(Float, nullable=False, default=0)
+
+
 class S3Image(BASE, NovaBase):
     """Compatibility layer for the S3 image service talking to Glance"""
     __tablename__ = 's3_images'
@@ -998,7 +1051,7 @@ def register_models():
               VolumeMetadata, VolumeTypes, VolumeTypeExtraSpecs,
               AgentBuild, InstanceMetadata, InstanceTypeExtraSpecs, Migration,
               VirtualStorageArray, SMFlavors, SMBackendConf, SMVolume,
-              InstanceFault)
+              InstanceFault, QuotaUsage, Reservation)
     engine = create_engine(FLAGS.sql_connection, echo=False)
     for model in models:
         model.metadata.create_all(engine)
@@ -935,6 +935,14 @@ class QuotaError(ApiError):
     pass
 
 
+class OverQuota(QuotaError):
+    """A reservation would take a project over one or more quotas."""
+    def __init__(self, overs=()):
+        self.overs = sorted(overs)
+        message = _("Quota exceeded for resources: %s") % ', '.join(self.overs)
+        super(OverQuota, self).__init__(message, "QuotaExceeded")
+
+
 class AggregateNotFound(NotFound):
     message = _("Aggregate %(aggregate_id)s could not be found.")
 
@@ -262,6 +262,13 @@ global_opts = [
     cfg.IntOpt('osapi_max_limit',
                default=1000,
                help='max number of items returned in a collection response'),
+    cfg.BoolOpt('osapi_refresh_nw_info_in_background',
+                default=False,
+                help='Refresh the empty network info caches of the servers '
+                     'of a detail listing with one cast to the network '
+                     'service, instead of one call per server. Those '
+                     'servers are listed without addresses until their '
+                     'cache is filled'),
     cfg.StrOpt('metadata_host',
                default='$my_ip',
                help='ip of metadata server'),
@@ -398,6 +405,11 @@ global_opts = [
     cfg.StrOpt('root_helper',
                default='sudo',
                help='Command prefix to use for running commands as root'),
+    cfg.BoolOpt('use_rootwrap_daemon',
+                default=False,
+                help='Run commands as root through one long-running '
+                     '"nova-rootwrap --daemon" per service, started with '
+                     'root_helper, which must then run nova-rootwrap'),
     cfg.StrOpt('network_driver',
                default='nova.network.linux_net',
                help='Driver to use for network creation'),
@@ -39,6 +39,8 @@ import stat
 import sys
 import traceback
 
+from eventlet import patcher
+
 import nova
 from nova import flags
 from nova import local
@@ -79,6 +81,15 @@ log_opts = [
     cfg.BoolOpt('publish_errors',
                 default=False,
                 help='publish error events'),
+    cfg.BoolOpt('use_async_logging',
+                default=False,
+                help='write to the log file and syslog from a background '
+                     'thread'),
+    cfg.IntOpt('async_logging_queue_size',
+               default=10000,
+               help='number of records that may wait to be written when '
+                    'use_async_logging is set, after which records are '
+                    'written directly'),
     ]
 
 FLAGS = flags.FLAGS
@@ -128,6 +139,28 @@ def _dictify_context(context):
     return context
 
 
+def _bind_context(record):
+    """Add the fields of the context a record was logged with to it.
+
+    Logging a message only stores the context on the record; it is turned
+    into fields here, once the record is known to be handled.
+
+    """
+    context = record.__dict__.pop('nova_context', None)
+    if context:
+        record.__dict__.update(_dictify_context(context))
+
+
+_VERSION_STRING = None
+
+
+def _get_version_string():
+    global _VERSION_STRING
+    if _VERSION_STRING is None:
+        _VERSION_STRING = version.version_string_with_vcs()
+    return _VERSION_STRING
+
+
 def _get_binary_name():
     return os.path.basename(inspect.stack()[-1][1])
 
@@ -174,7 +207,7 @@ class NovaLogger(logging.Logger):
         if not context:
             context = getattr(local.store, 'context', None)
         if context:
-            extra.update(_dictify_context(context))
+            extra['nova_context'] = context
 
         if 'instance' in params:
             extra.update({'instance': (FLAGS.instance_format
@@ -183,56 +216,56 @@ class NovaLogger(logging.Logger):
         else:
             extra.update({'instance': ''})
 
-        extra.update({"nova_version": version.version_string_with_vcs()})
+        extra.update({"nova_version": _get_version_string()})
 
     #NOTE(ameade): The following calls to _log must be maintained as direct
     #calls. _log introspects the call stack to get information such as the
     #filename and line number the logging method was called from.
 
     def log(self, lvl, msg, *args, **kwargs):
-        self._update_extra(kwargs)
         if self.isEnabledFor(lvl):
+            self._update_extra(kwargs)
             self._log(lvl, msg, args, **kwargs)
 
     def debug(self, msg, *args, **kwargs):
-        self._update_extra(kwargs)
         if self.isEnabledFor(DEBUG):
+            self._update_extra(kwargs)
             self._log(DEBUG, msg, args, **kwargs)
 
     def info(self, msg, *args, **kwargs):
-        self._update_extra(kwargs)
         if self.isEnabledFor(INFO):
+            self._update_extra(kwargs)
             self._log(INFO, msg, args, **kwargs)
 
     def warn(self, msg, *args, **kwargs):
-        self._update_extra(kwargs)
         if self.isEnabledFor(WARN):
+            self._update_extra(kwargs)
             self._log(WARN, msg, args, **kwargs)
 
     def warning(self, msg, *args, **kwargs):
-        self._update_extra(kwargs)
         if self.isEnabledFor(WARNING):
+            self._update_extra(kwargs)
             self._log(WARNING, msg, args, **kwargs)
 
     def error(self, msg, *args, **kwargs):
-        self._update_extra(kwargs)
         if self.isEnabledFor(ERROR):
+            self._update_extra(kwargs)
             self._log(ERROR, msg, args, **kwargs)
 
     def critical(self, msg, *args, **kwargs):
-        self._update_extra(kwargs)
         if self.isEnabledFor(CRITICAL):
+            self._update_extra(kwargs)
             self._log(CRITICAL, msg, args, **kwargs)
 
     def fatal(self, msg, *args, **kwargs):
-        self._update_extra(kwargs)
         if self.isEnabledFor(FATAL):
+            self._update_extra(kwargs)
             self._log(FATAL, msg, args, **kwargs)
 
     def audit(self, msg, *args, **kwargs):
         """Shortcut for our AUDIT level."""
-        self._update_extra(kwargs)
         if self.isEnabledFor(AUDIT):
+            self._update_extra(kwargs)
             self._log(AUDIT, msg, args, **kwargs)
 
     def addHandler(self, handler):
@@ -275,6 +308,7 @@ class NovaFormatter(logging.Formatter):
 
     def format(self, record):
         """Uses contextstring if request_id is set, otherwise default."""
+        _bind_context(record)
         if record.__dict__.get('request_id', None):
             self._fmt = FLAGS.logging_context_format_string
         else:
@@ -321,16 +355,16 @@ class NovaRootLogger(NovaLogger):
         """Setup logger from flags."""
         global _filelog
         if self.syslog:
-            self.removeHandler(self.syslog)
+            self._remove_handler(self.syslog)
             self.syslog = None
         if FLAGS.use_syslog:
-            self.syslog = SysLogHandler(address='/dev/log')
+            self.syslog = _make_async(SysLogHandler(address='/dev/log'))
             self.addHandler(self.syslog)
         logpath = _get_log_file_path()
         if logpath:
             if logpath != self.logpath:
-                self.removeHandler(self.filelog)
-                self.filelog = WatchedFileHandler(logpath)
+                self._remove_handler(self.filelog)
+                self.filelog = _make_async(WatchedFileHandler(logpath))
                 self.addHandler(self.filelog)
                 self.logpath = logpath
 
@@ -339,7 +373,7 @@ class NovaRootLogger(NovaLogger):
                 if st.st_mode != (stat.S_IFREG | mode):
                     os.chmod(self.logpath, mode)
         else:
-            self.removeHandler(self.filelog)
+            self._remove_handler(self.filelog)
         if self.streamlog:
             self.removeHandler(self.streamlog)
             self.streamlog = None
@@ -353,6 +387,11 @@ class NovaRootLogger(NovaLogger):
         else:
             self.setLevel(INFO)
 
+    def _remove_handler(self, handler):
+        self.removeHandler(handler)
+        if isinstance(handler, AsyncHandler):
+            handler.close()
+
 
 class PublishErrorsHandler(logging.Handler):
     def emit(self, record):
@@ -360,6 +399,81 @@ class PublishErrorsHandler(logging.Handler):
             nova.notifier.api.ERROR, dict(error=record.msg))
 
 
+class AsyncHandler(logging.Handler):
+    """Passes records to another handler from a background thread.
+
+    Writing to a file or to syslog blocks every greenthread of the process,
+    so the records are queued and written by a native thread instead.  The
+    message and traceback are rendered before a record is queued, so the
+    record no longer refers to objects which may change afterwards.  When
+    the queue is full records are written directly.
+
+    """
+
+    _STOP = object()
+
+    def __init__(self, handler, maxsize=0):
+        logging.Handler.__init__(self)
+        self.handler = handler
+        self.handler.setFormatter(_formatter)
+        queue = patcher.original('Queue')
+        self._full = queue.Full
+        self._queue = queue.Queue(maxsize)
+        threading = patcher.original('threading')
+        # The wrapped handler is used from the background thread, so
+        # it needs a native lock rather than a green one.
+        self.handler.lock = threading.RLock()
+        self._thread = threading.Thread(target=self._run)
+        self._thread.daemon = True
+        self._thread.start()
+
+    def setFormatter(self, fmt):
+        logging.Handler.setFormatter(self, fmt)
+        self.handler.setFormatter(fmt)
+
+    def _prepare(self, record):
+        _bind_context(record)
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            record.exc_text = _formatter.formatException(record.exc_info,
+                                                         record)
+            record.exc_info = None
+
+    def emit(self, record):
+        try:
+            self._prepare(record)
+            try:
+                self._queue.put_nowait(record)
+            except self._full:
+                self.handler.handle(record)
+        except (KeyboardInterrupt, SystemExit):
+            raise
+        except Exception:
+            self.handleError(record)
+
+    def _run(self):
+        while True:
+            record = self._queue.get()
+            if record is self._STOP:
+                break
+            self.handler.handle(record)
+
+    def close(self):
+        """Write the queued records and stop the background thread."""
+        if self._thread.is_alive():
+            self._queue.put(self._STOP)
+            self._thread.join()
+        self.handler.close()
+        logging.Handler.close(self)
+
+
+def _make_async(handler):
+    if FLAGS.use_async_logging:
+        return AsyncHandler(handler, FLAGS.async_logging_queue_size)
+    return handler
+
+
 def handle_exception(type, value, tb):
     extra = {}
     if FLAGS.verbose:
@@ -105,6 +105,12 @@ class API(base.Base):
                         {'method': 'get_vif_by_mac_address',
                          'args': {'mac_address': mac_address}})
 
+    def get_vifs_by_mac_addresses(self, context, mac_addresses):
+        return rpc.call(context,
+                        FLAGS.network_topic,
+                        {'method': 'get_vifs_by_mac_addresses',
+                         'args': {'mac_addresses': mac_addresses}})
+
     def allocate_floating_ip(self, context, pool=None):
         """Adds a floating ip to a project from a pool. (allocates)"""
         # NOTE(vish): We don't know which network host should get the ip
@@ -197,12 +203,16 @@ class API(base.Base):
                  {'method': 'add_network_to_project',
                   'args': {'project_id': project_id}})
 
-    def get_instance_nw_info(self, context, instance):
-        """Returns all network info related to an instance."""
-        args = {'instance_id': instance['id'],
+    @staticmethod
+    def _get_nw_info_args(instance):
+        return {'instance_id': instance['id'],
                 'instance_uuid': instance['uuid'],
                 'rxtx_factor': instance['instance_type']['rxtx_factor'],
                 'host': instance['host']}
+
+    def get_instance_nw_info(self, context, instance):
+        """Returns all network info related to an instance."""
+        args = self._get_nw_info_args(instance)
         try:
             nw_info = rpc.call(context, FLAGS.network_topic,
                                {'method': 'get_instance_nw_info',
@@ -224,6 +234,18 @@ class API(base.Base):
                 raise exception.InstanceNotFound(instance_id=instance['id'])
             raise
 
+    def refresh_instance_nw_info_caches(self, context, instances):
+        """Rebuilds the network info caches of instances in the background.
+
+        One message is sent for all of the instances, rather than one
+        call to get_instance_nw_info() per instance.
+        """
+        args = {'instances': [self._get_nw_info_args(instance)
+                              for instance in instances]}
+        rpc.cast(context, FLAGS.network_topic,
+                 {'method': 'refresh_instance_nw_info_caches',
+                  'args': args})
+
     def validate_networks(self, context, requested_networks):
         """validate the networks passed at the time of creating
         the server
@@ -176,7 +176,11 @@ class IptablesTable(object):
         else:
             jump_snippet = '-j %s' % (name,)
 
-        self.rules = filter(lambda r: jump_snippet not in r.rule, self.rules)
+        # Match the whole chain name, so that removing inst-1 doesn't
+        # also remove the jumps to inst-10
+        jump_snippet += ' '
+        self.rules = filter(lambda r: jump_snippet not in r.rule + ' ',
+                            self.rules)
 
     def add_rule(self, chain, rule, wrap=True, top=False):
         """Add a rule to the table.
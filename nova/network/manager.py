@@ -297,6 +297,8 @@ class FloatingIP(object):
             floating_address = self.allocate_floating_ip(context, project_id)
             # set auto_assigned column to true for the floating ip
             self.db.floating_ip_set_auto_assigned(context, floating_address)
+            # auto assigned floating ips do not count against the quota
+            quota.apply_usage_delta(context, project_id, floating_ips=-1)
 
             # get the first fixed address belonging to the instance
             for nw, info in nw_info:
@@ -366,17 +368,25 @@ class FloatingIP(object):
     def allocate_floating_ip(self, context, project_id, pool=None):
         """Gets a floating ip from the pool."""
         # NOTE(tr3buchet): all network hosts in zone now use the same pool
-        LOG.debug("QUOTA: %s" % quota.allowed_floating_ips(context, 1))
-        if quota.allowed_floating_ips(context, 1) < 1:
+        try:
+            reservations = quota.reserve(context, project_id=project_id,
+                                         floating_ips=1)
+        except exception.OverQuota:
             LOG.warn(_('Quota exceeded for %s, tried to allocate '
                        'address'),
                      context.project_id)
             raise exception.QuotaError(_('Address quota exceeded. You cannot '
                                      'allocate any more addresses'))
         pool = pool or FLAGS.default_floating_pool
-        return self.db.floating_ip_allocate_address(context,
-                                                    project_id,
-                                                    pool)
+        try:
+            address = self.db.floating_ip_allocate_address(context,
+                                                           project_id,
+                                                           pool)
+        except Exception:
+            with utils.save_and_reraise_exception():
+                quota.rollback(context, reservations)
+        quota.commit(context, reservations)
+        return address
 
     @wrap_check_policy
     def deallocate_floating_ip(self, context, address,
@@ -401,6 +411,9 @@ class FloatingIP(object):
                                        floating_ip['address'])
 
         self.db.floating_ip_deallocate(context, address)
+        if not floating_ip.get('auto_assigned'):
+            quota.apply_usage_delta(context, floating_ip.get('project_id'),
+                                    floating_ips=-1)
 
     @wrap_check_policy
     def associate_floating_ip(self, context, floating_address, fixed_address,
@@ -920,6 +933,24 @@ class NetworkManager(manager.SchedulerDependentManager):
                                           {'network_info': nw_info.as_cache()})
         return nw_info
 
+    @wrap_check_policy
+    def refresh_instance_nw_info_caches(self, context, instances):
+        """Rebuilds the network info caches of many instances.
+
+        :param instances: list of dicts holding the arguments of
+                          get_instance_nw_info() for each instance
+        """
+        for args in instances:
+            try:
+                self.get_instance_nw_info(context, **args)
+            except exception.InstanceNotFound:
+                # The instance was deleted in the meantime
+                pass
+            except Exception:
+                LOG.exception(_("Failed to refresh the network info cache "
+                                "of instance %s"), args['instance_uuid'],
+                              context=context)
+
     def build_network_info_model(self, context, vifs, networks,
                                  rxtx_factor, instance_host):
         """Builds a NetworkInfo object containing all network information
@@ -1480,6 +1511,12 @@ class NetworkManager(manager.SchedulerDependentManager):
         return self.db.virtual_interface_get_by_address(context,
                                                         mac_address)
 
+    def get_vifs_by_mac_addresses(self, context, mac_addresses):
+        """Returns the vifs records for a list of mac_addresses"""
+        vifs = self.db.virtual_interface_get_by_addresses(context,
+                                                          mac_addresses)
+        return [dict(vif.iteritems()) for vif in vifs]
+
 
 class FlatManager(NetworkManager):
     """Basic network where no vlans are used.
@@ -21,6 +21,8 @@ import json
 import socket
 import urllib
 
+from eventlet import pools
+
 from nova import utils
 
 
@@ -67,6 +69,53 @@ class QuantumIOException(Exception):
     pass
 
 
+class ConnectionPool(pools.Pool):
+    """A bounded pool of kept-alive HTTP connections to one server."""
+
+    def __init__(self, connection_type, host, port, max_size=4, **kwargs):
+        self.connection_type = connection_type
+        self.host = host
+        self.port = port
+        self.kwargs = kwargs
+        super(ConnectionPool, self).__init__(max_size=max_size,
+                                             order_as_stack=True)
+
+    def create(self):
+        return self.connection_type(self.host, self.port, **self.kwargs)
+
+    @staticmethod
+    def _request(connection, method, url, body, headers):
+        connection.request(method, url, body, headers)
+        response = connection.getresponse()
+        # The whole response must be read to reuse the connection
+        return response, response.read()
+
+    def request(self, method, url, body=None, headers=None):
+        """Sends a request on a pooled connection.
+
+        Returns the response and its data.  A request failing on a
+        kept-alive connection, which the server may have closed, is sent
+        once more on a new connection.
+        """
+        connection = self.get()
+        try:
+            reused = getattr(connection, 'sock', None) is not None
+            try:
+                return self._request(connection, method, url, body,
+                                     headers or {})
+            except (httplib.HTTPException, socket.error):
+                connection.close()
+                if not reused:
+                    raise
+                return self._request(connection, method, url, body,
+                                     headers or {})
+        except Exception:
+            connection.close()
+            raise
+        finally:
+            self.put(connection)
+
+
 class api_call(object):
     """A Decorator to add support for format and tenant overriding"""
     def __init__(self, func):
@@ -121,6 +170,7 @@ class Client(object):
         self.tenant = tenant
         self.format = format
         self.connection = None
+        self.connection_pool = None
         self.testing_stub = testing_stub
         self.key_file = key_file
         self.cert_file = cert_file
@@ -135,6 +185,21 @@ class Client(object):
         else:
             return httplib.HTTPConnection
 
+    def get_connection_pool(self):
+        """Returns the pool of connections to the server"""
+        if self.connection_pool is None:
+            connection_type = self.get_connection_type()
+
+            # Handle SSL certs
+            certs = {'key_file': self.key_file, 'cert_file': self.cert_file}
+            certs = dict((x, certs[x]) for x in certs if certs[x] is not None)
+            if not self.use_ssl:
+                certs = {}
+
+            self.connection_pool = ConnectionPool(connection_type, self.host,
+                                                  self.port, **certs)
+        return self.connection_pool
+
     def do_request(self, method, action, body=None,
                    headers=None, params=None):
         """Connects to the server and issues a request.
@@ -161,19 +226,9 @@ class Client(object):
             action += '?' + urllib.urlencode(params)
 
         try:
-            connection_type = self.get_connection_type()
             headers = headers or {"Content-Type":
                                       "application/%s" % self.format}
 
-            # Open connection and send request, handling SSL certs
-            certs = {'key_file': self.key_file, 'cert_file': self.cert_file}
-            certs = dict((x, certs[x]) for x in certs if certs[x] is not None)
-
-            if self.use_ssl and len(certs):
-                c = connection_type(self.host, self.port, **certs)
-            else:
-                c = connection_type(self.host, self.port)
-
             if self.logger:
                 self.logger.debug(
                     _("Quantum Client Request:\n%(method)s %(action)s\n" %
@@ -181,10 +236,9 @@ class Client(object):
                 if body:
                     self.logger.debug(body)
 
-            c.request(method, action, body, headers)
-            res = c.getresponse()
+            res, data = self.get_connection_pool().request(method, action,
+                                                           body, headers)
             status_code = self.get_status_code(res)
-            data = res.read()
 
             if self.logger:
                 self.logger.debug("Quantum Client Reply (code = %s) :\n %s" %
@@ -488,6 +488,12 @@ class QuantumManager(manager.FloatingIP, manager.FlatManager):
                            'project_id': net_tenant_id}
                 networks[vif['uuid']] = network
 
+        # Look up the addresses of every interface at once rather
+        # than one request at a time while the model is built.
+        self.ipam.prefetch_ips_by_interfaces(context,
+                [(network['uuid'], vif_uuid, network['project_id'])
+                 for vif_uuid, network in networks.iteritems()])
+
         # update instance network cache and return network_info
         nw_info = self.build_network_info_model(context, vifs, networks,
                                                 rxtx_factor, host)
@@ -21,8 +21,10 @@ import socket
 import time
 import urllib
 
+from nova import exception
 from nova import flags
 from nova import log as logging
+from nova.network.quantum import client as quantum_client
 from nova.openstack.common import cfg
 
 
@@ -36,6 +38,13 @@ melange_opts = [
     cfg.IntOpt('melange_num_retries',
                default=0,
                help='Number retries when contacting melange'),
+    cfg.IntOpt('melange_connection_pool_size',
+               default=4,
+               help='Maximum number of kept-alive connections to melange'),
+    cfg.IntOpt('melange_prefetch_concurrency',
+               default=8,
+               help='Number of concurrent requests made to melange when '
+                    'looking up the addresses of several interfaces'),
     ]
 
 FLAGS = flags.FLAGS
@@ -59,6 +68,7 @@ class MelangeConnection(object):
         self.port = port
         self.use_ssl = use_ssl
         self.version = "v0.1"
+        self.connection_pool = None
 
     def get(self, path, params=None, headers=None):
         return self.do_request("GET", path, params=params, headers=headers,
@@ -70,11 +80,16 @@ class MelangeConnection(object):
     def delete(self, path, headers=None):
         return self.do_request("DELETE", path, headers=headers)
 
-    def _get_connection(self):
-        if self.use_ssl:
-            return httplib.HTTPSConnection(self.host, self.port)
-        else:
-            return httplib.HTTPConnection(self.host, self.port)
+    def _get_connection_pool(self):
+        if self.connection_pool is None:
+            if self.use_ssl:
+                connection_type = httplib.HTTPSConnection
+            else:
+                connection_type = httplib.HTTPConnection
+            self.connection_pool = quantum_client.ConnectionPool(
+                    connection_type, self.host, self.port,
+                    max_size=FLAGS.melange_connection_pool_size)
+        return self.connection_pool
 
     def do_request(self, method, path, body=None, headers=None, params=None,
                    content_type=".json", retries=0):
@@ -85,11 +100,9 @@ class MelangeConnection(object):
         if params:
             url += "?%s" % urllib.urlencode(params)
         for i in xrange(retries + 1):
-            connection = self._get_connection()
             try:
-                connection.request(method, url, body, headers)
-                response = connection.getresponse()
-                response_str = response.read()
+                response, response_str = self._get_connection_pool().request(
+                        method, url, body, headers)
                 if response.status < 400:
                     return response_str
                 raise Exception(_("Server returned error: %s" % response_str))
@@ -15,7 +15,9 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+from eventlet import greenpool
 from netaddr import IPNetwork, IPAddress
+
 from nova import db
 from nova import exception
 from nova import flags
@@ -82,6 +84,7 @@ class QuantumMelangeIPAMLib(object):
     def allocate_fixed_ips(self, context, project_id, quantum_net_id,
                            network_tenant_id, vif_ref):
         """Pass call to allocate fixed IP on to Melange"""
+        self._forget_allocated_ips(context, quantum_net_id, vif_ref['uuid'])
         ips = self.m_conn.allocate_ip(quantum_net_id, network_tenant_id,
                                       vif_ref['uuid'], project_id,
                                       vif_ref['address'])
@@ -166,7 +169,7 @@ class QuantumMelangeIPAMLib(object):
         tenant_ids = [FLAGS.quantum_default_tenant_id, project_id, None]
         for tid in tenant_ids:
             try:
-                ips = self.m_conn.get_allocated_ips(net_id, vif_id, tid)
+                self._get_allocated_ips(context, net_id, vif_id, tid)
             except Exception, e:
                 continue
             ipam_tenant_id = tid
@@ -181,7 +184,7 @@ class QuantumMelangeIPAMLib(object):
            associated with a Quantum Network UUID.
         """
         subnets = []
-        ips = self.m_conn.get_allocated_ips(net_id, vif_id, tenant_id)
+        ips = self._get_allocated_ips(context, net_id, vif_id, tenant_id)
 
         for ip_address in ips:
             block = ip_address['ip_block']
@@ -224,7 +227,7 @@ class QuantumMelangeIPAMLib(object):
            virtual interface.
         """
         tenant_id = project_id or FLAGS.quantum_default_tenant_id
-        ip_list = self.m_conn.get_allocated_ips(net_id, vif_id, tenant_id)
+        ip_list = self._get_allocated_ips(context, net_id, vif_id, tenant_id)
         return [ip['address'] for ip in ip_list
                 if IPNetwork(ip['address']).version == ip_version]
 
@@ -248,8 +251,52 @@ class QuantumMelangeIPAMLib(object):
            virtual interface.
         """
         tenant_id = project_id or FLAGS.quantum_default_tenant_id
+        self._forget_allocated_ips(context, net_id, vif_ref['uuid'])
         self.m_conn.deallocate_ips(net_id, vif_ref['uuid'], tenant_id)
 
+    def _get_allocated_ips(self, context, net_id, vif_id, tenant_id):
+        """Returns the IPs Melange allocated to the virtual interface.
+
+           Answers are remembered on the request context so that the
+           several lookups made while building the network info of an
+           instance only reach Melange once per interface.
+        """
+        cached = getattr(context, '_melange_allocated_ips', None)
+        if cached is None:
+            cached = {}
+            context._melange_allocated_ips = cached
+        key = (net_id, vif_id, tenant_id)
+        if key not in cached:
+            cached[key] = self.m_conn.get_allocated_ips(net_id, vif_id,
+                                                        tenant_id)
+        return cached[key]
+
+    def _forget_allocated_ips(self, context, net_id, vif_id):
+        cached = getattr(context, '_melange_allocated_ips', None)
+        if cached:
+            for key in cached.keys():
+                if key[:2] == (net_id, vif_id):
+                    del cached[key]
+
+    def prefetch_ips_by_interfaces(self, context, interfaces):
+        """Looks up the IPs of several virtual interfaces concurrently.
+
+           `interfaces` is a list of (net_id, vif_id, project_id) tuples.
+           Failed lookups are left for the caller to repeat.
+        """
+        def _fetch(interface):
+            net_id, vif_id, project_id = interface
+            tenant_id = project_id or FLAGS.quantum_default_tenant_id
+            try:
+                self._get_allocated_ips(context, net_id, vif_id, tenant_id)
+            except Exception:
+                LOG.debug(_("Unable to prefetch IPs of interface %s"),
+                          vif_id)
+
+        pool = greenpool.GreenPool(FLAGS.melange_prefetch_concurrency)
+        for _result in pool.imap(_fetch, interfaces):
+            pass
+
     def get_allocated_ips(self, context, subnet_id, project_id):
         ips = self.m_conn.get_allocated_ips_for_network(subnet_id, project_id)
         return [(ip['address'], ip['interface_id']) for ip in ips]
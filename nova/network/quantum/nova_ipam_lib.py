@@ -144,6 +144,10 @@ class QuantumNovaIPAMLib(object):
             db.fixed_ip_update(admin_context, address, values)
         return [address]
 
+    def prefetch_ips_by_interfaces(self, context, interfaces):
+        """Addresses are read from the nova DB, nothing to prefetch."""
+        pass
+
     def get_tenant_id_by_net_id(self, context, net_id, vif_id, project_id):
         """Returns tenant_id for this network.  This is only necessary
            in the melange IPAM case.
@@ -130,3 +130,37 @@ def notify(publisher_id, event_type, priority, payload):
         LOG.exception(_("Problem '%(e)s' attempting to "
                         "send to notification system. Payload=%(payload)s" %
                         locals()))
+
+
+def notify_many(publisher_id, event_type, priority, payloads):
+    """
+    Sends a notification for each of payloads using the specified driver
+
+    Takes the same parameters as notify(), with a list of payloads.  Drivers
+    providing notify_many() get every message at once so they can publish
+    them together; other drivers are called once per message.
+    """
+    if priority not in log_levels:
+        raise BadPriorityException(
+                 _('%s not in valid priorities' % priority))
+    if not payloads:
+        return
+
+    driver = utils.import_object(FLAGS.notification_driver)
+    msgs = [dict(message_id=str(uuid.uuid4()),
+                 publisher_id=publisher_id,
+                 event_type=event_type,
+                 priority=priority,
+                 payload=utils.to_primitive(payload, convert_instances=True),
+                 timestamp=str(utils.utcnow()))
+            for payload in payloads]
+    try:
+        if hasattr(driver, 'notify_many'):
+            driver.notify_many(msgs)
+        else:
+            for msg in msgs:
+                driver.notify(msg)
+    except Exception, e:
+        count = len(msgs)
+        LOG.exception(_("Problem '%(e)s' attempting to send %(count)d "
+                        "notifications to notification system." % locals()))
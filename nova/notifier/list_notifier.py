@@ -65,6 +65,20 @@ def notify(message):
                             "notification driver %(driver)s." % locals()))
 
 
+def notify_many(messages):
+    """Passes several notifications to multiple notifiers in a list."""
+    for driver in _get_drivers():
+        try:
+            if hasattr(driver, 'notify_many'):
+                driver.notify_many(messages)
+            else:
+                for message in messages:
+                    driver.notify(message)
+        except Exception as e:
+            LOG.exception(_("Problem '%(e)s' attempting to send to "
+                            "notification driver %(driver)s." % locals()))
+
+
 def _reset_drivers():
     """Used by unit tests to reset the drivers."""
     global drivers
@@ -37,3 +37,16 @@ def notify(message):
     priority = priority.lower()
     topic = '%s.%s' % (FLAGS.notification_topic, priority)
     rpc.notify(context, topic, message)
+
+
+def notify_many(messages):
+    """Sends several notifications to the RabbitMQ, one publish per topic"""
+    context = nova.context.get_admin_context()
+    by_topic = {}
+    for message in messages:
+        priority = message.get('priority',
+                               FLAGS.default_notification_level)
+        topic = '%s.%s' % (FLAGS.notification_topic, priority.lower())
+        by_topic.setdefault(topic, []).append(message)
+    for topic, topic_messages in by_topic.iteritems():
+        rpc.notify_many(context, topic, topic_messages)
@@ -81,10 +81,48 @@ def enforce(context, action, target):
     """
     init()
 
+    brain = policy.get_brain()
     match_list = ('rule:%s' % action,)
-    credentials = context.to_dict()
+    check, target_keys = brain.compile(match_list)
+
+    # Decisions are remembered on the context for the rest of the
+    # request, keyed by the compiled rule and the parts of the target
+    # it looks at, so that checking an action for many items is
+    # cheap.  Reloading the policy compiles new rules, so decisions
+    # made under the old policy are not reused.
+    decisions = _get_decisions(context)
+    key = _get_decision_key(check, target, target_keys)
+    if key is not None and key in decisions:
+        allowed = decisions[key]
+    else:
+        allowed = check(target, context.to_dict())
+        if key is not None:
+            decisions[key] = allowed
+
+    if not allowed:
+        raise exception.PolicyNotAuthorized(action=action)
+
+
+def _get_decisions(context):
+    """Return the decisions cached on context for its credentials."""
+    credentials_key = (context.user_id, context.project_id,
+                       context.is_admin, tuple(context.roles),
+                       context.read_deleted, context.remote_address,
+                       context.strategy)
+    cached = getattr(context, '_policy_decisions', None)
+    if cached is None or cached[0] != credentials_key:
+        cached = (credentials_key, {})
+        context._policy_decisions = cached
+    return cached[1]
 
+
+def _get_decision_key(check, target, target_keys):
+    """Return a hashable key for a decision, or None if it can't be cached."""
+    if target_keys is None:
+        return None
     try:
-        policy.enforce(match_list, target, credentials)
-    except policy.NotAuthorized:
-        raise exception.PolicyNotAuthorized(action=action)
+        key = (check,) + tuple(target[k] for k in target_keys)
+        hash(key)
+    except (AttributeError, KeyError, TypeError):
+        return None
+    return key
@@ -16,11 +16,26 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
-"""Quotas for instances, volumes, and floating ips."""
+"""Quotas for instances, volumes, and floating ips.
+
+Usage of instances, cores, ram, volumes, gigabytes and floating ips is
+tracked in the quota_usages table.  Requests reserve the usage they are
+about to add with reserve(), then commit() it once the resources exist
+or rollback() it if the request fails.  Releases go through
+apply_usage_delta().  Checking a quota is then a lookup of the project's
+usage row rather than a recount of all of its resources.
+"""
+
+import datetime
 
 from nova import db
 from nova.openstack.common import cfg
 from nova import flags
+from nova import log as logging
+from nova import utils
+
+
+LOG = logging.getLogger('nova.quota')
 
 
 quota_opts = [
@@ -54,6 +69,14 @@ quota_opts = [
     cfg.IntOpt('quota_max_injected_file_path_bytes',
                default=255,
                help='number of bytes allowed per injected file path'),
+    cfg.IntOpt('reservation_expire',
+               default=86400,
+               help='number of seconds until a reservation expires'),
+    cfg.IntOpt('quota_usage_max_age',
+               default=3600,
+               help='number of seconds after which a project\'s tracked '
+                    'usage is recounted from its resources; 0 disables '
+                    'recounting'),
     ]
 
 FLAGS = flags.FLAGS
@@ -95,13 +118,27 @@ def _get_request_allotment(requested, used, quota):
     return quota - used
 
 
+def _get_usage(context, project_id, resources, count):
+    """Return the usage of each resource, including reservations.
+
+    Uses the tracked usage if there is any for all of the resources and
+    falls back to count(context, project_id) otherwise.
+    """
+    usages = db.quota_usage_get_all_by_project(context, project_id)
+    if all(resource in usages for resource in resources):
+        return [usages[resource]['in_use'] + usages[resource]['reserved']
+                for resource in resources]
+    return count(context, project_id)
+
+
 def allowed_instances(context, requested_instances, instance_type):
     """Check quota and return min(requested_instances, allowed_instances)."""
     project_id = context.project_id
     context = context.elevated()
     requested_cores = requested_instances * instance_type['vcpus']
     requested_ram = requested_instances * instance_type['memory_mb']
-    usage = db.instance_data_get_for_project(context, project_id)
+    usage = _get_usage(context, project_id, ('instances', 'cores', 'ram'),
+                       db.instance_data_get_for_project)
     used_instances, used_cores, used_ram = usage
     quota = get_project_quotas(context, project_id)
     allowed_instances = _get_request_allotment(requested_instances,
@@ -126,8 +163,9 @@ def allowed_volumes(context, requested_volumes, size):
     context = context.elevated()
     size = int(size)
     requested_gigabytes = requested_volumes * size
-    used_volumes, used_gigabytes = db.volume_data_get_for_project(context,
-                                                                  project_id)
+    used_volumes, used_gigabytes = _get_usage(context, project_id,
+                                              ('volumes', 'gigabytes'),
+                                              db.volume_data_get_for_project)
     quota = get_project_quotas(context, project_id)
     allowed_volumes = _get_request_allotment(requested_volumes, used_volumes,
                                              quota['volumes'])
@@ -140,11 +178,16 @@ def allowed_volumes(context, requested_volumes, size):
     return min(requested_volumes, allowed_volumes)
 
 
+def _count_floating_ips(context, project_id):
+    return (db.floating_ip_count_by_project(context, project_id),)
+
+
 def allowed_floating_ips(context, requested_floating_ips):
     """Check quota and return min(requested, allowed) floating ips."""
     project_id = context.project_id
     context = context.elevated()
-    used_floating_ips = db.floating_ip_count_by_project(context, project_id)
+    used_floating_ips, = _get_usage(context, project_id, ('floating_ips',),
+                                    _count_floating_ips)
     quota = get_project_quotas(context, project_id)
     allowed_floating_ips = _get_request_allotment(requested_floating_ips,
                                                   used_floating_ips,
@@ -180,3 +223,80 @@ def allowed_injected_file_content_bytes(context, requested_bytes):
 def allowed_injected_file_path_bytes(context):
     """Return the number of bytes allowed in an injected file path."""
     return FLAGS.quota_max_injected_file_path_bytes
+
+
+def _reserve(context, project_id, deltas, quotas):
+    if project_id is None:
+        project_id = context.project_id
+    context = context.elevated()
+    expire = utils.utcnow() + datetime.timedelta(
+            seconds=FLAGS.reservation_expire)
+    if quotas is None:
+        quotas = get_project_quotas(context, project_id)
+    return db.quota_reserve(context, project_id, deltas, quotas, expire,
+                            FLAGS.quota_usage_max_age)
+
+
+def reserve(context, project_id=None, **deltas):
+    """Reserve usage of resources for a project, e.g. instances=1.
+
+    Returns a list of reservations which must be passed to commit() once
+    the resources have been created, or to rollback() if creating them
+    failed.  Raises OverQuota if the usage would exceed a quota.
+    """
+    return _reserve(context, project_id, deltas, None)
+
+
+def commit(context, reservations):
+    """Commit reservations made by reserve()."""
+    db.reservation_commit(context.elevated(), reservations)
+
+
+def rollback(context, reservations):
+    """Release reservations made by reserve()."""
+    db.reservation_rollback(context.elevated(), reservations)
+
+
+def apply_usage_delta(context, project_id=None, **deltas):
+    """Adjust a project's usage without checking quotas.
+
+    Used when resources are deleted or resized after the fact.
+    """
+    commit(context, _reserve(context, project_id, deltas, {}))
+
+
+def release_instance(context, instance):
+    """Release the usage of a deleted instance.
+
+    Failures are only logged, as the instance is already gone and its
+    usage is recounted once it is older than quota_usage_max_age.
+    """
+    try:
+        apply_usage_delta(context, instance['project_id'],
+                          instances=-1,
+                          cores=-(instance['vcpus'] or 0),
+                          ram=-(instance['memory_mb'] or 0))
+    except Exception:
+        LOG.exception(_('Failed to release the quota usage of instance %s'),
+                      instance['uuid'])
+
+
+def resize_instance(context, instance, instance_type):
+    """Move the usage of an instance to a new instance type.
+
+    Failures are only logged, like in release_instance().
+    """
+    try:
+        apply_usage_delta(context, instance['project_id'],
+                          cores=((instance_type['vcpus'] or 0) -
+                                 (instance['vcpus'] or 0)),
+                          ram=((instance_type['memory_mb'] or 0) -
+                               (instance['memory_mb'] or 0)))
+    except Exception:
+        LOG.exception(_('Failed to update the quota usage of instance %s'),
+                      instance['uuid'])
+
+
+def expire_reservations(context):
+    """Roll back any reservations which were never committed."""
+    db.reservation_expire(context.elevated())
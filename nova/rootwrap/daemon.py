@@ -0,0 +1,122 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright (c) 2012 Openstack, LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Long-running mode of nova-rootwrap
+
+   "nova-rootwrap --daemon" reads requests from its stdin and writes the
+   results to its stdout, one JSON document per line.  The filters are
+   loaded once, so each command only costs the fork of the command itself
+   rather than sudo, a Python interpreter and the filter modules.
+
+   A request is {"id": <int>, "cmd": [<arg>, ...], "stdin": <base64>}
+   and its response {"id": <int>, "returncode": <int>,
+   "stdout": <base64>, "stderr": <base64>}.  Requests are run
+   concurrently, so responses may come back in any order.
+"""
+
+import base64
+import json
+import subprocess
+import threading
+
+from nova.rootwrap import wrapper
+
+
+# Same exit codes as bin/nova-rootwrap
+RC_UNAUTHORIZED = 99
+RC_NOCOMMAND = 98
+
+
+def encode_request(request_id, cmd, process_input=None):
+    return json.dumps({'id': request_id,
+                       'cmd': cmd,
+                       'stdin': base64.b64encode(process_input or '')}) + '\n'
+
+
+def decode_request(line):
+    request = json.loads(line)
+    return (request['id'], [str(arg) for arg in request['cmd']],
+            base64.b64decode(request['stdin']))
+
+
+def encode_response(request_id, returncode, stdout, stderr):
+    return json.dumps({'id': request_id,
+                       'returncode': returncode,
+                       'stdout': base64.b64encode(stdout or ''),
+                       'stderr': base64.b64encode(stderr or '')}) + '\n'
+
+
+def decode_response(line):
+    response = json.loads(line)
+    return (response['id'], response['returncode'],
+            base64.b64decode(response['stdout']),
+            base64.b64decode(response['stderr']))
+
+
+def run_command(filters, userargs, process_input=None):
+    """Runs a command if it matches a filter.
+
+    Returns a tuple (returncode, stdout, stderr).
+    """
+    if not userargs:
+        return (RC_NOCOMMAND, "No command specified\n", '')
+
+    filtermatch = wrapper.match_filter(filters, userargs)
+    if not filtermatch:
+        return (RC_UNAUTHORIZED,
+                "Unauthorized command: %s\n" % ' '.join(userargs), '')
+
+    obj = subprocess.Popen(filtermatch.get_command(userargs),
+                           stdin=subprocess.PIPE,
+                           stdout=subprocess.PIPE,
+                           stderr=subprocess.PIPE,
+                           close_fds=True,
+                           env=filtermatch.get_environment(userargs))
+    (stdout, stderr) = obj.communicate(process_input)
+    return (obj.returncode, stdout, stderr)
+
+
+def serve(filters, infile, outfile):
+    """Runs the requests read from infile until it is closed."""
+    write_lock = threading.Lock()
+
+    def _handle(line):
+        try:
+            (request_id, userargs, process_input) = decode_request(line)
+        except (ValueError, KeyError, TypeError):
+            # Without an id nobody is waiting for an answer
+            return
+        try:
+            result = run_command(filters, userargs, process_input)
+        except OSError, e:
+            result = (RC_NOCOMMAND, '', str(e))
+        response = encode_response(request_id, *result)
+        with write_lock:
+            outfile.write(response)
+            outfile.flush()
+
+    threads = []
+    for line in iter(infile.readline, ''):
+        threads = [thread for thread in threads if thread.is_alive()]
+        thread = threading.Thread(target=_handle, args=(line,))
+        thread.daemon = True
+        thread.start()
+        threads.append(thread)
+
+    # Let the commands already started finish before exiting
+    for thread in threads:
+        thread.join()
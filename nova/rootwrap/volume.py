@@ -33,6 +33,20 @@ filterlist = [
     # nova/volume/driver.py: 'dd', 'if=%s' % srcstr, 'of=%s' % deststr,...
     filters.CommandFilter("/bin/dd", "root"),
 
+    # nova/volume/driver.py: 'ionice', FLAGS.volume_clear_ionice, 'dd', ...
+    filters.RegExpFilter("/usr/bin/ionice", "root", "ionice", "-c[0-3]",
+                         "dd", "if=/dev/zero", "of=/dev/mapper/.*",
+                         "count=[0-9]+", "bs=1M"),
+
+    # nova/volume/driver.py: 'blkdiscard', path
+    filters.CommandFilter("/sbin/blkdiscard", "root"),
+
+    # nova/volume/driver.py: 'lvrename', FLAGS.volume_group, ...
+    filters.CommandFilter("/sbin/lvrename", "root"),
+
+    # nova/volume/driver.py: 'lvs', '--noheadings', '-o', 'lv_name', ...
+    filters.CommandFilter("/sbin/lvs", "root"),
+
     # nova/volume/driver.py: 'lvremove', '-f', "%s/%s" % ...
     filters.CommandFilter("/sbin/lvremove", "root"),
 
@@ -148,6 +148,19 @@ def notify(context, topic, msg):
     return _get_impl().notify(context, topic, msg)
 
 
+def notify_many(context, topic, msgs):
+    """Send several notification events in one go.
+
+    :param context: Information that identifies the user that has made this
+                    request.
+    :param topic: The topic to send the notifications to.
+    :param msgs: A list of dicts of content of events.
+
+    :returns: None
+    """
+    return _get_impl().notify_many(context, topic, msgs)
+
+
 def cleanup():
     """Clean up resoruces in use by implementation.
 
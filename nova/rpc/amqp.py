@@ -361,5 +361,15 @@ def notify(context, topic, msg):
         conn.notify_send(topic, msg)
 
 
+def notify_many(context, topic, msgs):
+    """Sends several notification events on a topic over one connection."""
+    LOG.debug(_('Sending %(count)d notifications on %(topic)s...'),
+              {'count': len(msgs), 'topic': topic})
+    with ConnectionContext() as conn:
+        for msg in msgs:
+            pack_context(msg, context)
+            conn.notify_send(topic, msg)
+
+
 def cleanup():
     ConnectionContext.empty_pool()
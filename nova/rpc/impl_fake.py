@@ -161,6 +161,10 @@ def notify(context, topic, msg):
     pass
 
 
+def notify_many(context, topic, msgs):
+    pass
+
+
 def cleanup():
     pass
 
@@ -626,5 +626,10 @@ def notify(context, topic, msg):
     return rpc_amqp.notify(context, topic, msg)
 
 
+def notify_many(context, topic, msgs):
+    """Sends several notification events on a topic."""
+    return rpc_amqp.notify_many(context, topic, msgs)
+
+
 def cleanup():
     return rpc_amqp.cleanup()
@@ -30,6 +30,7 @@ from nova import flags
 from nova import log as logging
 from nova import manager
 from nova.openstack.common import cfg
+from nova import quota
 from nova import rpc
 from nova import utils
 
@@ -62,6 +63,11 @@ class SchedulerManager(manager.Manager):
         """Poll child zones periodically to get status."""
         self.driver.poll_child_zones(context)
 
+    @manager.periodic_task
+    def _expire_reservations(self, context):
+        """Release quota reservations that were never committed."""
+        quota.expire_reservations(context)
+
     def get_host_list(self, context):
         """Get a list of hosts from the HostManager."""
         return self.driver.get_host_list()
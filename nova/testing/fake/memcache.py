@@ -27,6 +27,7 @@ class Client(object):
     def __init__(self, *args, **kwargs):
         """Ignores the passed in args."""
         self.cache = {}
+        self.cas_ids = {}
 
     def get(self, key):
         """Retrieves the value for a key or None."""
@@ -57,3 +58,31 @@ class Client(object):
         new_value = int(value) + delta
         self.cache[key] = (self.cache[key][0], str(new_value))
         return new_value
+
+    def get_multi(self, keys):
+        """Retrieves the values for several keys, skipping missing ones."""
+        values = {}
+        for key in keys:
+            value = self.get(key)
+            if value is not None:
+                values[key] = value
+        return values
+
+    def gets(self, key):
+        """Retrieves the value for a key and remembers it for cas()."""
+        value = self.get(key)
+        if value is not None:
+            self.cas_ids[key] = value
+        return value
+
+    def cas(self, key, value, time=0, min_compress_len=0):
+        """Sets the value for a key if it is unchanged since gets()."""
+        if key not in self.cas_ids:
+            return self.set(key, value, time, min_compress_len)
+        if self.cas_ids.pop(key) != self.get(key):
+            return False
+        return self.set(key, value, time, min_compress_len)
+
+    def reset_cas(self):
+        """Forgets the values remembered by gets()."""
+        self.cas_ids = {}
@@ -148,6 +148,17 @@ class DiskConfigTestCase(test.TestCase):
         for server_dict, expected in zip(server_dicts, expectations):
             self.assertDiskConfig(server_dict, expected)
 
+    def test_detail_servers_refreshing_nw_info_in_background(self):
+        self.flags(osapi_refresh_nw_info_in_background=True)
+        req = fakes.HTTPRequest.blank('/fake/servers/detail')
+        res = req.get_response(self.app)
+        self.assertEqual(res.status_int, 200)
+        server_dicts = utils.loads(res.body)['servers']
+
+        expectations = ['MANUAL', 'AUTO']
+        for server_dict, expected in zip(server_dicts, expectations):
+            self.assertDiskConfig(server_dict, expected)
+
     def test_show_image(self):
         req = fakes.HTTPRequest.blank(
             '/fake/images/a440c04b-79fa-479c-bed1-0b816eaec379')
@@ -89,6 +89,10 @@ class ExtendedStatusTest(test.TestCase):
                                     power_state='power%s' % sid,
                                     task_state='task%s' % sid)
 
+    def test_detail_refreshing_nw_info_in_background(self):
+        self.flags(osapi_refresh_nw_info_in_background=True)
+        self.test_detail()
+
     def test_no_instance_passthrough_404(self):
 
         def fake_compute_get(*args, **kwargs):
@@ -74,6 +74,16 @@ def fake_instance_get_active_by_window(self, context, begin, end, project_id):
                                          for x in xrange(TENANTS * SERVERS)]
 
 
+def fake_get_usage_by_window(self, context, begin, end, project_id=None):
+    return [{'project_id': "faketenant_%s" % x,
+             'total_hours': SERVERS * HOURS,
+             'total_vcpus_usage': SERVERS * VCPUS * HOURS,
+             'total_memory_mb_usage': SERVERS * MEMORY_MB * HOURS,
+             'total_local_gb_usage': SERVERS * (ROOT_GB + EPHEMERAL_GB) *
+                                     HOURS}
+            for x in xrange(TENANTS)]
+
+
 class SimpleTenantUsageTest(test.TestCase):
     def setUp(self):
         super(SimpleTenantUsageTest, self).setUp()
@@ -81,6 +91,8 @@ class SimpleTenantUsageTest(test.TestCase):
                        fake_instance_type_get)
         self.stubs.Set(api.API, "get_active_by_window",
                        fake_instance_get_active_by_window)
+        self.stubs.Set(api.API, "get_usage_by_window",
+                       fake_get_usage_by_window)
         self.admin_context = context.RequestContext('fakeadmin_0',
                                                     'faketenant_0',
                                                     is_admin=True)
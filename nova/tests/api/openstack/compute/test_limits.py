@@ -593,6 +593,74 @@ class LimiterTest(BaseLimitTestSuite):
         self.assertEqual(expected, results)
 
 
+class LimiterPruneTest(BaseLimitTestSuite):
+    """
+    Tests for dropping idle users from the in-memory `limits.Limiter`.
+    """
+
+    def setUp(self):
+        """Run before each test."""
+        BaseLimitTestSuite.setUp(self)
+        userlimits = {'user:user3': ''}
+        self.limiter = limits.Limiter(TEST_LIMITS, **userlimits)
+        self.limiter.PRUNE_INTERVAL = 2
+
+    def test_prune_idle_users(self):
+        self.limiter.check_for_delay("PUT", "/anything", "user1")
+        self.time += 6.0
+        self.limiter.check_for_delay("PUT", "/anything", "user2")
+        self.assertFalse('user1' in self.limiter.levels)
+        self.assertTrue('user2' in self.limiter.levels)
+        self.assertTrue('user3' in self.limiter.levels)
+
+    def test_prune_keeps_busy_users(self):
+        self.limiter.check_for_delay("PUT", "/anything", "user1")
+        self.time += 1.0
+        self.limiter.check_for_delay("PUT", "/anything", "user2")
+        self.assertTrue('user1' in self.limiter.levels)
+
+
+class MemcachedLimiterTest(LimiterTest):
+    """
+    Tests for the shared `limits.MemcachedLimiter` class.
+    """
+
+    def setUp(self):
+        """Run before each test."""
+        BaseLimitTestSuite.setUp(self)
+        userlimits = {'user:user3': ''}
+        self.limiter = limits.MemcachedLimiter(TEST_LIMITS, **userlimits)
+
+    def test_user_limit(self):
+        """
+        Test user-specific limits.
+        """
+        self.assertEqual(self.limiter.user_limits['user3'], [])
+
+    def test_shared_buckets(self):
+        """
+        Ensure limiters using the same memcached share their buckets.
+        """
+        other = limits.MemcachedLimiter(TEST_LIMITS)
+        other._cache = self.limiter._cache
+
+        expected = [None] * 5
+        results = list(self._check(5, "PUT", "/anything"))
+        self.assertEqual(expected, results)
+
+        delays = [other.check_for_delay("PUT", "/anything")[0]
+                  for x in xrange(6)]
+        self.assertEqual([None] * 5 + [6.0], delays)
+
+    def test_get_limits(self):
+        list(self._check(3, "PUT", "/servers", "user1"))
+        limits_ = self.limiter.get_limits("user1")
+        self.assertEqual([limit["remaining"] for limit in limits_],
+                         [1, 7, 3, 7, 2])
+        self.assertEqual([limit["resetTime"] for limit in limits_],
+                         [0] * 5)
+
+
 class WsgiLimiterTest(BaseLimitTestSuite):
     """
     Tests for `limits.WsgiLimiter` class.
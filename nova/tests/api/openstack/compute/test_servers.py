@@ -1266,6 +1266,29 @@ class ServersControllerTest(test.TestCase):
             self.assertEqual(s['status'], 'BUILD')
             self.assertEqual(s['metadata']['seq'], str(i))
 
+    def test_get_all_server_details_refreshes_nw_info_caches(self):
+        self.flags(osapi_refresh_nw_info_in_background=True)
+        refreshed = []
+
+        def fake_refresh(api, context, instances):
+            refreshed.append([instance['uuid'] for instance in instances])
+
+        def fake_get_instance_nw_info(api, context, instance):
+            self.fail('network info fetched per instance')
+
+        self.stubs.Set(nova.network.API, 'refresh_instance_nw_info_caches',
+                       fake_refresh)
+        self.stubs.Set(nova.network.API, 'get_instance_nw_info',
+                       fake_get_instance_nw_info)
+
+        req = fakes.HTTPRequest.blank('/v2/fake/servers/detail')
+        res_dict = self.controller.detail(req)
+
+        uuids = [s['id'] for s in res_dict['servers']]
+        self.assertEqual(refreshed, [uuids])
+        for s in res_dict['servers']:
+            self.assertEqual(s['addresses'], {})
+
     def test_get_all_server_details_with_host(self):
         '''
         We want to make sure that if two instances are on the same host, then
@@ -208,6 +208,9 @@ def stub_out_nw_api(stubs, cls=None, private=None, publics=None):
         def get_floating_ips_by_fixed_address(*args, **kwargs):
             return publics
 
+        def refresh_instance_nw_info_caches(*args, **kwargs):
+            pass
+
     if cls is None:
         cls = Fake
     stubs.Set(nova.network, 'API', cls)
@@ -123,6 +123,14 @@ class JSONDictSerializerTest(test.TestCase):
         result = result.replace('\n', '').replace(' ', '')
         self.assertEqual(result, expected_json)
 
+    def test_json_iter(self):
+        input_dict = dict(servers=[dict(id=i) for i in range(5)],
+                          servers_links=[dict(rel='next')])
+        serializer = wsgi.JSONDictSerializer()
+        chunks = list(serializer.serialize_iter(input_dict, 'servers', 2))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(json.loads(''.join(chunks)), input_dict)
+
 
 class TextDeserializerTest(test.TestCase):
     def test_dispatch_default(self):
@@ -831,3 +839,40 @@ class ResponseObjectTest(test.TestCase):
             self.assertEqual(response.headers['X-header2'], 'header2')
             self.assertEqual(response.status_int, 202)
             self.assertEqual(response.body, mtype)
+
+    def test_serialize_streams_large_collection(self):
+        self.flags(streaming_response_threshold=3,
+                   streaming_response_batch_size=2)
+        obj = dict(servers=[dict(id=i) for i in range(3)])
+        robj = wsgi.ResponseObject(obj, json=wsgi.JSONDictSerializer)
+        request = wsgi.Request.blank('/tests/123')
+        response = robj.serialize(request, 'application/json')
+
+        self.assertEqual(response.content_length, None)
+        self.assertEqual(json.loads(''.join(response.app_iter)), obj)
+
+    def test_serialize_stream_error_aborts(self):
+        class FailingSerializer(wsgi.JSONDictSerializer):
+            def serialize_iter(self, data, key, batch_size=100):
+                yield '{"servers": ['
+                raise ValueError()
+
+        self.flags(streaming_response_threshold=3)
+        obj = dict(servers=[dict(id=i) for i in range(3)])
+        robj = wsgi.ResponseObject(obj, json=FailingSerializer)
+        request = wsgi.Request.blank('/tests/123')
+        response = robj.serialize(request, 'application/json')
+
+        chunks = iter(response.app_iter)
+        self.assertEqual(chunks.next(), '{"servers": [')
+        self.assertRaises(ValueError, chunks.next)
+
+    def test_serialize_small_collection(self):
+        self.flags(streaming_response_threshold=4)
+        obj = dict(servers=[dict(id=i) for i in range(3)])
+        robj = wsgi.ResponseObject(obj, json=wsgi.JSONDictSerializer)
+        request = wsgi.Request.blank('/tests/123')
+        response = robj.serialize(request, 'application/json')
+
+        self.assertEqual(response.content_length, len(response.body))
+        self.assertEqual(json.loads(response.body), obj)
@@ -652,6 +652,52 @@ class TemplateTest(test.TestCase):
                          str(obj['test']['image']['id']))
         self.assertEqual(result[idx].text, obj['test']['image']['name'])
 
+    def test_serialize_reuses_compiled_renderer(self):
+        root = xmlutil.TemplateElement('test', selector='test', name='name')
+        tmpl = xmlutil.MasterTemplate(root, 1)
+        tmpl.serialize({'test': {'name': 'foo'}})
+
+        compiled = xmlutil._RENDERERS[(root,)]
+        result = tmpl.make_tree({'test': {'name': 'bar'}})
+        self.assertEqual(result.get('name'), 'bar')
+        self.assertTrue(xmlutil._RENDERERS[(root,)] is compiled)
+
+    def test_serialize_after_template_change(self):
+        root = xmlutil.TemplateElement('test', selector='test', name='name')
+        tmpl = xmlutil.MasterTemplate(root, 1)
+        obj = {'test': {'name': 'foo', 'id': 42}}
+        result = tmpl.make_tree(obj)
+        self.assertEqual(result.get('id'), None)
+
+        root.set('id')
+        xmlutil.SubTemplateElement(root, 'child', selector='name')
+        result = tmpl.make_tree(obj)
+        self.assertEqual(result.get('id'), '42')
+        self.assertEqual(result[0].tag, 'child')
+
+    def test_serialize_iter(self):
+        root = xmlutil.TemplateElement('servers')
+        elem = xmlutil.SubTemplateElement(root, 'server', selector='servers')
+        elem.set('id')
+        xmlutil.SubTemplateElement(elem, 'name').text = 'name'
+        link = xmlutil.SubTemplateElement(root,
+                '{%s}link' % xmlutil.XMLNS_ATOM, selector='servers_links')
+        link.set('rel')
+        tmpl = xmlutil.MasterTemplate(root, 1, nsmap={
+                None: 'http://example.com/', 'atom': xmlutil.XMLNS_ATOM})
+        obj = dict(servers=[dict(id=i, name='s%d' % i) for i in range(5)],
+                   servers_links=[dict(rel='next')])
+
+        chunks = list(tmpl.serialize_iter(obj, 'servers', 2))
+        self.assertEqual(len(chunks), 5)
+        self.assertEqual(''.join(chunks), tmpl.serialize(obj))
+
+    def test_serialize_iter_unsupported(self):
+        root = xmlutil.TemplateElement('server', selector='server')
+        tmpl = xmlutil.MasterTemplate(root, 1)
+        self.assertEqual(tmpl.serialize_iter(dict(server={}), 'server'),
+                         None)
+
 
 class MasterTemplateBuilder(xmlutil.TemplateBuilder):
     def construct(self):
@@ -61,7 +61,8 @@ def chown(path, owner):
     pass
 
 
-def extract_snapshot(disk_path, source_fmt, snapshot_name, out_path, dest_fmt):
+def extract_snapshot(disk_path, source_fmt, snapshot_name, out_path, dest_fmt,
+                     compress=False):
     files[out_path] = ''
 
 
@@ -15,6 +15,12 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import errno
+import httplib
+import json
+import socket
+import time
+
 from nova import exception
 from nova import log as logging
 from nova.volume.san import SolidFireSanISCSIDriver as SFID
@@ -22,6 +28,9 @@ from nova import test
 
 LOG = logging.getLogger('nova.tests.test_solidfire')
 
+# The tests of the driver replace _issue_api_request for good
+_issue_api_request = SFID.__dict__['_issue_api_request']
+
 
 class SolidFireVolumeTestCase(test.TestCase):
     def setUp(self):
@@ -178,3 +187,111 @@ class SolidFireVolumeTestCase(test.TestCase):
         sfv = SFID()
         self.assertRaises(exception.ApiError,
                           sfv._get_cluster_info)
+
+    def test_cluster_info_and_account_cached(self):
+        calls = []
+
+        def fake_issue_api_request(obj, method, params):
+            calls.append(method)
+            return self.fake_issue_api_request(method, params)
+
+        SFID._issue_api_request = fake_issue_api_request
+        testvol = {'project_id': 'testprjid',
+                   'name': 'testvol',
+                   'size': 1}
+        sfv = SFID()
+        sfv.create_volume(testvol)
+        sfv.create_volume(testvol)
+        sfv.create_export(None, testvol)
+        self.assertEqual(calls.count('GetClusterInfo'), 1)
+        self.assertEqual(calls.count('GetAccountByName'), 1)
+        self.assertEqual(calls.count('CreateVolume'), 2)
+
+    def test_cache_expires(self):
+        sfv = SFID()
+        sfv._cache_set('key', 'value')
+        self.assertEqual(sfv._cache_get('key'), 'value')
+        sfv._cache['key'] = (time.time() - 1, 'value')
+        self.assertEqual(sfv._cache_get('key'), None)
+
+
+class FakeHTTPResponse(object):
+    def __init__(self, status, data):
+        self.status = status
+        self.data = data
+
+    def read(self):
+        return self.data
+
+
+class FakeHTTPSConnection(object):
+    connections = []
+
+    def __init__(self, host, port):
+        self.sock = None
+        self.request_error = None
+        self.response_error = None
+        self.requests = []
+        self.connections.append(self)
+
+    def request(self, method, url, body, headers):
+        error, self.request_error = self.request_error, None
+        if error is not None:
+            raise error
+        self.sock = True
+        self.requests.append(json.loads(body)['method'])
+
+    def getresponse(self):
+        error, self.response_error = self.response_error, None
+        if error is not None:
+            raise error
+        return FakeHTTPResponse(200, '{"result": {}}')
+
+    def close(self):
+        self.sock = None
+
+
+class SolidFireConnectionTestCase(test.TestCase):
+    def setUp(self):
+        super(SolidFireConnectionTestCase, self).setUp()
+        FakeHTTPSConnection.connections = []
+        self.stubs.Set(SFID, '_issue_api_request', _issue_api_request)
+        self.stubs.Set(httplib, 'HTTPSConnection', FakeHTTPSConnection)
+
+    def test_connection_reused(self):
+        sfv = SFID()
+        sfv._issue_api_request('GetClusterInfo', {})
+        sfv._issue_api_request('ListVolumesForAccount', {})
+        self.assertEqual(len(FakeHTTPSConnection.connections), 1)
+        self.assertEqual(FakeHTTPSConnection.connections[0].requests,
+                         ['GetClusterInfo', 'ListVolumesForAccount'])
+
+    def test_closed_connection_retried(self):
+        sfv = SFID()
+        sfv._issue_api_request('GetClusterInfo', {})
+        connection = FakeHTTPSConnection.connections[0]
+        connection.response_error = httplib.BadStatusLine('')
+        data = sfv._issue_api_request('CreateVolume', {})
+        self.assertEqual(data, {'result': {}})
+        self.assertEqual(connection.requests,
+                         ['GetClusterInfo', 'CreateVolume', 'CreateVolume'])
+
+    def test_reset_while_sending_retried(self):
+        sfv = SFID()
+        sfv._issue_api_request('GetClusterInfo', {})
+        connection = FakeHTTPSConnection.connections[0]
+        connection.request_error = socket.error(errno.EPIPE, 'Broken pipe')
+        data = sfv._issue_api_request('CreateVolume', {})
+        self.assertEqual(data, {'result': {}})
+        self.assertEqual(connection.requests,
+                         ['GetClusterInfo', 'CreateVolume'])
+
+    def test_timeout_not_retried(self):
+        sfv = SFID()
+        sfv._issue_api_request('GetClusterInfo', {})
+        connection = FakeHTTPSConnection.connections[0]
+        connection.response_error = socket.timeout('timed out')
+        self.assertRaises(socket.timeout, sfv._issue_api_request,
+                          'CreateVolume', {})
+        self.assertEqual(connection.requests,
+                         ['GetClusterInfo', 'CreateVolume'])
@@ -96,6 +96,7 @@ class _AuthManagerBaseTestCase(test.TestCase):
                 connection_type='fake')
         self.manager = manager.AuthManager(new=True)
         self.manager.mc.cache = {}
+        self.manager._access_cache.clear()
 
     def test_create_and_find_user(self):
         with user_generator(self.manager):
@@ -394,6 +395,108 @@ class _AuthManagerBaseTestCase(test.TestCase):
             self.assertEqual(old_user.secret, user.secret)
             self.assertEqual(old_user.is_admin(), user.is_admin())
 
+    def _count_access_key_lookups(self):
+        lookups = []
+        get_user_from_access_key = self.manager.get_user_from_access_key
+
+        def _get_user_from_access_key(access_key):
+            lookups.append(access_key)
+            return get_user_from_access_key(access_key)
+        self.stubs.Set(self.manager, 'get_user_from_access_key',
+                       _get_user_from_access_key)
+        return lookups
+
+    def _enable_auth_cache(self):
+        # The fake memcache client is still used, as it was picked when
+        # the auth manager was imported.
+        self.flags(memcached_servers=['127.0.0.1:11211'])
+
+    def test_authenticate_is_cached(self):
+        self._enable_auth_cache()
+        lookups = self._count_access_key_lookups()
+        st = {'access': 'access', 'secret': 'secret'}
+        with user_and_project_generator(self.manager, user_state=st):
+            for i in xrange(2):
+                (user, project) = self.manager.authenticate(
+                        'access:testproj', '', {}, check_type=None)
+                self.assertEqual(user.id, 'test1')
+                self.assertEqual(project.id, 'testproj')
+        self.assertEqual(lookups, ['access'])
+
+    def test_authenticate_cache_disabled(self):
+        self._enable_auth_cache()
+        self.flags(auth_cache_ttl=0)
+        lookups = self._count_access_key_lookups()
+        st = {'access': 'access', 'secret': 'secret'}
+        with user_and_project_generator(self.manager, user_state=st):
+            for i in xrange(2):
+                self.manager.authenticate('access:testproj', '', {},
+                                          check_type=None)
+        self.assertEqual(lookups, ['access', 'access'])
+
+    def test_authenticate_not_cached_without_memcached(self):
+        lookups = self._count_access_key_lookups()
+        st = {'access': 'access', 'secret': 'secret'}
+        with user_and_project_generator(self.manager, user_state=st):
+            for i in xrange(2):
+                self.manager.authenticate('access:testproj', '', {},
+                                          check_type=None)
+        self.assertEqual(lookups, ['access', 'access'])
+
+    def test_authenticate_cache_hit_skips_driver(self):
+        self._enable_auth_cache()
+        st = {'access': 'access', 'secret': 'secret'}
+        with user_and_project_generator(self.manager, user_state=st):
+            self.manager.authenticate('access:testproj', '', {},
+                                      check_type=None)
+            calls = []
+            driver = self.manager.driver
+
+            def _driver():
+                calls.append(driver)
+                return driver()
+            self.stubs.Set(self.manager, 'driver', _driver)
+            (user, project) = self.manager.authenticate(
+                    'access:testproj', '', {}, check_type=None)
+            self.assertEqual(calls, [])
+            self.assertEqual(user.secret, 'secret')
+            self.assertEqual(project.id, 'testproj')
+
+    def test_modify_user_invalidates_authenticate_cache(self):
+        self._enable_auth_cache()
+        st = {'access': 'access', 'secret': 'secret'}
+        with user_and_project_generator(self.manager, user_state=st):
+            self.manager.authenticate('access:testproj', '', {},
+                                      check_type=None)
+            self.manager.modify_user('test1', 'access2')
+            self.assertRaises(exception.AccessKeyNotFound,
+                              self.manager.authenticate,
+                              'access:testproj', '', {}, check_type=None)
+
+    def test_remove_from_project_invalidates_authenticate_cache(self):
+        self._enable_auth_cache()
+        with user_generator(self.manager, access='access'):
+            with user_generator(self.manager, name='test2'):
+                with project_generator(self.manager, manager_user='test2'):
+                    self.manager.add_to_project('test1', 'testproj')
+                    self.manager.authenticate('access:testproj', '', {},
+                                              check_type=None)
+                    self.manager.remove_from_project('test1', 'testproj')
+                    self.assertRaises(exception.ProjectMembershipNotFound,
+                                      self.manager.authenticate,
+                                      'access:testproj', '', {},
+                                      check_type=None)
+
+    def test_active_roles_cache_invalidated_by_add_role(self):
+        self._enable_auth_cache()
+        with user_and_project_generator(self.manager):
+            self.assertFalse('sysadmin' in
+                    self.manager.get_active_roles('test1', 'testproj'))
+            self.manager.add_role('test1', 'sysadmin')
+            self.manager.add_role('test1', 'sysadmin', 'testproj')
+            self.assertTrue('sysadmin' in
+                    self.manager.get_active_roles('test1', 'testproj'))
+
 
 class AuthManagerLdapTestCase(_AuthManagerBaseTestCase):
     auth_driver = 'nova.auth.ldapdriver.FakeLdapDriver'
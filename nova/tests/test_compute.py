@@ -24,6 +24,7 @@ import datetime
 import time
 from webob import exc
 
+from eventlet import greenthread
 import mox
 import webob.exc
 
@@ -931,6 +932,82 @@ class ComputeTestCase(BaseTestCase):
 
         self.compute.terminate_instance(self.context, instance['uuid'])
 
+    def test_network_is_deallocated_on_block_device_failure(self):
+        """When block device setup fails the network must be deallocated"""
+        deallocated = []
+
+        def fake_setup_block_device_mapping(*args, **kwargs):
+            raise Exception("Failed to block device mapping")
+
+        def fake_deallocate_network(context, instance):
+            deallocated.append(instance['uuid'])
+
+        self.stubs.Set(self.compute, '_setup_block_device_mapping',
+                       fake_setup_block_device_mapping)
+        self.stubs.Set(self.compute, '_deallocate_network',
+                       fake_deallocate_network)
+        instance_uuid = self._create_instance()
+        self.assertRaises(Exception, self.compute.run_instance,
+                          self.context, instance_uuid)
+        self.assertEqual(deallocated, [instance_uuid])
+        self._assert_state({'vm_state': vm_states.ERROR,
+                            'task_state': task_states.BLOCK_DEVICE_MAPPING})
+
+    def test_run_instance_prefetches_image(self):
+        prefetched = []
+
+        def fake_prefetch_image(context, instance, image_meta):
+            prefetched.append(instance['uuid'])
+
+        self.stubs.Set(self.compute.driver, 'prefetch_image',
+                       fake_prefetch_image)
+        instance_uuid = self._create_instance()
+        self.compute.run_instance(self.context, instance_uuid)
+        self.assertEqual(prefetched, [instance_uuid])
+        payload = test_notifier.NOTIFICATIONS[-1]['payload']
+        self.assertEqual(sorted(payload['boot_timings'].keys()),
+                         ['block_device', 'image_prefetch', 'network',
+                          'spawn'])
+        self.compute.terminate_instance(self.context, instance_uuid)
+
+    def test_run_instance_waits_for_slow_prefetch(self):
+        def fake_prefetch_image(context, instance, image_meta):
+            for _i in xrange(10):
+                greenthread.sleep(0)
+
+        self.stubs.Set(self.compute.driver, 'prefetch_image',
+                       fake_prefetch_image)
+        instance_uuid = self._create_instance()
+        self.compute.run_instance(self.context, instance_uuid)
+        payload = test_notifier.NOTIFICATIONS[-1]['payload']
+        self.assertTrue('image_prefetch' in payload['boot_timings'])
+        self.compute.terminate_instance(self.context, instance_uuid)
+
+    def test_run_instance_prefetch_failure_is_ignored(self):
+        def fake_prefetch_image(context, instance, image_meta):
+            raise exception.ImageNotFound(image_id='fake')
+
+        self.stubs.Set(self.compute.driver, 'prefetch_image',
+                       fake_prefetch_image)
+        instance_uuid = self._create_instance()
+        self.compute.run_instance(self.context, instance_uuid)
+        self._assert_state({'vm_state': vm_states.ACTIVE,
+                            'task_state': None})
+        self.compute.terminate_instance(self.context, instance_uuid)
+
+    def test_run_instance_sequential_boot_phases(self):
+        self.flags(overlap_boot_phases=False)
+        prefetched = []
+        self.stubs.Set(self.compute.driver, 'prefetch_image',
+                       lambda *args: prefetched.append(args))
+        instance_uuid = self._create_instance()
+        self.compute.run_instance(self.context, instance_uuid)
+        self.assertEqual(prefetched, [])
+        payload = test_notifier.NOTIFICATIONS[-1]['payload']
+        self.assertEqual(sorted(payload['boot_timings'].keys()),
+                         ['block_device', 'network', 'spawn'])
+        self.compute.terminate_instance(self.context, instance_uuid)
+
     def test_get_lock(self):
         instance = self._create_fake_instance()
         instance_uuid = instance['uuid']
@@ -1460,6 +1537,37 @@ class ComputeTestCase(BaseTestCase):
         self.assertEqual(len(instances), 1)
         self.assertEqual(power_state.NOSTATE, instances[0]['power_state'])
 
+    def test_poll_bandwidth_usage_is_batched(self):
+        start_time = datetime.datetime(2012, 1, 1)
+        self.flags(bandwith_poll_interval=0)
+        self.compute._last_bw_usage_poll = 0
+
+        def fake_get_all_bw_usage(start_time, stop_time):
+            return [dict(mac_address='fake_mac1', bw_in=1, bw_out=2),
+                    dict(mac_address='fake_mac2', bw_in=3, bw_out=4)]
+
+        def fake_get_vifs(ctxt, macs):
+            self.assertEqual(macs, ['fake_mac1', 'fake_mac2'])
+            return [dict(address='fake_mac2', instance_id=42)]
+
+        updates = []
+
+        def fake_bw_usage_update_bulk(ctxt, start_period, usages):
+            updates.append((start_period, usages))
+
+        self.stubs.Set(self.compute.driver, 'get_all_bw_usage',
+                       fake_get_all_bw_usage)
+        self.stubs.Set(self.compute.network_api, 'get_vifs_by_mac_addresses',
+                       fake_get_vifs)
+        self.stubs.Set(nova.db, 'bw_usage_update_bulk',
+                       fake_bw_usage_update_bulk)
+
+        self.compute._poll_bandwidth_usage(self.context,
+                                           start_time=start_time)
+        self.assertEqual(updates, [(start_time,
+                                    [dict(instance_id=42, mac='fake_mac2',
+                                          bw_in=3, bw_out=4)])])
+
     def test_add_instance_fault(self):
         instance_uuid = str(utils.gen_uuid())
 
@@ -1496,6 +1604,42 @@ class ComputeTestCase(BaseTestCase):
         self.compute.add_instance_fault_from_exc(ctxt, instance_uuid,
                                         exc.HTTPNotFound("Error Details"))
 
+    def test_handle_power_state_event(self):
+        params = {'host': self.compute.host,
+                  'power_state': power_state.RUNNING}
+        instance = self._create_fake_instance(params)
+        params['task_state'] = task_states.REBOOTING
+        busy = self._create_fake_instance(params)
+
+        self.compute.handle_power_state_event(instance['uuid'],
+                                              power_state.SHUTOFF)
+        self.compute.handle_power_state_event(busy['uuid'],
+                                              power_state.SHUTOFF)
+        self.compute.handle_power_state_event(str(utils.gen_uuid()),
+                                              power_state.SHUTOFF)
+
+        instance = db.instance_get_by_uuid(self.context, instance['uuid'])
+        self.assertEqual(instance['power_state'], power_state.SHUTOFF)
+        self.assertEqual(instance['vm_state'], vm_states.SHUTOFF)
+        busy = db.instance_get_by_uuid(self.context, busy['uuid'])
+        self.assertEqual(busy['power_state'], power_state.RUNNING)
+
+    def test_sync_power_states_with_events(self):
+        self.flags(sync_power_state_event_interval=1)
+        self.compute._power_state_events = True
+        self.polls = 0
+
+        def fake_list_instances_detail():
+            self.polls += 1
+            return []
+
+        self.stubs.Set(self.compute.driver, 'list_instances_detail',
+                       fake_list_instances_detail)
+        ctxt = context.get_admin_context()
+        for i in xrange(3):
+            self.compute._sync_power_states(ctxt)
+        self.assertEqual(self.polls, 2)
+
 
 class ComputeAPITestCase(BaseTestCase):
 
@@ -1523,6 +1667,44 @@ class ComputeAPITestCase(BaseTestCase):
         self.assertEqual(instance['task_state'], None)
         return instance, instance_uuid
 
+    def test_get_usage_by_window_uses_rollups(self):
+        now = datetime.datetime(2012, 5, 4, 6, 0, 0)
+        begin = datetime.datetime(2012, 5, 1, 12, 0, 0)
+        self._create_fake_instance({'launched_at': begin})
+        self._create_fake_instance({'launched_at': begin,
+                                    'project_id': 'other'})
+
+        scanned = []
+        real_get = db.tenant_usage_get_by_window
+
+        def fake_get(context, window_begin, window_end, project_id=None):
+            scanned.append((window_begin, window_end))
+            return real_get(context, window_begin, window_end, project_id)
+
+        self.stubs.Set(db, 'tenant_usage_get_by_window', fake_get)
+        expected = self.compute_api.get_usage_by_window(self.context,
+                begin, now, self.project_id)
+        self.assertEqual(scanned, [(begin, now)])
+
+        self.flags(tenant_usage_rollups=True)
+        utils.set_time_override(now)
+        try:
+            for i in xrange(2):
+                scanned = []
+                usages = self.compute_api.get_usage_by_window(self.context,
+                        begin, now, self.project_id)
+                self.assertEqual(len(usages), 1)
+                self.assertAlmostEqual(usages[0]['total_hours'],
+                                       expected[0]['total_hours'], places=3)
+                self.assertAlmostEqual(usages[0]['total_hours'], 66,
+                                       places=3)
+        finally:
+            utils.clear_time_override()
+        # The closed days were rolled up by the first call
+        first_day = datetime.datetime(2012, 5, 2)
+        self.assertEqual(scanned, [(begin, first_day),
+                                   (datetime.datetime(2012, 5, 4), now)])
+
     def test_create_with_too_little_ram(self):
         """Test an instance type with too little memory"""
 
@@ -105,3 +105,64 @@ class UsageInfoTestCase(test.TestCase):
         image_ref_url = "%s/images/1" % utils.generate_glance_url()
         self.assertEquals(payload['image_ref_url'], image_ref_url)
         self.compute.terminate_instance(self.context, instance['uuid'])
+
+    def _audit_window(self, **kwargs):
+        admin_context = context.get_admin_context()
+        begin, end = utils.current_audit_period()
+        pages = []
+        markers = []
+        real_get = db.instance_get_active_by_window_joined
+
+        def fake_get(*args, **kwargs):
+            instances = real_get(*args, **kwargs)
+            pages.append([instance['id'] for instance in instances])
+            return instances
+
+        self.stubs.Set(db, 'instance_get_active_by_window_joined', fake_get)
+        count = compute_utils.notify_usage_exists_in_window(admin_context,
+                begin, end, progress=markers.append, **kwargs)
+        return count, pages, markers
+
+    def test_notify_usage_exists_in_window(self):
+        begin, end = utils.current_audit_period()
+        ids = [self._create_instance({'launched_at': begin})
+               for i in xrange(3)]
+        db.bw_usage_update(context.get_admin_context(), ids[1],
+                           'fa:16:3e:00:00:01', begin, 100, 200)
+        count, pages, markers = self._audit_window(page_size=2)
+        self.assertEqual(count, 3)
+        self.assertEqual(pages, [ids[:2], ids[2:]])
+        self.assertEqual(markers, [ids[1], ids[2]])
+        self.assertEqual(len(test_notifier.NOTIFICATIONS), 3)
+        payloads = [msg['payload'] for msg in test_notifier.NOTIFICATIONS]
+        self.assertEqual([payload['audit_period_ending'] for payload in
+                          payloads], [str(end)] * 3)
+        bandwidth = payloads[1]['bandwidth'].values()
+        self.assertEqual(bandwidth, [dict(bw_in=100, bw_out=200)])
+        self.assertEqual(payloads[0]['bandwidth'], {})
+
+    def test_notify_usage_exists_in_window_resumes(self):
+        begin, end = utils.current_audit_period()
+        ids = [self._create_instance({'launched_at': begin})
+               for i in xrange(3)]
+        count, pages, markers = self._audit_window(marker=ids[0])
+        self.assertEqual(count, 2)
+        self.assertEqual(markers, [ids[2]])
+        self.assertEqual(len(test_notifier.NOTIFICATIONS), 2)
+
+    def test_notify_usage_exists_in_window_sharded(self):
+        begin, end = utils.current_audit_period()
+        ids = [self._create_instance({'launched_at': begin})
+               for i in xrange(4)]
+        seen = []
+        for index in xrange(2):
+            count, pages, markers = self._audit_window(shard=(index, 2))
+            self.assertEqual(count, 2)
+            seen.extend(pages[0])
+        self.assertEqual(sorted(seen), ids)
+
+    def test_update_instance_progress(self):
+        instance = db.instance_get(self.context, self._create_instance())
+        compute_utils.update_instance_progress(self.context, instance, 3, 10)
+        instance = db.instance_get(self.context, instance['id'])
+        self.assertEqual(instance['progress'], 30)
@@ -259,6 +259,126 @@ class DbApiTestCase(test.TestCase):
         expected = {uuids[0]: [], uuids[1]: []}
         self.assertEqual(expected, instance_faults)
 
+    def test_virtual_interface_get_by_addresses(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+        for address in ('56:12:12:12:12:12', '56:12:12:12:12:13',
+                        '56:12:12:12:12:14'):
+            db.virtual_interface_create(ctxt, {'address': address,
+                                               'instance_id': instance['id']})
+        vifs = db.virtual_interface_get_by_addresses(ctxt,
+                ['56:12:12:12:12:12', '56:12:12:12:12:14', 'nonexistent'])
+        self.assertEqual(sorted(vif['address'] for vif in vifs),
+                         ['56:12:12:12:12:12', '56:12:12:12:12:14'])
+        self.assertEqual(db.virtual_interface_get_by_addresses(ctxt, []), [])
+
+    def test_bw_usage_update_bulk(self):
+        ctxt = context.get_admin_context()
+        instance = db.instance_create(ctxt, {})
+        start_period = datetime.datetime(2012, 1, 1)
+        db.bw_usage_update(ctxt, instance['id'], 'fake_mac1',
+                           start_period, 10, 20)
+        db.bw_usage_update_bulk(ctxt, start_period,
+                                [dict(instance_id=instance['id'],
+                                      mac='fake_mac1', bw_in=100, bw_out=200),
+                                 dict(instance_id=instance['id'],
+                                      mac='fake_mac2', bw_in=300, bw_out=400)])
+        usages = db.bw_usage_get_by_instance(ctxt, instance['id'],
+                                             start_period)
+        usages = dict((usage['mac'], (usage['bw_in'], usage['bw_out']))
+                      for usage in usages)
+        self.assertEqual(usages, {'fake_mac1': (100, 200),
+                                  'fake_mac2': (300, 400)})
+
+    def _create_usage_instance(self, project_id, launched_at,
+                               terminated_at=None):
+        instance_type = db.instance_type_get_by_name(self.context, 'm1.small')
+        values = {'project_id': project_id,
+                  'instance_type_id': instance_type['id'],
+                  'launched_at': launched_at,
+                  'terminated_at': terminated_at}
+        db.instance_create(self.context, values)
+        return instance_type
+
+    def test_tenant_usage_get_by_window(self):
+        ctxt = context.get_admin_context()
+        end = datetime.datetime(2012, 5, 2, 0, 0, 0)
+        begin = end - datetime.timedelta(hours=24)
+        hour = datetime.timedelta(hours=1)
+        instance_type = self._create_usage_instance('p1', begin - hour)
+        self._create_usage_instance('p1', begin + 12 * hour,
+                                    begin + 18 * hour)
+        self._create_usage_instance('p2', begin - 2 * hour, begin - hour)
+        self._create_usage_instance('p2', end + hour)
+        self._create_usage_instance('p2', None)
+
+        usages = db.tenant_usage_get_by_window(ctxt, begin, end)
+        self.assertEqual(len(usages), 1)
+        usage = usages[0]
+        self.assertEqual(usage['project_id'], 'p1')
+        self.assertAlmostEqual(usage['total_hours'], 30, places=3)
+        self.assertAlmostEqual(usage['total_vcpus_usage'],
+                               30 * instance_type['vcpus'], places=3)
+        self.assertAlmostEqual(usage['total_memory_mb_usage'],
+                               30 * instance_type['memory_mb'], places=3)
+        local_gb = instance_type['root_gb'] + instance_type['ephemeral_gb']
+        self.assertAlmostEqual(usage['total_local_gb_usage'],
+                               30 * local_gb, places=3)
+        self.assertEqual(db.tenant_usage_get_by_window(ctxt, begin, end,
+                                                       'p2'), [])
+
+    def test_tenant_usage_rollup_create(self):
+        ctxt = context.get_admin_context()
+        day = datetime.datetime(2012, 5, 1, 0, 0, 0)
+        usage = {'project_id': 'p1',
+                 'total_hours': 24,
+                 'total_vcpus_usage': 48,
+                 'total_memory_mb_usage': 1024,
+                 'total_local_gb_usage': 10}
+        db.tenant_usage_rollup_create(ctxt, day, [usage])
+        db.tenant_usage_rollup_create(ctxt, day, [usage])
+        rollups = db.tenant_usage_rollup_get_by_window(ctxt, day,
+                day + datetime.timedelta(days=1))
+        self.assertEqual(sorted(rollup['project_id'] for rollup in rollups),
+                         ['', 'p1'])
+        rollup = [rollup for rollup in rollups if rollup['project_id']][0]
+        self.assertEqual(rollup['total_vcpus_usage'], 48)
+        self.assertEqual(db.tenant_usage_rollup_get_by_window(ctxt,
+                day - datetime.timedelta(days=1), day), [])
+
+    def test_security_group_get_by_instances(self):
+        ctxt = context.get_admin_context()
+        instances = [db.instance_create(ctxt, {}) for i in range(3)]
+        groups = [db.security_group_create(ctxt, {'name': name,
+                                                  'project_id': 'p1'})
+                  for name in ('web', 'db')]
+        db.security_group_rule_create(ctxt,
+                                      {'parent_group_id': groups[1]['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 3306,
+                                       'to_port': 3306,
+                                       'group_id': groups[0]['id']})
+        db.instance_add_security_group(ctxt, instances[0]['uuid'],
+                                       groups[0]['id'])
+        db.instance_add_security_group(ctxt, instances[1]['uuid'],
+                                       groups[0]['id'])
+        db.instance_add_security_group(ctxt, instances[1]['uuid'],
+                                       groups[1]['id'])
+
+        result = db.security_group_get_by_instances(ctxt,
+                [instance['id'] for instance in instances])
+        self.assertEqual([[group['name'] for group in result[instance['id']]]
+                          for instance in instances],
+                         [['web'], ['web', 'db'], []])
+        # Groups are shared between the instances
+        self.assertTrue(result[instances[0]['id']][0] is
+                        result[instances[1]['id']][0])
+        rule = result[instances[1]['id']][1]['rules'][0]
+        self.assertEqual(sorted(instance['id'] for instance in
+                                rule['grantee_group']['instances']),
+                         sorted([instances[0]['id'], instances[1]['id']]))
+        self.assertEqual(db.security_group_get_by_instances(ctxt, []), {})
+
 
 def _get_fake_aggr_values():
     return {'name': 'fake_aggregate',
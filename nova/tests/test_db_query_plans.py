@@ -0,0 +1,140 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Checks that the hot DB API queries are answered from indexes."""
+
+import re
+
+from sqlalchemy import event
+
+from nova import context
+from nova import db
+from nova.db.sqlalchemy import session as db_session
+from nova import exception
+from nova import test
+from nova import utils
+
+
+_FULL_SCAN_RE = re.compile(r'^SCAN (?:TABLE )?(\S+)(.*)$')
+
+
+class QueryPlanRecorder(object):
+    """Records the tables SQLite reads in full while the recorder is active.
+
+    Every SELECT sent to the engine is run through EXPLAIN QUERY PLAN
+    first, and the tables scanned without an index are collected in
+    full_scans.
+    """
+
+    _active = None
+    _engines = set()
+
+    def __init__(self, engine):
+        self.full_scans = set()
+        # Listeners can't be removed, so one is added per engine and
+        # hands the statements to whichever recorder is active.
+        if engine not in QueryPlanRecorder._engines:
+            event.listen(engine, 'before_cursor_execute',
+                         QueryPlanRecorder._explain)
+            QueryPlanRecorder._engines.add(engine)
+
+    def __enter__(self):
+        QueryPlanRecorder._active = self
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        QueryPlanRecorder._active = None
+
+    @classmethod
+    def _explain(cls, conn, cursor, statement, parameters, context,
+                 executemany):
+        recorder = cls._active
+        if (recorder is None or executemany or
+            not statement.lstrip().upper().startswith('SELECT')):
+            return
+        plan = conn.connection.cursor()
+        try:
+            plan.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+            for row in plan.fetchall():
+                match = _FULL_SCAN_RE.match(row[-1])
+                if match and 'USING' not in match.group(2):
+                    recorder.full_scans.add(match.group(1))
+        finally:
+            plan.close()
+
+
+class QueryPlanTestCase(test.TestCase):
+    def setUp(self):
+        super(QueryPlanTestCase, self).setUp()
+        self.context = context.get_admin_context()
+        self.engine = db_session.get_session().get_bind()
+
+    def _assert_indexed(self, table, func, *args):
+        with QueryPlanRecorder(self.engine) as recorder:
+            try:
+                func(self.context, *args)
+            except exception.NotFound:
+                pass
+        self.assertFalse(table in recorder.full_scans,
+                         '%s reads all of %s' % (func.__name__, table))
+
+    def test_recorder_finds_full_scans(self):
+        with QueryPlanRecorder(self.engine) as recorder:
+            db.instance_get_all(self.context)
+        self.assertTrue('instances' in recorder.full_scans)
+
+    def test_instance_get_all_by_host(self):
+        self._assert_indexed('instances', db.instance_get_all_by_host, 'host')
+
+    def test_fixed_ip_get_by_instance(self):
+        self._assert_indexed('fixed_ips', db.fixed_ip_get_by_instance, 1)
+
+    def test_fixed_ip_get_by_network_host(self):
+        self._assert_indexed('fixed_ips', db.fixed_ip_get_by_network_host,
+                             1, 'host')
+
+    def test_fixed_ip_get_by_address(self):
+        self._assert_indexed('fixed_ips', db.fixed_ip_get_by_address,
+                             '10.0.0.2')
+
+    def test_virtual_interface_get_by_instance(self):
+        self._assert_indexed('virtual_interfaces',
+                             db.virtual_interface_get_by_instance, 1)
+
+    def test_floating_ip_get_by_address(self):
+        self._assert_indexed('floating_ips', db.floating_ip_get_by_address,
+                             '192.168.0.2')
+
+    def test_floating_ip_get_by_fixed_ip_id(self):
+        self._assert_indexed('floating_ips',
+                             db.floating_ip_get_by_fixed_ip_id, 1)
+
+    def test_security_group_get_by_instance(self):
+        self._assert_indexed('security_group_instance_association',
+                             db.security_group_get_by_instance, 1)
+
+    def test_block_device_mapping_get_all_by_instance(self):
+        self._assert_indexed('block_device_mapping',
+                             db.block_device_mapping_get_all_by_instance, 1)
+
+    def test_bw_usage_get_by_instance(self):
+        self._assert_indexed('bw_usage_cache', db.bw_usage_get_by_instance,
+                             1, utils.utcnow())
+
+    def test_service_get_by_host_and_topic(self):
+        self._assert_indexed('services', db.service_get_by_host_and_topic,
+                             'host', 'compute')
@@ -160,3 +160,14 @@ class IptablesManagerTestCase(test.TestCase):
             self.assertTrue('-A %s -j runner.py-%s' \
                             % (chain, chain) in new_lines,
                             "Built-in chain %s not wrapped" % (chain,))
+
+    def test_remove_chain_keeps_similar_chains(self):
+        table = self.manager.ipv4['filter']
+        table.add_chain('inst-1')
+        table.add_chain('inst-10')
+        table.add_rule('local', '-d 10.0.0.1 -j $inst-1')
+        table.add_rule('local', '-d 10.0.0.10 -j $inst-10')
+        table.remove_chain('inst-1')
+        rules = [rule.rule for rule in table.rules if rule.chain == 'local']
+        self.assertEqual(len(rules), 1)
+        self.assertTrue(rules[0].endswith('-inst-10'))
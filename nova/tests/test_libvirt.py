@@ -16,10 +16,12 @@
 
 import copy
 import eventlet
+import hashlib
 import mox
 import os
 import re
 import shutil
+import StringIO
 import tempfile
 
 from xml.etree.ElementTree import fromstring as xml_to_tree
@@ -93,6 +95,9 @@ class FakeVirtDomain(object):
     def name(self):
         return "fake-domain %s" % self
 
+    def UUIDString(self):
+        return 'fake-uuid'
+
     def snapshotCreateXML(self, *args):
         return FakeVirDomainSnapshot(self)
 
@@ -103,6 +108,24 @@ class FakeVirtDomain(object):
         return self._fake_dom_xml
 
 
+class FakeLibvirtEvents(object):
+    """The parts of the libvirt module used for lifecycle events."""
+
+    VIR_DOMAIN_EVENT_ID_LIFECYCLE = 0
+    VIR_DOMAIN_EVENT_DEFINED = 0
+    VIR_DOMAIN_EVENT_STARTED = 2
+    VIR_DOMAIN_EVENT_SUSPENDED = 3
+    VIR_DOMAIN_EVENT_RESUMED = 4
+    VIR_DOMAIN_EVENT_STOPPED = 5
+
+    class libvirtError(Exception):
+        pass
+
+    @staticmethod
+    def virEventRegisterDefaultImpl():
+        pass
+
+
 class LibvirtVolumeTestCase(test.TestCase):
 
     def setUp(self):
@@ -445,6 +468,29 @@ class LibvirtConnTestCase(test.TestCase):
         # Only one should be listed, since domain with ID 0 must be skiped
         self.assertEquals(len(instances), 1)
 
+    def test_prefetch_image(self):
+        tmpdir = tempfile.mkdtemp()
+        self.flags(instances_path=tmpdir)
+        os.mkdir(os.path.join(tmpdir, '_base'))
+        open(os.path.join(tmpdir, '_base', 'kernel'), 'w').close()
+        fetched = []
+
+        def fake_fetch_image(context, target, image_id, user_id, project_id):
+            fetched.append((os.path.basename(target), image_id))
+
+        self.stubs.Set(fake_libvirt_utils, 'fetch_image', fake_fetch_image)
+        instance = {'image_ref': 'image', 'kernel_id': 'kernel',
+                    'ramdisk_id': 'ramdisk', 'user_id': self.user_id,
+                    'project_id': self.project_id}
+        conn = connection.LibvirtConnection(False)
+        try:
+            conn.prefetch_image(self.context, instance, {})
+        finally:
+            shutil.rmtree(tmpdir)
+        root_fname = hashlib.sha1('image').hexdigest()
+        self.assertEqual(fetched, [('ramdisk', 'ramdisk'),
+                                   (root_fname, 'image')])
+
     @test.skip_if(missing_libvirt(), "Test requires libvirt")
     def test_snapshot_in_ami_format(self):
         self.flags(image_service='nova.image.fake.FakeImageService')
@@ -1485,14 +1531,95 @@ class IptablesFirewallTestCase(test.TestCase):
 
     def test_do_refresh_security_group_rules(self):
         instance_ref = self._create_instance_ref()
+        network_info = _fake_network_info(self.stubs, 1)
+        self.fw.prepare_instance_filter(instance_ref, network_info)
         self.mox.StubOutWithMock(self.fw,
                                  'add_filters_for_instance',
                                  use_mock_anything=True)
-        self.fw.prepare_instance_filter(instance_ref, mox.IgnoreArg())
-        self.fw.instances[instance_ref['id']] = instance_ref
         self.mox.ReplayAll()
+        # Nothing changed, so the instance's chain isn't rebuilt
         self.fw.do_refresh_security_group_rules("fake")
 
+    def _create_security_group(self, name, port):
+        admin_ctxt = context.get_admin_context()
+        secgroup = db.security_group_create(admin_ctxt,
+                                            {'user_id': 'fake',
+                                             'project_id': 'fake',
+                                             'name': name,
+                                             'description': name})
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': secgroup['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': port,
+                                       'to_port': port,
+                                       'cidr': '10.0.0.0/8'})
+        return secgroup
+
+    def _chain_rules(self, chain_name):
+        return [rule.rule for rule in self.fw.iptables.ipv4['filter'].rules
+                if rule.chain == chain_name]
+
+    def test_security_group_chain_shared(self):
+        admin_ctxt = context.get_admin_context()
+        secgroup = self._create_security_group('web', 80)
+        instances = [self._create_instance_ref() for i in range(2)]
+        network_info = _fake_network_info(self.stubs, 1)
+        for instance_ref in instances:
+            db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                           secgroup['id'])
+            self.fw.prepare_instance_filter(instance_ref, network_info)
+
+        chain_name = 'nova-sg-%s' % secgroup['id']
+        self.assertEqual(self._chain_rules(chain_name),
+                         ['-j ACCEPT -p tcp --dport 80 -s 10.0.0.0/8'])
+        for instance_ref in instances:
+            self.assertTrue('-j $%s' % chain_name in
+                            self.fw.instance_rules(instance_ref,
+                                                   network_info)[0])
+
+        self.stubs.Set(self.fw.nwfilter, 'unfilter_instance',
+                       lambda instance, network_info: None)
+        self.fw.unfilter_instance(instances[0], network_info)
+        self.assertTrue(chain_name in self.fw.iptables.ipv4['filter'].chains)
+        self.fw.unfilter_instance(instances[1], network_info)
+        self.assertFalse(chain_name in
+                         self.fw.iptables.ipv4['filter'].chains)
+
+    def test_refresh_rebuilds_changed_chains(self):
+        admin_ctxt = context.get_admin_context()
+        web = self._create_security_group('web', 80)
+        ssh = self._create_security_group('ssh', 22)
+        instance_ref = self._create_instance_ref()
+        other_ref = self._create_instance_ref()
+        network_info = _fake_network_info(self.stubs, 1)
+        db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                       web['id'])
+        db.instance_add_security_group(admin_ctxt, other_ref['uuid'],
+                                       web['id'])
+        self.fw.prepare_instance_filter(instance_ref, network_info)
+        self.fw.prepare_instance_filter(other_ref, network_info)
+
+        db.security_group_rule_create(admin_ctxt,
+                                      {'parent_group_id': web['id'],
+                                       'protocol': 'tcp',
+                                       'from_port': 443,
+                                       'to_port': 443,
+                                       'cidr': '10.0.0.0/8'})
+        db.instance_add_security_group(admin_ctxt, instance_ref['uuid'],
+                                       ssh['id'])
+
+        self.mox.StubOutWithMock(self.fw,
+                                 'add_filters_for_instance',
+                                 use_mock_anything=True)
+        # Only the instance which joined a group gets a new chain
+        self.fw.add_filters_for_instance(instance_ref)
+        self.mox.ReplayAll()
+        self.fw.do_refresh_security_group_rules(web['id'])
+
+        self.assertEqual(len(self._chain_rules('nova-sg-%s' % web['id'])), 2)
+        self.assertEqual(self._chain_rules('nova-sg-%s' % ssh['id']),
+                         ['-j ACCEPT -p tcp --dport 22 -s 10.0.0.0/8'])
+
     @test.skip_if(missing_libvirt(), "Test requires libvirt")
     def test_unfilter_instance_undefines_nwfilter(self):
         admin_ctxt = context.get_admin_context()
@@ -1774,6 +1901,86 @@ class NWFilterTestCase(test.TestCase):
         db.instance_destroy(admin_ctxt, instance_ref['id'])
 
 
+class LibvirtEventsTestCase(test.TestCase):
+    def setUp(self):
+        super(LibvirtEventsTestCase, self).setUp()
+        self.stubs.Set(connection, 'libvirt', FakeLibvirtEvents)
+        self.conn = connection.LibvirtConnection(False)
+        self.events = []
+        self.registered = []
+
+    def _callback(self, instance_uuid, state):
+        self.events.append((instance_uuid, state))
+
+    def _register(self, *args):
+        self.registered.append(args)
+
+    def test_register_event_listener(self):
+        spawned = []
+        self.stubs.Set(connection.greenthread, 'spawn', spawned.append)
+        fake_conn = type('FakeConn', (object,),
+                         {'domainEventRegisterAny': self._register})()
+        self.conn._connect = lambda uri, read_only: fake_conn
+        self.assertTrue(self.conn.register_event_listener(self._callback))
+        self.assertEqual(spawned, [self.conn._run_event_loop])
+        self.assertEqual(self.registered,
+                         [(None, 0, self.conn._lifecycle_event, None)])
+
+    def test_register_event_listener_disabled(self):
+        self.flags(libvirt_lifecycle_events=False)
+        self.assertFalse(self.conn.register_event_listener(self._callback))
+
+    def test_lifecycle_events(self):
+        self.conn._event_callback = self._callback
+        dom = FakeVirtDomain()
+        for event in (FakeLibvirtEvents.VIR_DOMAIN_EVENT_STOPPED,
+                      FakeLibvirtEvents.VIR_DOMAIN_EVENT_DEFINED,
+                      FakeLibvirtEvents.VIR_DOMAIN_EVENT_RESUMED):
+            self.conn._lifecycle_event(None, dom, event, 0, None)
+        self.assertEqual(self.events, [])
+        self.conn._dispatch_pending_events()
+        self.assertEqual(self.events, [('fake-uuid', power_state.SHUTOFF),
+                                       ('fake-uuid', power_state.RUNNING)])
+        self.conn._dispatch_pending_events()
+        self.assertEqual(len(self.events), 2)
+
+
+class UploadReaderTestCase(test.TestCase):
+    def setUp(self):
+        super(UploadReaderTestCase, self).setUp()
+        self.steps = []
+
+    def _progress(self, step, total_steps):
+        self.steps.append((step, total_steps))
+
+    def test_read_in_chunks(self):
+        reader = connection._UploadReader(StringIO.StringIO('x' * 100),
+                                          self._progress, chunk_size=30)
+        self.assertEqual(len(reader.read()), 30)
+        self.assertEqual(self.steps, [(3, 10)])
+        self.assertEqual(len(reader.read(10)), 10)
+        self.assertEqual(''.join(reader), 'x' * 60)
+        self.assertEqual(reader.read(), '')
+        self.assertEqual(self.steps, [(3, 10), (4, 10), (7, 10), (10, 10)])
+
+    def test_empty_file(self):
+        reader = connection._UploadReader(StringIO.StringIO(''),
+                                          self._progress)
+        self.assertEqual(list(reader), [])
+        self.assertEqual(self.steps, [(10, 10)])
+
+    def test_size(self):
+        reader = connection._UploadReader(StringIO.StringIO('x' * 100),
+                                          self._progress, chunk_size=30)
+        self.assertEqual(len(reader), 100)
+        reader.seek(0, os.SEEK_END)
+        self.assertEqual(reader.tell(), 100)
+        reader.seek(0)
+        self.assertEqual(reader.tell(), 0)
+        self.assertEqual(''.join(reader), 'x' * 100)
+        self.assertFalse(hasattr(reader, 'fileno'))
+
+
 class LibvirtUtilsTestCase(test.TestCase):
     def test_get_iscsi_initiator(self):
         self.mox.StubOutWithMock(utils, 'execute')
@@ -1837,6 +2044,41 @@ disk size: 4.4M''', ''))
         finally:
             os.unlink(dst_path)
 
+    def _check_sparse_copy(self):
+        tmpdir = tempfile.mkdtemp()
+        try:
+            src_path = os.path.join(tmpdir, 'src')
+            dst_path = os.path.join(tmpdir, 'dst')
+            with open(src_path, 'w') as fp:
+                fp.truncate(4 * 1024 * 1024)
+                fp.seek(1024 * 1024)
+                fp.write('canary')
+
+            written = libvirt_utils.copy_image(src_path, dst_path)
+            with open(dst_path, 'r') as fp:
+                data = fp.read()
+            self.assertEquals(len(data), 4 * 1024 * 1024)
+            self.assertEquals(data[1024 * 1024:1024 * 1024 + 6], 'canary')
+            self.assertEquals(data.count('\0'), len(data) - 6)
+            self.assertTrue(os.stat(dst_path).st_blocks * 512 <
+                            1024 * 1024)
+            return written
+        finally:
+            shutil.rmtree(tmpdir)
+
+    def test_copy_image_keeps_holes(self):
+        self.assertTrue(self._check_sparse_copy() <= 64 * 1024)
+
+    def test_copy_image_through_userspace(self):
+        self.stubs.Set(libvirt_utils, '_reflink', lambda src, dest: False)
+        self.stubs.Set(libvirt_utils, '_data_extents', lambda fd, size: None)
+        self.assertEquals(self._check_sparse_copy(), 64 * 1024)
+
+    def test_copy_image_without_kernel_copy(self):
+        self.stubs.Set(libvirt_utils, '_reflink', lambda src, dest: False)
+        self.stubs.Set(libvirt_utils, '_libc', None)
+        self.assertTrue(0 < self._check_sparse_copy() <= 64 * 1024)
+
     def test_mkfs(self):
         self.mox.StubOutWithMock(utils, 'execute')
         utils.execute('mkfs', '-t', 'ext4', '/my/block/dev')
@@ -1896,6 +2138,24 @@ disk size: 4.4M''', ''))
         libvirt_utils.extract_snapshot('/path/to/disk/image', 'qcow2',
                                        'snap1', '/extracted/snap', 'raw')
 
+    def test_extract_snapshot_compressed(self):
+        self.mox.StubOutWithMock(utils, 'execute')
+        utils.execute('qemu-img', 'convert', '-f', 'qcow2', '-O', 'qcow2',
+                      '-s', 'snap1', '-c', '/path/to/disk/image',
+                      '/extracted/snap')
+        utils.execute('qemu-img', 'convert', '-f', 'qcow2', '-O', 'raw',
+                      '-s', 'snap1', '/path/to/disk/image', '/extracted/snap')
+
+        # Start test
+        self.mox.ReplayAll()
+        libvirt_utils.extract_snapshot('/path/to/disk/image', 'qcow2',
+                                       'snap1', '/extracted/snap', 'qcow2',
+                                       compress=True)
+        # Raw images can't be compressed
+        libvirt_utils.extract_snapshot('/path/to/disk/image', 'qcow2',
+                                       'snap1', '/extracted/snap', 'raw',
+                                       compress=True)
+
     def test_load_file(self):
         dst_fd, dst_path = tempfile.mkstemp()
         try:
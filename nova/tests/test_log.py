@@ -126,3 +126,68 @@ class NovaLoggerTestCase(test.TestCase):
     def test_child_log_has_level_of_parent_flag(self):
         l = log.getLogger('nova-test.foo')
         self.assertEqual(log.AUDIT, l.level)
+
+
+class LazyEnrichmentTestCase(test.TestCase):
+    def setUp(self):
+        super(LazyEnrichmentTestCase, self).setUp()
+        self.log = log.getLogger('nova-test-lazy')
+        self.log.setLevel(log.INFO)
+        self.dictified = []
+
+        def fake_dictify_context(context):
+            self.dictified.append(context)
+            return context.to_dict()
+
+        self.stubs.Set(log, '_dictify_context', fake_dictify_context)
+
+    def test_disabled_level_skips_enrichment(self):
+        self.log.debug("foo", context=_fake_context())
+        self.assertEqual(self.dictified, [])
+
+    def test_context_bound_when_formatted(self):
+        ctxt = _fake_context()
+        stream = cStringIO.StringIO()
+        handler = log.StreamHandler(stream)
+        self.log.addHandler(handler)
+        try:
+            self.log.info("foo", context=ctxt)
+        finally:
+            self.log.removeHandler(handler)
+        self.assertEqual(self.dictified, [ctxt])
+        self.assertTrue(ctxt.request_id in stream.getvalue())
+
+
+class AsyncHandlerTestCase(test.TestCase):
+    def setUp(self):
+        super(AsyncHandlerTestCase, self).setUp()
+        self.flags(logging_context_format_string="CTXT "
+                                                 "[%(request_id)s]: "
+                                                 "%(message)s")
+        self.log = log.getLogger('nova-test-async')
+        self.log.setLevel(log.INFO)
+        self.stream = cStringIO.StringIO()
+        self.handler = log.AsyncHandler(log.StreamHandler(self.stream))
+        self.log.addHandler(self.handler)
+
+    def tearDown(self):
+        self.log.removeHandler(self.handler)
+        self.handler.close()
+        super(AsyncHandlerTestCase, self).tearDown()
+
+    def test_writes_records_in_order(self):
+        ctxt = _fake_context()
+        self.log.info("foo %s", 1, context=ctxt)
+        self.log.info("bar", context=ctxt)
+        self.handler.close()
+        expected = ("CTXT [%(id)s]: foo 1\nCTXT [%(id)s]: bar\n" %
+                    {'id': ctxt.request_id})
+        self.assertEqual(expected, self.stream.getvalue())
+
+    def test_renders_exceptions_before_queueing(self):
+        try:
+            raise ValueError('baz')
+        except ValueError:
+            self.log.exception("failed")
+        self.handler.close()
+        self.assertTrue('ValueError: baz' in self.stream.getvalue())
@@ -23,6 +23,7 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 import nova.policy
+from nova import quota
 from nova import rpc
 from nova import test
 from nova import utils
@@ -539,32 +540,41 @@ class VlanNetworkTestCase(test.TestCase):
     def test_allocate_floating_ip(self):
         ctxt = context.RequestContext('testuser', 'testproject',
                                       is_admin=False)
+        committed = []
 
         def fake1(*args, **kwargs):
             return {'address': '10.0.0.1'}
 
         def fake2(*args, **kwargs):
-            return 25
+            raise exception.OverQuota(['floating_ips'])
 
-        def fake3(*args, **kwargs):
-            return 0
+        def fake3(context, project_id=None, **deltas):
+            self.assertEqual(project_id, ctxt.project_id)
+            self.assertEqual(deltas, {'floating_ips': 1})
+            return ['fake-reservation']
+
+        def fake_commit(context, reservations):
+            committed.extend(reservations)
 
         self.stubs.Set(self.network.db, 'floating_ip_allocate_address', fake1)
+        self.stubs.Set(quota, 'commit', fake_commit)
 
         # this time should raise
-        self.stubs.Set(self.network.db, 'floating_ip_count_by_project', fake2)
+        self.stubs.Set(quota, 'reserve', fake2)
         self.assertRaises(exception.QuotaError,
                           self.network.allocate_floating_ip,
                           ctxt,
                           ctxt.project_id)
 
         # this time should not
-        self.stubs.Set(self.network.db, 'floating_ip_count_by_project', fake3)
+        self.stubs.Set(quota, 'reserve', fake3)
         self.network.allocate_floating_ip(ctxt, ctxt.project_id)
+        self.assertEqual(committed, ['fake-reservation'])
 
     def test_deallocate_floating_ip(self):
         ctxt = context.RequestContext('testuser', 'testproject',
                                       is_admin=False)
+        released = []
 
         def fake1(*args, **kwargs):
             pass
@@ -573,10 +583,15 @@ class VlanNetworkTestCase(test.TestCase):
             return {'address': '10.0.0.1', 'fixed_ip_id': 1}
 
         def fake3(*args, **kwargs):
-            return {'address': '10.0.0.1', 'fixed_ip_id': None}
+            return {'address': '10.0.0.1', 'fixed_ip_id': None,
+                    'project_id': ctxt.project_id}
+
+        def fake_apply_usage_delta(context, project_id=None, **deltas):
+            released.append((project_id, deltas))
 
         self.stubs.Set(self.network.db, 'floating_ip_deallocate', fake1)
         self.stubs.Set(self.network, '_floating_ip_owned_by_project', fake1)
+        self.stubs.Set(quota, 'apply_usage_delta', fake_apply_usage_delta)
 
         # this time should raise because floating ip is associated to fixed_ip
         self.stubs.Set(self.network.db, 'floating_ip_get_by_address', fake2)
@@ -584,10 +599,12 @@ class VlanNetworkTestCase(test.TestCase):
                           self.network.deallocate_floating_ip,
                           ctxt,
                           mox.IgnoreArg())
+        self.assertEqual(released, [])
 
         # this time should not raise
         self.stubs.Set(self.network.db, 'floating_ip_get_by_address', fake3)
         self.network.deallocate_floating_ip(ctxt, ctxt.project_id)
+        self.assertEqual(released, [(ctxt.project_id, {'floating_ips': -1})])
 
     def test_associate_floating_ip(self):
         ctxt = context.RequestContext('testuser', 'testproject',
@@ -853,6 +870,27 @@ class CommonNetworkTestCase(test.TestCase):
 
         self.assertEquals(manager.deallocate_called, '10.0.0.1')
 
+    def test_refresh_instance_nw_info_caches(self):
+        manager = fake_network.FakeNetworkManager()
+        refreshed = []
+
+        def fake_get_instance_nw_info(context, instance_id, instance_uuid,
+                                      rxtx_factor, host):
+            if instance_id == 2:
+                raise exception.InstanceNotFound(instance_id=instance_id)
+            if instance_id == 3:
+                raise exception.NovaException()
+            refreshed.append(instance_uuid)
+
+        self.stubs.Set(manager, 'get_instance_nw_info',
+                       fake_get_instance_nw_info)
+        instances = [dict(instance_id=i, instance_uuid='uuid%d' % i,
+                          rxtx_factor=1.0, host='fake')
+                     for i in range(1, 5)]
+        manager.refresh_instance_nw_info_caches(self.context, instances)
+
+        self.assertEqual(refreshed, ['uuid1', 'uuid4'])
+
     def test_remove_fixed_ip_from_instance_bad_input(self):
         manager = fake_network.FakeNetworkManager()
         self.assertRaises(exception.FixedIpNotFoundForSpecificInstance,
@@ -137,3 +137,32 @@ class NotifierTestCase(test.TestCase):
 
         self.assertEqual(3, example_api(1, 2))
         self.assertEqual(self.notify_called, True)
+
+    def test_send_notifications_in_batch(self):
+        self.stubs.Set(nova.flags.FLAGS, 'notification_driver',
+                'nova.notifier.rabbit_notifier')
+        self.batches = []
+
+        def mock_notify_many(context, topic, msgs):
+            self.batches.append((topic, msgs))
+
+        self.stubs.Set(nova.rpc, 'notify_many', mock_notify_many)
+        nova.notifier.api.notify_many('publisher_id', 'event_type',
+                nova.notifier.api.WARN, [dict(a=3), dict(a=4)])
+        self.assertEqual(len(self.batches), 1)
+        topic, msgs = self.batches[0]
+        self.assertEqual(topic, 'notifications.warn')
+        self.assertEqual([msg['payload'] for msg in msgs],
+                         [dict(a=3), dict(a=4)])
+
+    def test_send_notifications_without_batch_support(self):
+        self.payloads = []
+
+        def mock_notify(message):
+            self.payloads.append(message['payload'])
+
+        self.stubs.Set(nova.notifier.no_op_notifier, 'notify',
+                mock_notify)
+        nova.notifier.api.notify_many('publisher_id', 'event_type',
+                nova.notifier.api.WARN, [dict(a=3), dict(a=4)])
+        self.assertEqual(self.payloads, [dict(a=3), dict(a=4)])
@@ -15,8 +15,10 @@
 #    under the License.
 
 import os
+import StringIO
 import subprocess
 
+from nova.rootwrap import daemon
 from nova.rootwrap import filters
 from nova.rootwrap import wrapper
 from nova import test
@@ -117,3 +119,23 @@ class RootwrapTestCase(test.TestCase):
         usercmd = ["cat", "/"]
         filtermatch = wrapper.match_filter(self.filters, usercmd)
         self.assertTrue(filtermatch is self.filters[-1])
+
+    def test_daemon_run_command(self):
+        result = daemon.run_command(self.filters, ['cat'], 'foo')
+        self.assertEqual(result, (0, 'foo', ''))
+
+    def test_daemon_run_command_unauthorized(self):
+        result = daemon.run_command(self.filters, ['foo_bar_not_exist'])
+        self.assertEqual(result[0], daemon.RC_UNAUTHORIZED)
+
+    def test_daemon_serve(self):
+        infile = StringIO.StringIO(
+                daemon.encode_request(1, ['cat'], 'foo') +
+                daemon.encode_request(2, ['ls', 'root']))
+        outfile = StringIO.StringIO()
+        daemon.serve(self.filters, infile, outfile)
+        responses = sorted(daemon.decode_response(line)
+                           for line in outfile.getvalue().splitlines())
+        self.assertEqual(len(responses), 2)
+        self.assertEqual(responses[0], (1, 0, 'foo', ''))
+        self.assertEqual(responses[1][:2], (2, daemon.RC_UNAUTHORIZED))
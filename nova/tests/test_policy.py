@@ -147,6 +147,79 @@ class PolicyTestCase(test.TestCase):
         policy.enforce(admin_context, lowercase_action, self.target)
         policy.enforce(admin_context, uppercase_action, self.target)
 
+    def test_enforce_caches_decisions(self):
+        calls = []
+        orig_check_generic = common_policy.HttpBrain._check_generic
+
+        def fake_check_generic(brain, match, target_dict, cred_dict):
+            calls.append(match)
+            return orig_check_generic(brain, match, target_dict, cred_dict)
+
+        self.stubs.Set(common_policy.HttpBrain, '_check_generic',
+                       fake_check_generic)
+        action = "example:my_file"
+        for i in xrange(3):
+            policy.enforce(self.context, action,
+                           {'project_id': 'fake', 'id': i})
+        self.assertEqual(len(calls), 1)
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, {'project_id': 'another'})
+        self.assertEqual(len(calls), 2)
+
+    def test_enforce_cache_follows_roles(self):
+        action = "example:lowercase_admin"
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, self.target)
+        policy.enforce(self.context.elevated(), action, self.target)
+
+    def test_enforce_does_not_cache_http(self):
+        responses = ["True", "False"]
+
+        def fakeurlopen(url, post_data):
+            return StringIO.StringIO(responses.pop(0))
+        self.stubs.Set(urllib2, 'urlopen', fakeurlopen)
+        action = "example:get_http"
+        policy.enforce(self.context, action, self.target)
+        self.assertRaises(exception.PolicyNotAuthorized, policy.enforce,
+                          self.context, action, self.target)
+
+
+class BrainTestCase(test.TestCase):
+    def setUp(self):
+        super(BrainTestCase, self).setUp()
+        rules = {
+            "default": [["role:admin"]],
+            "owner": [["project_id:%(project_id)s"]],
+            "owner_or_admin": [["rule:owner"], ["rule:default"]],
+            "user": [["rule:owner", "user_id:%(user_id)s"]],
+            "remote": [["http:http://www.example.com/%(id)s"]],
+        }
+        self.brain = common_policy.HttpBrain(rules, 'default')
+
+    def test_compile_target_keys(self):
+        self.assertEqual(self.brain.compile(('rule:default',))[1], ())
+        self.assertEqual(self.brain.compile(('rule:owner_or_admin',))[1],
+                         ('project_id',))
+        self.assertEqual(self.brain.compile(('rule:user',))[1],
+                         ('project_id', 'user_id'))
+        self.assertEqual(self.brain.compile(('rule:remote',))[1], None)
+
+    def test_compile_is_cached(self):
+        self.assertTrue(self.brain.compile(('rule:owner',)) is
+                        self.brain.compile(('rule:owner',)))
+
+    def test_compile_missing_rule_uses_default(self):
+        check, keys = self.brain.compile(('rule:missing',))
+        self.assertTrue(check({}, {'roles': ['admin']}))
+        self.assertFalse(check({}, {'roles': ['member']}))
+
+    def test_add_rule_recompiles(self):
+        check, keys = self.brain.compile(('rule:owner',))
+        self.brain.add_rule('owner', [])
+        new_check, keys = self.brain.compile(('rule:owner',))
+        self.assertFalse(check({'project_id': 'a'}, {'project_id': 'b'}))
+        self.assertTrue(new_check({'project_id': 'a'}, {'project_id': 'b'}))
+
 
 class DefaultPolicyTestCase(test.TestCase):
 
@@ -15,14 +15,18 @@
 # License for the specific language governing permissions and limitations
 # under the License.
 
+import socket
+
 from nova import context
 from nova import db
 from nova.db.sqlalchemy import models
 from nova.db.sqlalchemy.session import get_session
 from nova import exception
 from nova import log as logging
+from nova.network.quantum import client as quantum_client
 from nova.network.quantum import manager as quantum_manager
 from nova.network.quantum import melange_connection
+from nova.network.quantum import melange_ipam_lib
 from nova import test
 from nova import utils
 from nova.network import manager
@@ -506,3 +510,107 @@ class QuantumNovaPortSecurityTestCase(QuantumNovaTestCase):
                         project_id=project_id,
                         requested_networks=requested_networks)
         self.assertEqual(nw_info[0]['address'], fake_mac)
+
+
+class FakeHTTPResponse(object):
+    status = 200
+
+    def read(self):
+        return '{}'
+
+
+class FakeHTTPConnection(object):
+    connections = []
+
+    def __init__(self, host, port):
+        self.sock = None
+        self.fail = False
+        self.requests = []
+        FakeHTTPConnection.connections.append(self)
+
+    def request(self, method, url, body, headers):
+        if self.fail:
+            self.fail = False
+            raise socket.error()
+        self.requests.append((method, url))
+        self.sock = 'connected'
+
+    def getresponse(self):
+        return FakeHTTPResponse()
+
+    def close(self):
+        self.sock = None
+
+
+class QuantumConnectionPoolTestCase(test.TestCase):
+    def setUp(self):
+        super(QuantumConnectionPoolTestCase, self).setUp()
+        FakeHTTPConnection.connections = []
+        self.pool = quantum_client.ConnectionPool(FakeHTTPConnection,
+                                                  'localhost', 9696)
+
+    def test_connection_reused(self):
+        self.pool.request('GET', '/a')
+        response, data = self.pool.request('GET', '/b')
+        self.assertEqual(data, '{}')
+        self.assertEqual(len(FakeHTTPConnection.connections), 1)
+        self.assertEqual(FakeHTTPConnection.connections[0].requests,
+                         [('GET', '/a'), ('GET', '/b')])
+
+    def test_closed_connection_retried(self):
+        self.pool.request('GET', '/a')
+        connection = FakeHTTPConnection.connections[0]
+        connection.fail = True
+        self.pool.request('GET', '/b')
+        self.assertEqual(connection.requests, [('GET', '/a'), ('GET', '/b')])
+
+    def test_new_connection_not_retried(self):
+        def _fail_create():
+            connection = FakeHTTPConnection('localhost', 9696)
+            connection.fail = True
+            return connection
+        self.stubs.Set(self.pool, 'create', _fail_create)
+        self.assertRaises(socket.error, self.pool.request, 'GET', '/a')
+        self.assertEqual(FakeHTTPConnection.connections[0].requests, [])
+
+
+class QuantumMelangeIPAMLibTestCase(test.TestCase):
+    def setUp(self):
+        super(QuantumMelangeIPAMLibTestCase, self).setUp()
+        self.lookups = []
+        self.stubs.Set(melange_connection.MelangeConnection,
+                       'get_allocated_ips', self._fake_get_allocated_ips)
+        self.ipam = melange_ipam_lib.QuantumMelangeIPAMLib()
+        self.context = context.RequestContext('user1', 'project1')
+
+    def _fake_get_allocated_ips(self, net_id, vif_id, tenant_id):
+        self.lookups.append((net_id, vif_id, tenant_id))
+        return [{'address': '10.0.0.%d' % len(self.lookups)},
+                {'address': 'fe80::%d' % len(self.lookups)}]
+
+    def test_allocated_ips_looked_up_once(self):
+        v4 = self.ipam.get_v4_ips_by_interface(self.context, 'net1', 'vif1',
+                                               'project1')
+        v6 = self.ipam.get_v6_ips_by_interface(self.context, 'net1', 'vif1',
+                                               'project1')
+        self.assertEqual(v4, ['10.0.0.1'])
+        self.assertEqual(v6, ['fe80::1'])
+        self.assertEqual(self.lookups, [('net1', 'vif1', 'project1')])
+
+    def test_prefetch_ips_by_interfaces(self):
+        self.ipam.prefetch_ips_by_interfaces(self.context,
+                [('net1', 'vif1', 'project1'), ('net2', 'vif2', None)])
+        self.assertEqual(len(self.lookups), 2)
+        self.ipam.get_v4_ips_by_interface(self.context, 'net2', 'vif2', None)
+        self.assertEqual(len(self.lookups), 2)
+
+    def test_deallocate_forgets_allocated_ips(self):
+        self.stubs.Set(melange_connection.MelangeConnection,
+                       'deallocate_ips', lambda *args: None)
+        self.ipam.get_v4_ips_by_interface(self.context, 'net1', 'vif1',
+                                          'project1')
+        self.ipam.deallocate_ips_by_vif(self.context, 'project1', 'net1',
+                                        {'uuid': 'vif1'})
+        self.ipam.get_v4_ips_by_interface(self.context, 'net1', 'vif1',
+                                          'project1')
+        self.assertEqual(len(self.lookups), 2)
@@ -404,3 +404,76 @@ class QuotaTestCase(test.TestCase):
         files = [(path, 'config = quotatest')]
         self.assertRaises(exception.QuotaError,
                           self._create_with_injected_files, files)
+
+    def _get_usage(self, resource):
+        usages = db.quota_usage_get_all_by_project(self.context,
+                                                   self.project_id)
+        return usages.get(resource)
+
+    def test_reserve_syncs_usage(self):
+        self._create_instance(cores=2)
+        reservations = quota.reserve(self.context, instances=1, cores=1)
+        self.assertEqual(len(reservations), 2)
+        self.assertEqual(self._get_usage('instances'),
+                         dict(in_use=1, reserved=1))
+        self.assertEqual(self._get_usage('cores'),
+                         dict(in_use=2, reserved=1))
+
+    def test_reserve_commit(self):
+        reservations = quota.reserve(self.context, volumes=1, gigabytes=5)
+        quota.commit(self.context, reservations)
+        self.assertEqual(self._get_usage('volumes'),
+                         dict(in_use=1, reserved=0))
+        self.assertEqual(self._get_usage('gigabytes'),
+                         dict(in_use=5, reserved=0))
+        self.assertEqual(quota.allowed_volumes(self.context, 100, 5), 1)
+
+    def test_reserve_rollback(self):
+        reservations = quota.reserve(self.context, volumes=1, gigabytes=5)
+        quota.rollback(self.context, reservations)
+        self.assertEqual(self._get_usage('volumes'),
+                         dict(in_use=0, reserved=0))
+        self.assertEqual(quota.allowed_volumes(self.context, 100, 5), 2)
+
+    def test_reserve_counts_reserved_usage(self):
+        quota.reserve(self.context, volumes=2, gigabytes=2)
+        self.assertRaises(exception.OverQuota, quota.reserve,
+                          self.context, volumes=1, gigabytes=1)
+        self.assertEqual(quota.allowed_volumes(self.context, 1, 1), 0)
+
+    def test_reserve_over_quota(self):
+        self.assertRaises(exception.OverQuota, quota.reserve,
+                          self.context, volumes=1, gigabytes=21)
+        self.assertEqual(quota.allowed_volumes(self.context, 100, 1), 2)
+
+    def test_reserve_unlimited(self):
+        db.quota_create(self.context, self.project_id, 'gigabytes', None)
+        reservations = quota.reserve(self.context, gigabytes=1000)
+        self.assertEqual(len(reservations), 1)
+
+    def test_apply_usage_delta(self):
+        quota.commit(self.context,
+                     quota.reserve(self.context, volumes=2, gigabytes=10))
+        quota.apply_usage_delta(self.context, volumes=-1, gigabytes=-20)
+        self.assertEqual(self._get_usage('volumes'),
+                         dict(in_use=1, reserved=0))
+        self.assertEqual(self._get_usage('gigabytes'),
+                         dict(in_use=0, reserved=0))
+
+    def test_apply_usage_delta_untracked(self):
+        quota.apply_usage_delta(self.context, volumes=-1)
+        self.assertEqual(self._get_usage('volumes'), None)
+
+    def test_expire_reservations(self):
+        self.flags(reservation_expire=-1)
+        quota.reserve(self.context, volumes=1, gigabytes=5)
+        quota.expire_reservations(self.context)
+        self.assertEqual(self._get_usage('volumes'),
+                         dict(in_use=0, reserved=0))
+
+    def test_volume_create_commits_usage(self):
+        volume.API().create(self.context, 10, '', '', None)
+        self.assertEqual(self._get_usage('volumes'),
+                         dict(in_use=1, reserved=0))
+        self.assertEqual(self._get_usage('gigabytes'),
+                         dict(in_use=10, reserved=0))
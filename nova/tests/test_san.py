@@ -0,0 +1,113 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+# All Rights Reserved.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""Tests for the SSH connection pool of the SAN volume drivers."""
+
+import paramiko
+
+from nova import exception
+from nova import test
+from nova.volume import san
+
+
+class FakeTransport(object):
+    def __init__(self):
+        self.active = True
+        self.keepalive = None
+
+    def is_active(self):
+        return self.active
+
+    def set_keepalive(self, interval):
+        self.keepalive = interval
+
+
+class FakeSSH(object):
+    def __init__(self):
+        self.transport = FakeTransport()
+        self.closed = False
+
+    def get_transport(self):
+        return self.transport
+
+    def close(self):
+        self.closed = True
+
+
+class SanSSHPoolTestCase(test.TestCase):
+    def setUp(self):
+        super(SanSSHPoolTestCase, self).setUp()
+        self.flags(san_is_local=False, san_ssh_pool_size=2,
+                   san_ssh_keepalive_interval=10)
+        self.connections = []
+        self.commands = []
+        self.driver = san.SanISCSIDriver()
+        self.stubs.Set(self.driver, '_connect_to_ssh', self._fake_connect)
+        self.stubs.Set(san, 'ssh_execute', self._fake_ssh_execute)
+
+    def _fake_connect(self):
+        ssh = FakeSSH()
+        self.connections.append(ssh)
+        return ssh
+
+    def _fake_ssh_execute(self, ssh, cmd, check_exit_code=True):
+        self.commands.append((ssh, cmd))
+        if cmd == 'drop':
+            raise paramiko.SSHException()
+        if cmd == 'fail':
+            raise exception.ProcessExecutionError()
+        return '', ''
+
+    def test_connection_reused(self):
+        self.driver._run_ssh('ls')
+        self.driver._run_ssh('ls')
+        self.assertEqual(len(self.connections), 1)
+        self.assertEqual(self.connections[0].transport.keepalive, 10)
+        self.assertFalse(self.connections[0].closed)
+
+    def test_dropped_connection_replaced(self):
+        self.driver._run_ssh('ls')
+        self.connections[0].transport.active = False
+        self.driver._run_ssh('ls')
+        self.assertEqual(len(self.connections), 2)
+        self.assertTrue(self.connections[0].closed)
+        self.assertTrue(self.commands[1][0] is self.connections[1])
+
+    def test_broken_connection_discarded(self):
+        self.assertRaises(paramiko.SSHException, self.driver._run_ssh, 'drop')
+        self.assertTrue(self.connections[0].closed)
+        self.driver._run_ssh('ls')
+        self.assertEqual(len(self.connections), 2)
+        self.assertEqual(self.driver.sshpool.current_size, 1)
+
+    def test_failed_command_keeps_connection(self):
+        self.assertRaises(exception.ProcessExecutionError,
+                          self.driver._run_ssh, 'fail')
+        self.driver._run_ssh('ls')
+        self.assertEqual(len(self.connections), 1)
+
+    def test_pool_is_bounded(self):
+        pool = self.driver.sshpool = san.SSHPool(self._fake_connect,
+                                                 max_size=2)
+        first = pool.get()
+        second = pool.get()
+        self.assertEqual(pool.free(), 0)
+        pool.put(first)
+        self.assertTrue(pool.get() is first)
+        pool.put(first)
+        pool.put(second)
+        self.assertEqual(len(self.connections), 2)
@@ -20,8 +20,11 @@ import datetime
 import hashlib
 import os
 import StringIO
+import sys
 import tempfile
 
+from eventlet import greenthread
+
 import nova
 from nova import exception
 from nova import flags
@@ -114,6 +117,62 @@ grep foo
             os.unlink(tmpfilename2)
 
 
+class RootwrapDaemonTestCase(test.TestCase):
+    def setUp(self):
+        super(RootwrapDaemonTestCase, self).setUp()
+        rootwrap = os.path.join(os.path.dirname(nova.__file__), os.pardir,
+                                'bin', 'nova-rootwrap')
+        self.flags(use_rootwrap_daemon=True,
+                   root_helper='%s %s' % (sys.executable, rootwrap))
+        fd, self.tmpfilename = tempfile.mkstemp()
+        os.close(fd)
+
+    def tearDown(self):
+        utils._get_rootwrap_daemon().stop()
+        os.unlink(self.tmpfilename)
+        super(RootwrapDaemonTestCase, self).tearDown()
+
+    def test_execute(self):
+        out, err = utils.execute('tee', self.tmpfilename,
+                                 process_input='foo', run_as_root=True)
+        self.assertEqual(out, 'foo')
+        utils.execute('tee', '-a', self.tmpfilename,
+                      process_input='bar', run_as_root=True)
+        self.assertEqual(open(self.tmpfilename).read(), 'foobar')
+
+    def test_unauthorized_command(self):
+        self.assertRaises(exception.ProcessExecutionError,
+                          utils.execute, 'foo_bar_not_exist',
+                          run_as_root=True)
+
+    def test_daemon_restarted(self):
+        utils.execute('tee', self.tmpfilename, run_as_root=True)
+        daemon = utils._get_rootwrap_daemon()
+        daemon._process.kill()
+        daemon._process.wait()
+        out, err = utils.execute('tee', self.tmpfilename,
+                                 process_input='foo', run_as_root=True)
+        self.assertEqual(out, 'foo')
+
+    def test_invalid_response(self):
+        # The daemon only exits once the output after the invalid
+        # response, more than a pipe holds, has been read.
+        daemon = utils.RootwrapDaemon(
+                "sh -c 'read request; echo garbage; "
+                "head -c 1000000 /dev/zero; cat >/dev/null'")
+        for i in xrange(2):
+            daemon._start()
+            process = daemon._process
+            self.assertRaises(exception.ProcessExecutionError,
+                              daemon.execute, ['tee', self.tmpfilename])
+            self.assertEqual(daemon._process, None)
+            for attempt in xrange(100):
+                if process.poll() is not None:
+                    break
+                greenthread.sleep(0.05)
+            self.assertNotEqual(process.poll(), None)
+
+
 class GetFromPathTestCase(test.TestCase):
     def test_tolerates_nones(self):
         f = utils.get_from_path
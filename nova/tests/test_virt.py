@@ -15,8 +15,14 @@
 #    License for the specific language governing permissions and limitations
 #    under the License.
 
+import os
+
+from nova import exception
 from nova import flags
 from nova import test
+from nova import utils
+from nova.virt.disk import api as disk_api
+from nova.virt.disk import vfs
 from nova.virt import driver
 
 FLAGS = flags.FLAGS
@@ -81,3 +87,123 @@ class TestVirtDriver(test.TestCase):
                                                 'swap_size': 0}))
         self.assertTrue(driver.swap_is_usable({'device_name': '/dev/sdb',
                                                 'swap_size': 1}))
+
+
+class FakeGuestFS(object):
+    """Records the calls made on a libguestfs handle."""
+
+    def __init__(self):
+        self.calls = []
+        self.files = {'/etc/passwd': 'root:x:0:0::/root:/bin/sh\n',
+                      '/etc/group': 'root:x:0:\nadm:x:4:\n'}
+
+    def __getattr__(self, name):
+        def _call(*args, **kwargs):
+            self.calls.append((name,) + args)
+        return _call
+
+    def read_lines(self, path):
+        return self.files[path].splitlines()
+
+    def write(self, path, content):
+        self.calls.append(('write', path))
+        self.files[path] = content
+
+    def write_append(self, path, content):
+        self.calls.append(('write_append', path))
+        self.files[path] = self.files.get(path, '') + content
+
+
+class FakeGuestFSModule(object):
+    def __init__(self):
+        self.handles = []
+
+    def GuestFS(self):
+        handle = FakeGuestFS()
+        self.handles.append(handle)
+        return handle
+
+
+class TestVirtDiskInjection(test.TestCase):
+    def setUp(self):
+        super(TestVirtDiskInjection, self).setUp()
+        self.guestfs = FakeGuestFSModule()
+        self.stubs.Set(vfs, 'guestfs', self.guestfs)
+
+    def test_inject_data_with_guestfs(self):
+        self.flags(img_injection_engine='guestfs')
+        disk_api.inject_data('/tmp/disk', key='ssh-rsa key',
+                             net='iface eth0', partition='1', use_cow=True)
+        handle = self.guestfs.handles[0]
+        self.assertEqual(handle.calls[:3],
+                         [('add_drive_opts', '/tmp/disk'),
+                          ('launch',),
+                          ('mount_options', '', '/dev/sda1', '/')])
+        self.assertTrue(('chown', 0, -1, '/root/.ssh') in handle.calls)
+        self.assertTrue(('chmod', 0700, '/root/.ssh') in handle.calls)
+        self.assertTrue(('chown', 0, 0, '/etc/network') in handle.calls)
+        self.assertTrue('ssh-rsa key' in
+                        handle.files['/root/.ssh/authorized_keys'])
+        self.assertEqual(handle.files['/etc/network/interfaces'],
+                         'iface eth0')
+        self.assertEqual(handle.calls[-3:],
+                         [('umount_all',), ('sync',), ('close',)])
+
+    def test_inject_files_with_guestfs(self):
+        self.flags(img_injection_engine='guestfs')
+        disk_api.inject_files('/tmp/disk', [('/etc/motd', 'hello'),
+                                            ('top', 'level')])
+        handle = self.guestfs.handles[0]
+        self.assertTrue(('mount_options', '', '/dev/sda', '/') in
+                        handle.calls)
+        self.assertTrue(('mkdir_p', '/etc') in handle.calls)
+        self.assertEqual(handle.files['/etc/motd'], 'hello')
+        self.assertEqual(handle.files['/top'], 'level')
+
+    def test_guestfs_unknown_owner(self):
+        fs = vfs.VFSGuestFS('/tmp/disk')
+        fs.setup()
+        self.assertRaises(exception.Error, fs.set_ownership,
+                          '/etc', 'nobody', None)
+        fs.teardown()
+
+    def test_local_fs_uses_root_helper(self):
+        commands = []
+
+        def fake_execute(*cmd, **kwargs):
+            commands.append((cmd, kwargs.get('run_as_root')))
+
+        self.stubs.Set(utils, 'execute', fake_execute)
+        disk_api.inject_data_into_fs('/mnt', 'ssh-rsa key', None, None,
+                                     utils.execute)
+        self.assertEqual([cmd for cmd, run_as_root in commands],
+                         [('mkdir', '-p', '/mnt/root/.ssh'),
+                          ('chown', 'root', '/mnt/root/.ssh'),
+                          ('chmod', '700', '/mnt/root/.ssh'),
+                          ('tee', '-a', '/mnt/root/.ssh/authorized_keys')])
+        self.assertTrue(all(run_as_root for cmd, run_as_root in commands))
+
+    def test_make_config_drive_iso(self):
+        staged = {}
+        real_execute = utils.execute
+
+        def fake_execute(*cmd, **kwargs):
+            if cmd[0] != 'genisoimage':
+                self.assertFalse(kwargs.get('run_as_root'))
+                return real_execute(*cmd, **kwargs)
+            staging_dir = cmd[-1]
+            for root, dirs, files in os.walk(staging_dir):
+                for name in files:
+                    path = os.path.join(root, name)
+                    with open(path) as f:
+                        staged[os.path.relpath(path, staging_dir)] = f.read()
+            staged['output'] = cmd[cmd.index('-o') + 1]
+
+        self.stubs.Set(utils, 'execute', fake_execute)
+        disk_api.make_config_drive_iso('/tmp/disk.config', key='ssh-rsa key',
+                                       net='iface eth0',
+                                       files=[('/etc/motd', 'hello')])
+        self.assertEqual(staged['output'], '/tmp/disk.config')
+        self.assertTrue('ssh-rsa key' in staged['root/.ssh/authorized_keys'])
+        self.assertEqual(staged['etc/network/interfaces'], 'iface eth0')
+        self.assertEqual(staged['etc/motd'], 'hello')
@@ -327,6 +327,51 @@ class VolumeDriverTestCase(DriverTestCase):
         self.output = 'x'
         self.volume.driver.delete_volume({'name': 'test1', 'size': 1024})
 
+    def _record_execute(self, outputs):
+        commands = []
+
+        def _fake_execute(*cmd, **kwargs):
+            commands.append(cmd)
+            return outputs.get(cmd[0], ''), None
+        self.volume.driver.set_execute(_fake_execute)
+        self.stubs.Set(self.volume.driver, '_discard_zeroes_data',
+                       lambda path: False)
+        return commands
+
+    def test_delete_volume_deferred(self):
+        self.flags(volume_clear_deferred=True)
+        commands = self._record_execute({'lvdisplay': '-wi-a-',
+                                         'lvs': '  1024.00\n'})
+        driver = self.volume.driver
+        driver.delete_volume({'name': 'test1', 'size': 1})
+
+        self.assertEqual(commands[-1],
+                         ('lvrename', FLAGS.volume_group, 'test1',
+                          'wipe-test1'))
+        self.assertEqual(driver.get_volume_stats(),
+                         {'volumes_pending_wipe': 1})
+
+        driver._wipe_thread.wait()
+        path = driver.local_path({'name': 'wipe-test1'})
+        self.assertTrue(('ionice', '-c3', 'dd', 'if=/dev/zero',
+                         'of=%s' % path, 'count=1024', 'bs=1M')
+                        in commands)
+        self.assertEqual(commands[-1],
+                         ('lvremove', '-f',
+                          '%s/wipe-test1' % FLAGS.volume_group))
+        self.assertEqual(driver.get_volume_stats(),
+                         {'volumes_pending_wipe': 0})
+
+    def test_setup_schedules_pending_wipes(self):
+        self.flags(volume_clear_deferred=True)
+        commands = self._record_execute({'lvs': 'volume-1 wipe-volume-2'})
+        driver = self.volume.driver
+        self.stubs.Set(driver, '_wipe_volume', commands.append)
+        driver.do_setup(self.context)
+        driver._wipe_thread.wait()
+
+        self.assertEqual(commands[-1], 'wipe-volume-2')
+
 
 class ISCSITestCase(DriverTestCase):
     """Test Case for ISCSIDriver"""
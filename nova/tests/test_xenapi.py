@@ -24,6 +24,7 @@ import json
 import os
 import re
 import stubout
+import StringIO
 
 from nova import db
 from nova import context
@@ -35,6 +36,7 @@ from nova.compute import instance_types
 from nova.compute import power_state
 from nova import exception
 from nova.virt import xenapi_conn
+from nova.virt.xenapi import event_watcher
 from nova.virt.xenapi import fake as xenapi_fake
 from nova.virt.xenapi import volume_utils
 from nova.virt.xenapi import vmops
@@ -1333,6 +1335,38 @@ class XenAPIBWUsageTestCase(test.TestCase):
         result = self.conn.get_all_bw_usage(datetime.datetime.utcnow())
         self.assertEqual(result, [])
 
+    def test_get_all_bw_usage_uses_bulk_records(self):
+        vm_ref = xenapi_fake.create_vm('instance-00000001', 'Running')
+        vm_rec = xenapi_fake.get_record('VM', vm_ref)
+        vif_ref = xenapi_fake._create_object('VIF',
+                                             {'device': '0',
+                                              'MAC': 'aa:bb:cc:dd:ee:ff',
+                                              'VM': vm_ref})
+        vm_rec['VIFs'] = [vif_ref]
+
+        def fake_compile_metrics(cls, session, start_time, stop_time=None):
+            return {vm_rec['uuid']: {'vif_0_tx': 100.0,
+                                     'vif_0_rx': 200.0,
+                                     'vif_1_tx': 300.0}}
+
+        self.stubs.Set(vm_utils.VMHelper, "compile_metrics",
+                       classmethod(fake_compile_metrics))
+
+        called = []
+        orig_call_xenapi = self.conn._session.call_xenapi
+
+        def fake_call_xenapi(method, *args):
+            called.append(method)
+            return orig_call_xenapi(method, *args)
+
+        self.stubs.Set(self.conn._session, 'call_xenapi', fake_call_xenapi)
+
+        result = self.conn.get_all_bw_usage(datetime.datetime.utcnow())
+        self.assertEqual(result, [dict(mac_address='aa:bb:cc:dd:ee:ff',
+                                       bw_in=200, bw_out=100)])
+        self.assertEqual(sorted(called),
+                         ['VIF.get_all_records', 'VM.get_all_records'])
+
 
 # TODO(salvatore-orlando): this class and
 # nova.tests.test_libvirt.IPTablesFirewallDriverTestCase share a lot of code.
@@ -1710,3 +1744,160 @@ class XenAPISRSelectionTestCase(test.TestCase):
         expected = helper.safe_find_sr(session)
         self.assertEqual(session.call_xenapi('pool.get_default_SR', pool_ref),
                          expected)
+
+
+class FakeEventSession(object):
+    """Session double that hands out canned event.from results."""
+    def __init__(self, events_from=None, records=None):
+        self.events_from = events_from or []
+        self.records = records or {}
+        self.calls = []
+
+    def get_imported_xenapi(self):
+        return xenapi_fake
+
+    def call_xenapi_event(self, method, *args):
+        self.calls.append(method)
+        if method == 'event.from':
+            result = self.events_from.pop(0)
+            if isinstance(result, Exception):
+                raise result
+            return result
+
+    def call_xenapi(self, method, *args):
+        self.calls.append(method)
+        return self.records[method.split('.')[0]]
+
+
+class FakeEventConnection(object):
+    """XenAPI connection double whose event.from calls fail."""
+    def __init__(self):
+        self.logged_out = False
+        self.xenapi = self.event = self.session = self
+        setattr(self, 'from', self._event_from)
+
+    def login_with_password(self, user, pw):
+        pass
+
+    def logout(self):
+        self.logged_out = True
+
+    def _event_from(self, *args):
+        raise xenapi_fake.Failure(['SESSION_INVALID', 'OpaqueRef:fake'])
+
+
+class XenAPIEventWatcherTestCase(test.TestCase):
+    """Unit tests for the XenAPI event driven record cache."""
+    def _vm_event(self, operation, ref, **snapshot):
+        return {'class': 'vm', 'operation': operation, 'ref': ref,
+                'snapshot': snapshot}
+
+    def test_refresh_loads_records_from_event_stream(self):
+        session = FakeEventSession(events_from=[
+                {'token': 'token1',
+                 'events': [self._vm_event('add', 'vm1', name_label='a'),
+                            self._vm_event('add', 'vm2', name_label='b')]}])
+        watcher = event_watcher.EventWatcher(session)
+        watcher.refresh()
+
+        self.assertTrue(watcher.ready)
+        self.assertEqual(session.calls, ['event.from'])
+        self.assertEqual(sorted(watcher.get_all_records('VM').keys()),
+                         ['vm1', 'vm2'])
+        self.assertEqual(watcher.get_record('VM', 'vm1'), {'name_label': 'a'})
+        self.assertEqual(watcher.get_all_records('VIF'), {})
+        # Reads are answered from memory once the cache is loaded
+        self.assertEqual(session.calls, ['event.from'])
+
+    def test_process_events_applies_mod_and_del(self):
+        session = FakeEventSession(events_from=[
+                {'token': 'token1',
+                 'events': [self._vm_event('add', 'vm1', name_label='a'),
+                            self._vm_event('add', 'vm2', name_label='b')]},
+                {'token': 'token2',
+                 'events': [self._vm_event('mod', 'vm1', name_label='c'),
+                            self._vm_event('del', 'vm2')]}])
+        watcher = event_watcher.EventWatcher(session)
+        watcher.refresh()
+        watcher.process_events(watcher._next_events())
+
+        self.assertEqual(watcher._token, 'token2')
+        self.assertEqual(watcher.get_all_records('VM'),
+                         {'vm1': {'name_label': 'c'}})
+
+    def test_refresh_falls_back_to_event_next(self):
+        failure = xenapi_fake.Failure(['MESSAGE_METHOD_UNKNOWN', 'event.from'])
+        session = FakeEventSession(events_from=[failure],
+                                   records={'VM': {'vm1': {}},
+                                            'VIF': {}, 'VBD': {}})
+        watcher = event_watcher.EventWatcher(session)
+        watcher.refresh()
+
+        self.assertTrue(watcher.ready)
+        self.assertEqual(session.calls,
+                         ['event.from', 'event.register',
+                          'VM.get_all_records', 'VIF.get_all_records',
+                          'VBD.get_all_records'])
+        self.assertEqual(watcher.get_all_records('VM'), {'vm1': {}})
+
+    def test_unready_watcher_reads_through(self):
+        session = FakeEventSession(records={'VM': {'vm1': {}}})
+        watcher = event_watcher.EventWatcher(session)
+        self.assertEqual(watcher.get_all_records('VM'), {'vm1': {}})
+        self.assertEqual(session.calls, ['VM.get_all_records'])
+
+    def test_failed_event_call_logs_in_again(self):
+        xenapi_fake.reset()
+        stubs.stubout_session(self.stubs, stubs.FakeSessionForVMTests)
+        session = xenapi_conn.XenAPISession('test_url', 'root', 'test_pass')
+        connections = []
+
+        def fake_create_session(url):
+            connections.append(FakeEventConnection())
+            return connections[-1]
+
+        self.stubs.Set(session, '_create_session', fake_create_session)
+        for i in xrange(2):
+            self.assertRaises(xenapi_fake.Failure, session.call_xenapi_event,
+                              'event.from', ['VM'], '', 0.0)
+
+        self.assertEqual(len(connections), 2)
+        self.assertTrue(all(conn.logged_out for conn in connections))
+        self.assertEqual(session._event_session, None)
+
+
+class XenAPIRRDParsingTestCase(test.TestCase):
+    """Unit tests for the streaming RRD parsers."""
+    _rrd_updates = ('<xport><meta><start>0</start><step>10</step>'
+                    '<end>20</end><rows>2</rows><columns>2</columns>'
+                    '<legend><entry>AVERAGE:vm:fake-uuid:vif_0_rx</entry>'
+                    '<entry>AVERAGE:vm:fake-uuid:cpu0</entry></legend>'
+                    '</meta><data>'
+                    '<row><t>20</t><v>10.0</v><v>1.0</v></row>'
+                    '<row><t>10</t><v>NaN</v><v>NaN</v></row>'
+                    '</data></xport>')
+
+    _rrd = ('<rrd><version>0003</version><step>5</step>'
+            '<lastupdate>1</lastupdate>'
+            '<ds><name>cpu0</name><type>GAUGE</type>'
+            '<minimal_heartbeat>300</minimal_heartbeat><min>0.0</min>'
+            '<max>1.0</max><last_ds>0.5</last_ds><value>0.25</value>'
+            '<unknown_sec>0</unknown_sec></ds>'
+            '<rra><cf>AVERAGE</cf><database><row><v>0.1</v></row>'
+            '</database></rra></rrd>')
+
+    def test_parse_rrd_updates(self):
+        result = vm_utils.parse_rrd_updates(
+                StringIO.StringIO(self._rrd_updates), 0)
+        self.assertEqual(result, {'fake-uuid': {'vif_0_rx': 50.0,
+                                                'cpu0': 1.0}})
+
+    def test_parse_rrd_updates_until(self):
+        result = vm_utils.parse_rrd_updates(
+                StringIO.StringIO(self._rrd_updates), 0, until=15)
+        self.assertEqual(result, {'fake-uuid': {'vif_0_rx': 0.0,
+                                                'cpu0': 0.0}})
+
+    def test_parse_rrd_diagnostics(self):
+        result = vm_utils.parse_rrd_diagnostics(StringIO.StringIO(self._rrd))
+        self.assertEqual(result, {'cpu0': '0.25'})
@@ -50,6 +50,7 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
+from nova.rootwrap import daemon as rootwrap_daemon
 
 
 LOG = logging.getLogger("nova.utils")
@@ -197,28 +198,36 @@ def execute(*cmd, **kwargs):
         raise exception.Error(_('Got unknown keyword args '
                                 'to utils.execute: %r') % kwargs)
 
-    if run_as_root:
+    use_daemon = run_as_root and FLAGS.use_rootwrap_daemon and not shell
+    if run_as_root and not use_daemon:
         cmd = shlex.split(FLAGS.root_helper) + list(cmd)
     cmd = map(str, cmd)
 
     while attempts > 0:
         attempts -= 1
         try:
-            LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
-            _PIPE = subprocess.PIPE  # pylint: disable=E1101
-            obj = subprocess.Popen(cmd,
-                                   stdin=_PIPE,
-                                   stdout=_PIPE,
-                                   stderr=_PIPE,
-                                   close_fds=True,
-                                   shell=shell)
-            result = None
-            if process_input is not None:
-                result = obj.communicate(process_input)
+            if use_daemon:
+                LOG.debug(_('Running cmd (rootwrap daemon): %s'),
+                          ' '.join(cmd))
+                (_returncode, stdout, stderr) = \
+                        _get_rootwrap_daemon().execute(cmd, process_input)
+                result = (stdout, stderr)
             else:
-                result = obj.communicate()
-            obj.stdin.close()  # pylint: disable=E1101
-            _returncode = obj.returncode  # pylint: disable=E1101
+                LOG.debug(_('Running cmd (subprocess): %s'), ' '.join(cmd))
+                _PIPE = subprocess.PIPE  # pylint: disable=E1101
+                obj = subprocess.Popen(cmd,
+                                       stdin=_PIPE,
+                                       stdout=_PIPE,
+                                       stderr=_PIPE,
+                                       close_fds=True,
+                                       shell=shell)
+                result = None
+                if process_input is not None:
+                    result = obj.communicate(process_input)
+                else:
+                    result = obj.communicate()
+                obj.stdin.close()  # pylint: disable=E1101
+                _returncode = obj.returncode  # pylint: disable=E1101
             if _returncode:
                 LOG.debug(_('Result was %s') % _returncode)
                 if not ignore_exit_code and _returncode not in check_exit_code:
@@ -243,6 +252,106 @@ def execute(*cmd, **kwargs):
             greenthread.sleep(0)
 
 
+class RootwrapDaemon(object):
+    """Client of a "nova-rootwrap --daemon" process.
+
+    The daemon is started through the given root helper on first use and
+    again whenever it exits.  Commands from several greenthreads are sent
+    to it at once and their results matched up by request id.
+    """
+
+    def __init__(self, root_helper):
+        self.root_helper = root_helper
+        self._process = None
+        self._waiters = None
+        self._next_id = 0
+        self._lock = semaphore.Semaphore()
+
+    def _start(self):
+        cmd = shlex.split(self.root_helper) + ['--daemon']
+        LOG.debug(_('Starting rootwrap daemon: %s'), ' '.join(cmd))
+        _PIPE = subprocess.PIPE  # pylint: disable=E1101
+        self._process = subprocess.Popen(cmd,
+                                         stdin=_PIPE,
+                                         stdout=_PIPE,
+                                         close_fds=True)
+        self._waiters = {}
+        greenthread.spawn_n(self._read_responses, self._process,
+                            self._waiters)
+
+    def _read_responses(self, process, waiters):
+        try:
+            for line in iter(process.stdout.readline, ''):
+                (request_id, returncode, stdout, stderr) = \
+                        rootwrap_daemon.decode_response(line)
+                waiter = waiters.pop(request_id, None)
+                if waiter is not None:
+                    waiter.send((returncode, stdout, stderr))
+        except Exception:
+            # The responses can no longer be matched up with their
+            # requests, so stop this daemon and fail the commands
+            # waiting on it.  The next command starts a new one.
+            LOG.exception(_('Invalid response from rootwrap daemon'))
+            process.stdin.close()
+
+        with self._lock:
+            if self._process is process:
+                self._process = None
+        for waiter in waiters.values():
+            waiter.send_exception(exception.ProcessExecutionError(
+                    description=_('Rootwrap daemon exited')))
+        waiters.clear()
+
+        # Responses nobody waits for any more are still read, or the
+        # daemon could block writing them to a full pipe and never exit.
+        for line in iter(process.stdout.readline, ''):
+            pass
+        LOG.warn(_('Rootwrap daemon exited with %s'), process.wait())
+
+    def stop(self):
+        """Closes the daemon's stdin, which makes it exit"""
+        with self._lock:
+            if self._process is not None:
+                self._process.stdin.close()
+                self._process = None
+
+    def _send(self, request_id, cmd, process_input):
+        self._process.stdin.write(rootwrap_daemon.encode_request(
+                request_id, cmd, process_input))
+        self._process.stdin.flush()
+
+    def execute(self, cmd, process_input=None):
+        """Runs cmd as root, returning (returncode, stdout, stderr)"""
+        with self._lock:
+            if self._process is None:
+                self._start()
+            request_id = self._next_id
+            self._next_id += 1
+            waiter = event.Event()
+            self._waiters[request_id] = waiter
+            try:
+                self._send(request_id, cmd, process_input)
+            except IOError:
+                # The daemon died since the last command, start a
+                # new one and try again.
+                self._waiters.pop(request_id, None)
+                self._start()
+                self._waiters[request_id] = waiter
+                self._send(request_id, cmd, process_input)
+        return waiter.wait()
+
+
+_ROOTWRAP_DAEMON = None
+
+
+def _get_rootwrap_daemon():
+    global _ROOTWRAP_DAEMON
+    if (_ROOTWRAP_DAEMON is None or
+        _ROOTWRAP_DAEMON.root_helper != FLAGS.root_helper):
+        _ROOTWRAP_DAEMON = RootwrapDaemon(FLAGS.root_helper)
+    return _ROOTWRAP_DAEMON
+
+
 def trycmd(*args, **kwargs):
     """
     A wrapper around execute() to more easily handle warnings and errors.
@@ -27,6 +27,7 @@ Includes injection of SSH PGP keys into authorized_keys file.
 
 import json
 import os
+import shutil
 import tempfile
 
 from nova import exception
@@ -37,6 +38,7 @@ from nova import utils
 from nova.virt.disk import guestfs
 from nova.virt.disk import loop
 from nova.virt.disk import nbd
+from nova.virt.disk import vfs
 
 
 LOG = logging.getLogger('nova.compute.disk')
@@ -48,6 +50,16 @@ disk_opts = [
     cfg.ListOpt('img_handlers',
                 default=['loop', 'nbd', 'guestfs'],
                 help='Order of methods used to mount disk images'),
+    cfg.StrOpt('img_injection_engine',
+               default='mount',
+               help='How files are injected into disk images: "mount" '
+                    'mounts the image with img_handlers and writes through '
+                    'the root helper, "guestfs" edits the image in-process '
+                    'with the libguestfs Python bindings, without mounts '
+                    'or root'),
+    cfg.StrOpt('genisoimage_tool',
+               default='genisoimage',
+               help='Command used to build config drive ISO images'),
 
     # NOTE(yamahata): ListOpt won't work because the command may include a
     #                 comma. For example:
@@ -185,6 +197,28 @@ class _DiskImage(object):
                 os.rmdir(self.mount_dir)
 
 
+def _edit_image(image, partition, use_cow, edit):
+    """Calls edit with a vfs.VFS on the files of the image."""
+    if FLAGS.img_injection_engine == 'guestfs':
+        fs = vfs.VFSGuestFS(image, imgfmt=use_cow and 'qcow2' or 'raw',
+                            partition=partition)
+        fs.setup()
+        try:
+            edit(fs)
+        finally:
+            fs.teardown()
+        return
+
+    img = _DiskImage(image=image, partition=partition, use_cow=use_cow)
+    if img.mount():
+        try:
+            edit(vfs.VFSLocalFS(img.mount_dir))
+        finally:
+            img.umount()
+    else:
+        raise exception.Error(img.errors)
+
+
 # Public module functions
 
 def inject_data(image, key=None, net=None, metadata=None,
@@ -197,28 +231,39 @@ def inject_data(image, key=None, net=None, metadata=None,
     If partition is not specified it mounts the image as a single partition.
 
     """
-    img = _DiskImage(image=image, partition=partition, use_cow=use_cow)
-    if img.mount():
-        try:
-            inject_data_into_fs(img.mount_dir, key, net, metadata,
-                                utils.execute)
-        finally:
-            img.umount()
-    else:
-        raise exception.Error(img.errors)
+    _edit_image(image, partition, use_cow,
+                lambda fs: inject_data_into_fs(fs, key, net, metadata,
+                                               utils.execute))
 
 
 def inject_files(image, files, partition=None, use_cow=False):
     """Injects arbitrary files into a disk image"""
-    img = _DiskImage(image=image, partition=partition, use_cow=use_cow)
-    if img.mount():
-        try:
-            for (path, contents) in files:
-                _inject_file_into_fs(img.mount_dir, path, contents)
-        finally:
-            img.umount()
-    else:
-        raise exception.Error(img.errors)
+    def _inject_files(fs):
+        for (path, contents) in files:
+            _inject_file_into_fs(fs, path, contents)
+
+    _edit_image(image, partition, use_cow, _inject_files)
+
+
+def make_config_drive_iso(path, key=None, net=None, metadata=None,
+                          files=None):
+    """Writes a config drive holding the given data as an ISO image.
+
+    The files are laid out as inject_data would write them, in a staging
+    directory owned by the caller, so neither mounts nor root are needed.
+    """
+    staging_dir = tempfile.mkdtemp()
+    try:
+        fs = vfs.VFSLocalFS(staging_dir, run_as_root=False)
+        inject_data_into_fs(fs, key, net, metadata, utils.execute)
+        for (file_path, contents) in files or []:
+            _inject_file_into_fs(fs, file_path, contents)
+        utils.execute(FLAGS.genisoimage_tool, '-o', path, '-ldots',
+                      '-allow-lowercase', '-allow-multidot', '-l',
+                      '-publisher', 'nova', '-quiet', '-J', '-r',
+                      '-V', 'config-2', staging_dir)
+    finally:
+        shutil.rmtree(staging_dir)
 
 
 def setup_container(image, container_dir=None, use_cow=False):
@@ -258,7 +303,11 @@ def inject_data_into_fs(fs, key, net, metadata, execute):
     """Injects data into a filesystem already mounted by the caller.
     Virt connections can call this directly if they mount their fs
     in a different way to inject_data
+
+    fs is either the directory the filesystem is mounted on, or a vfs.VFS.
     """
+    if not isinstance(fs, vfs.VFS):
+        fs = vfs.VFSLocalFS(fs)
     if key:
         _inject_key_into_fs(key, fs, execute=execute)
     if net:
@@ -268,31 +317,27 @@ def inject_data_into_fs(fs, key, net, metadata, execute):
 
 
 def _inject_file_into_fs(fs, path, contents):
-    absolute_path = os.path.join(fs, path.lstrip('/'))
-    parent_dir = os.path.dirname(absolute_path)
-    utils.execute('mkdir', '-p', parent_dir, run_as_root=True)
-    utils.execute('tee', absolute_path, process_input=contents,
-          run_as_root=True)
+    parent_dir = os.path.dirname(path.lstrip('/'))
+    if parent_dir:
+        fs.make_path(parent_dir)
+    fs.replace_file(path, contents)
 
 
 def _inject_metadata_into_fs(metadata, fs, execute=None):
-    metadata_path = os.path.join(fs, "meta.js")
     metadata = dict([(m.key, m.value) for m in metadata])
-
-    utils.execute('tee', metadata_path,
-                  process_input=json.dumps(metadata), run_as_root=True)
+    fs.replace_file('meta.js', json.dumps(metadata))
 
 
 def _inject_key_into_fs(key, fs, execute=None):
     """Add the given public ssh key to root's authorized_keys.
 
     key is an ssh key string.
-    fs is the path to the base of the filesystem into which to inject the key.
+    fs is the vfs.VFS of the filesystem into which to inject the key.
     """
-    sshdir = os.path.join(fs, 'root', '.ssh')
-    utils.execute('mkdir', '-p', sshdir, run_as_root=True)
-    utils.execute('chown', 'root', sshdir, run_as_root=True)
-    utils.execute('chmod', '700', sshdir, run_as_root=True)
+    sshdir = os.path.join('root', '.ssh')
+    fs.make_path(sshdir)
+    fs.set_ownership(sshdir, 'root', None)
+    fs.set_permissions(sshdir, 0700)
     keyfile = os.path.join(sshdir, 'authorized_keys')
     key_data = [
         '\n',
@@ -301,18 +346,17 @@ def _inject_key_into_fs(key, fs, execute=None):
         key.strip(),
         '\n',
     ]
-    utils.execute('tee', '-a', keyfile,
-                  process_input=''.join(key_data), run_as_root=True)
+    fs.append_file(keyfile, ''.join(key_data))
 
 
 def _inject_net_into_fs(net, fs, execute=None):
-    """Inject /etc/network/interfaces into the filesystem rooted at fs.
+    """Inject /etc/network/interfaces into the filesystem of fs.
 
     net is the contents of /etc/network/interfaces.
     """
-    netdir = os.path.join(os.path.join(fs, 'etc'), 'network')
-    utils.execute('mkdir', '-p', netdir, run_as_root=True)
-    utils.execute('chown', 'root:root', netdir, run_as_root=True)
-    utils.execute('chmod', 755, netdir, run_as_root=True)
+    netdir = os.path.join('etc', 'network')
+    fs.make_path(netdir)
+    fs.set_ownership(netdir, 'root', 'root')
+    fs.set_permissions(netdir, 0755)
     netfile = os.path.join(netdir, 'interfaces')
-    utils.execute('tee', netfile, process_input=net, run_as_root=True)
+    fs.replace_file(netfile, net)
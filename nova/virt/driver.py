@@ -150,6 +150,17 @@ class ComputeDriver(object):
         # TODO(Vek): Need to pass context in for access to auth_token
         raise NotImplementedError()
 
+    def register_event_listener(self, callback):
+        """Report the power state changes of the instances as they happen.
+
+        callback(instance_uuid, power_state) is then called from a
+        greenthread whenever an instance changes state on the host.
+
+        Returns True if the driver reports the changes, False if they
+        can only be found by polling, which is the default.
+        """
+        return False
+
     def spawn(self, context, instance, image_meta,
               network_info=None, block_device_info=None):
         """
@@ -175,6 +186,20 @@ class ComputeDriver(object):
         """
         raise NotImplementedError()
 
+    def prefetch_image(self, context, instance, image_meta):
+        """Fetch the images an instance boots from ahead of spawn.
+
+        Called while the instance's networks and block devices are still
+        being set up, so that spawn finds the images in the local cache.
+        Drivers without an image cache need not implement this.
+
+        :param context: security context
+        :param instance: Instance object as returned by DB layer.
+        :param image_meta: image object returned by nova.image.glance that
+                           defines the image from which to boot this instance
+        """
+        pass
+
     def destroy(self, instance, network_info, block_device_info=None):
         """Destroy (shutdown and delete) the specified instance.
 
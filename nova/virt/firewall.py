@@ -99,13 +99,23 @@ class FirewallDriver(object):
 
 
 class IptablesFirewallDriver(FirewallDriver):
-    """Driver which enforces security groups through iptables rules."""
+    """Driver which enforces security groups through iptables rules.
+
+    The rules of each security group used on the host are compiled once into
+    a chain of their own, which the chains of its instances jump to.  The
+    groups of all the instances are loaded together, and a refresh only
+    rebuilds the chains whose rules or members changed.
+    """
 
     def __init__(self, **kwargs):
         from nova.network import linux_net
         self.iptables = linux_net.iptables_manager
         self.instances = {}
         self.network_infos = {}
+        # security group id -> (ipv4 rules, ipv6 rules) of its chain
+        self.security_group_chains = {}
+        # instance id -> ids of the security groups its chain jumps to
+        self.instance_security_groups = {}
         self.basicly_filtered = False
 
         self.iptables.ipv4['filter'].add_chain('sg-fallback')
@@ -125,6 +135,8 @@ class IptablesFirewallDriver(FirewallDriver):
             # NOTE(vish): use the passed info instead of the stored info
             self.network_infos.pop(instance['id'])
             self.remove_filters_for_instance(instance)
+            self.instance_security_groups.pop(instance['id'], None)
+            self._remove_unused_security_group_chains()
             self.iptables.apply()
         else:
             LOG.info(_('Attempted to unfilter instance %s which is not '
@@ -133,6 +145,8 @@ class IptablesFirewallDriver(FirewallDriver):
     def prepare_instance_filter(self, instance, network_info):
         self.instances[instance['id']] = instance
         self.network_infos[instance['id']] = network_info
+        self.instance_security_groups.pop(instance['id'], None)
+        self._compile_security_groups([instance])
         self.add_filters_for_instance(instance)
         LOG.debug(_('Filters added to instance %s'), instance['uuid'])
         self.refresh_provider_fw_rules()
@@ -185,6 +199,16 @@ class IptablesFirewallDriver(FirewallDriver):
         if FLAGS.use_ipv6:
             self.iptables.ipv6['filter'].remove_chain(chain_name)
 
+    def _add_chain(self, chain_name):
+        self.iptables.ipv4['filter'].add_chain(chain_name)
+        if FLAGS.use_ipv6:
+            self.iptables.ipv6['filter'].add_chain(chain_name)
+
+    def _empty_chain(self, chain_name):
+        self.iptables.ipv4['filter'].empty_chain(chain_name)
+        if FLAGS.use_ipv6:
+            self.iptables.ipv6['filter'].empty_chain(chain_name)
+
     @staticmethod
     def _security_group_chain_name(security_group_id):
         return 'nova-sg-%s' % (security_group_id,)
@@ -258,8 +282,6 @@ class IptablesFirewallDriver(FirewallDriver):
                                            rule.to_port)]
 
     def instance_rules(self, instance, network_info):
-        ctxt = context.get_admin_context()
-
         ipv4_rules = []
         ipv6_rules = []
 
@@ -279,71 +301,144 @@ class IptablesFirewallDriver(FirewallDriver):
             # Allow RA responses
             self._do_ra_rules(ipv6_rules, network_info)
 
-        security_groups = db.security_group_get_by_instance(ctxt,
-                                                            instance['id'])
+        # then, jumps to the chains of the instance's security groups
+        security_group_ids = self.instance_security_groups.get(instance['id'],
+                                                               [])
+        for security_group_id in security_group_ids:
+            chain_name = self._security_group_chain_name(security_group_id)
+            ipv4_rules += ['-j $%s' % chain_name]
+            ipv6_rules += ['-j $%s' % chain_name]
 
-        # then, security group chains and rules
-        for security_group in security_groups:
-            rules = db.security_group_rule_get_by_security_group(ctxt,
-                                                          security_group['id'])
+        ipv4_rules += ['-j $sg-fallback']
+        ipv6_rules += ['-j $sg-fallback']
 
-            for rule in rules:
-                LOG.debug(_('Adding security group rule: %r'), rule)
+        return ipv4_rules, ipv6_rules
 
-                if not rule.cidr:
-                    version = 4
-                else:
-                    version = netutils.get_ip_version(rule.cidr)
+    def _security_group_rules(self, ctxt, security_group, instance_ips):
+        """Compile the rules of a security group's chain.
 
-                if version == 4:
-                    fw_rules = ipv4_rules
-                else:
-                    fw_rules = ipv6_rules
-
-                protocol = rule.protocol
-                if version == 6 and rule.protocol == 'icmp':
-                    protocol = 'icmpv6'
-
-                args = ['-j ACCEPT']
-                if protocol:
-                    args += ['-p', protocol]
-
-                if protocol in ['udp', 'tcp']:
-                    args += self._build_tcp_udp_rule(rule, version)
-                elif protocol == 'icmp':
-                    args += self._build_icmp_rule(rule, version)
-                if rule.cidr:
-                    LOG.info('Using cidr %r', rule.cidr)
-                    args += ['-s', rule.cidr]
-                    fw_rules += [' '.join(args)]
-                else:
-                    if rule['grantee_group']:
-                        # FIXME(jkoelker) This needs to be ported up into
-                        #                 the compute manager which already
-                        #                 has access to a nw_api handle,
-                        #                 and should be the only one making
-                        #                 making rpc calls.
-                        import nova.network
-                        nw_api = nova.network.API()
-                        for instance in rule['grantee_group']['instances']:
-                            LOG.info('instance: %r', instance)
-                            ips = []
-                            nw_info = nw_api.get_instance_nw_info(ctxt,
-                                                                  instance)
-                            for net in nw_info:
-                                ips.extend(net[1]['ips'])
-
-                            LOG.info('ips: %r', ips)
-                            for ip in ips:
-                                subrule = args + ['-s %s' % ip['ip']]
-                                fw_rules += [' '.join(subrule)]
-
-                LOG.info('Using fw_rules: %r', fw_rules)
-        ipv4_rules += ['-j $sg-fallback']
-        ipv6_rules += ['-j $sg-fallback']
+        instance_ips caches the addresses of the instances granted access,
+        so that each of them is only looked up once per compilation.
+        """
+        ipv4_rules = []
+        ipv6_rules = []
+
+        for rule in security_group['rules']:
+            LOG.debug(_('Adding security group rule: %r'), rule)
+
+            if not rule.cidr:
+                version = 4
+            else:
+                version = netutils.get_ip_version(rule.cidr)
+
+            if version == 4:
+                fw_rules = ipv4_rules
+            else:
+                fw_rules = ipv6_rules
+
+            protocol = rule.protocol
+            if version == 6 and rule.protocol == 'icmp':
+                protocol = 'icmpv6'
+
+            args = ['-j ACCEPT']
+            if protocol:
+                args += ['-p', protocol]
+
+            if protocol in ['udp', 'tcp']:
+                args += self._build_tcp_udp_rule(rule, version)
+            elif protocol == 'icmp':
+                args += self._build_icmp_rule(rule, version)
+            if rule.cidr:
+                LOG.info('Using cidr %r', rule.cidr)
+                args += ['-s', rule.cidr]
+                fw_rules += [' '.join(args)]
+            else:
+                if rule['grantee_group']:
+                    for instance in rule['grantee_group']['instances']:
+                        LOG.info('instance: %r', instance)
+                        ips = self._instance_ips(ctxt, instance, instance_ips)
+                        LOG.info('ips: %r', ips)
+                        for ip in ips:
+                            subrule = args + ['-s %s' % ip]
+                            fw_rules += [' '.join(subrule)]
+
+            LOG.info('Using fw_rules: %r', fw_rules)
 
         return ipv4_rules, ipv6_rules
 
+    @staticmethod
+    def _instance_ips(ctxt, instance, instance_ips):
+        if instance['id'] not in instance_ips:
+            # FIXME(jkoelker) This needs to be ported up into
+            #                 the compute manager which already
+            #                 has access to a nw_api handle,
+            #                 and should be the only one making
+            #                 making rpc calls.
+            import nova.network
+            nw_api = nova.network.API()
+            ips = []
+            nw_info = nw_api.get_instance_nw_info(ctxt, instance)
+            for net in nw_info:
+                ips.extend(ip['ip'] for ip in net[1]['ips'])
+            instance_ips[instance['id']] = ips
+        return instance_ips[instance['id']]
+
+    def _compile_security_groups(self, instances):
+        """Bring the security group chains of the instances up to date.
+
+        The security groups of all the instances are loaded at once, the
+        chains of the groups whose rules changed are rebuilt, and so are the
+        chains of the instances which joined or left a group.
+        """
+        ctxt = context.get_admin_context()
+        instance_ids = [instance['id'] for instance in instances]
+        security_groups = db.security_group_get_by_instances(ctxt,
+                                                             instance_ids)
+
+        compiled = {}
+        instance_ips = {}
+        for instance_id in instance_ids:
+            for security_group in security_groups[instance_id]:
+                if security_group['id'] not in compiled:
+                    compiled[security_group['id']] = \
+                        self._security_group_rules(ctxt, security_group,
+                                                   instance_ips)
+
+        for security_group_id, rules in compiled.iteritems():
+            if self.security_group_chains.get(security_group_id) == rules:
+                continue
+            chain_name = self._security_group_chain_name(security_group_id)
+            LOG.debug(_('Building chain of security group %s'),
+                      security_group_id)
+            self._add_chain(chain_name)
+            self._empty_chain(chain_name)
+            self._add_filters(chain_name, *rules)
+            self.security_group_chains[security_group_id] = rules
+
+        for instance in instances:
+            security_group_ids = [security_group['id'] for security_group
+                                  in security_groups[instance['id']]]
+            old_ids = self.instance_security_groups.get(instance['id'])
+            self.instance_security_groups[instance['id']] = security_group_ids
+            if old_ids is not None and old_ids != security_group_ids:
+                LOG.debug(_('Rebuilding chain of instance %s'),
+                          instance['uuid'])
+                self.remove_filters_for_instance(instance)
+                self.add_filters_for_instance(instance)
+
+        self._remove_unused_security_group_chains()
+
+    def _remove_unused_security_group_chains(self):
+        used = set()
+        for security_group_ids in self.instance_security_groups.values():
+            used.update(security_group_ids)
+        for security_group_id in set(self.security_group_chains) - used:
+            chain_name = self._security_group_chain_name(security_group_id)
+            self.iptables.ipv4['filter'].remove_chain(chain_name)
+            if FLAGS.use_ipv6:
+                self.iptables.ipv6['filter'].remove_chain(chain_name)
+            del self.security_group_chains[security_group_id]
+
     def instance_filter_exists(self, instance, network_info):
         pass
 
@@ -357,9 +452,7 @@ class IptablesFirewallDriver(FirewallDriver):
 
     @utils.synchronized('iptables', external=True)
     def do_refresh_security_group_rules(self, security_group):
-        for instance in self.instances.values():
-            self.remove_filters_for_instance(instance)
-            self.add_filters_for_instance(instance)
+        self._compile_security_groups(self.instances.values())
 
     def refresh_provider_fw_rules(self):
         """See class:FirewallDriver: docs."""
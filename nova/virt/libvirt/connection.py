@@ -39,6 +39,7 @@ Supports KVM, LXC, QEMU, UML, and XEN.
 
 """
 
+import collections
 import hashlib
 import functools
 import multiprocessing
@@ -49,6 +50,7 @@ import tempfile
 import uuid
 
 from eventlet import greenthread
+from eventlet import tpool
 from xml.dom import minidom
 from xml.etree import ElementTree
 
@@ -56,6 +58,7 @@ from nova.auth import manager
 from nova import block_device
 from nova.compute import instance_types
 from nova.compute import power_state
+from nova.compute import utils as compute_utils
 from nova import context as nova_context
 from nova import db
 from nova import exception
@@ -91,6 +94,11 @@ libvirt_opts = [
     cfg.StrOpt('libvirt_xml_template',
                default=utils.abspath('virt/libvirt.xml.template'),
                help='Libvirt XML Template'),
+    cfg.StrOpt('config_drive_format',
+               default='msdos',
+               help='Format of the config drives made for instances: '
+                    '"msdos" images are mounted to inject the data, '
+                    '"iso9660" images are written without mounts or root'),
     cfg.StrOpt('libvirt_type',
                default='kvm',
                help='Libvirt domain type (valid options are: '
@@ -123,6 +131,18 @@ libvirt_opts = [
                help='Snapshot image format (valid options are : '
                     'raw, qcow2, vmdk, vdi). '
                     'Defaults to same as source image'),
+    cfg.StrOpt('libvirt_snapshots_directory',
+               default=None,
+               help='Directory where snapshots are extracted before they '
+                    'are uploaded. Defaults to the system temp directory'),
+    cfg.BoolOpt('libvirt_snapshot_compression',
+                default=False,
+                help='Compress the snapshots extracted in qcow2 format'),
+    cfg.BoolOpt('libvirt_lifecycle_events',
+                default=True,
+                help='Have libvirt report the power state changes of the '
+                     'instances as they happen, so they are not only found '
+                     'by polling'),
     cfg.StrOpt('libvirt_vif_type',
                default='bridge',
                help='Type of VIF to create.'),
@@ -179,6 +199,64 @@ def _get_eph_disk(ephemeral):
     return 'disk.eph' + str(ephemeral['num'])
 
 
+class _UploadReader(object):
+    """Reads an extracted snapshot in chunks for the image service.
+
+    The image is handed over a chunk at a time rather than as a real file,
+    so it is streamed to the image service without being loaded whole, and
+    progress(step, total_steps) is called each time another tenth of it
+    has been read.  Its size is still known through seek(), tell() and
+    len(), but not its fileno(), as sending the file with sendfile()
+    would bypass the progress reports.
+    """
+
+    def __init__(self, fileobj, progress, chunk_size=64 * 1024,
+                 total_steps=10):
+        self.fileobj = fileobj
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self.total_steps = total_steps
+        self.step = 0
+        self.offset = 0
+        fileobj.seek(0, os.SEEK_END)
+        self.size = fileobj.tell()
+        fileobj.seek(0)
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.size - self.offset
+        data = self.fileobj.read(min(size, self.chunk_size))
+        self.offset += len(data)
+        self._report()
+        return data
+
+    def _report(self):
+        if self.size:
+            step = self.offset * self.total_steps // self.size
+        else:
+            step = self.total_steps
+        if step > self.step:
+            self.step = step
+            self.progress(step, self.total_steps)
+
+    def seek(self, offset, whence=os.SEEK_SET):
+        self.fileobj.seek(offset, whence)
+        self.offset = self.fileobj.tell()
+
+    def tell(self):
+        return self.offset
+
+    def __len__(self):
+        return self.size
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                break
+            yield chunk
+
+
 class LibvirtConnection(driver.ComputeDriver):
 
     def __init__(self, read_only):
@@ -187,6 +265,8 @@ class LibvirtConnection(driver.ComputeDriver):
         self._host_state = None
         self._initiator = None
         self._wrapped_conn = None
+        self._event_callback = None
+        self._pending_events = collections.deque()
         self.container = None
         self.read_only = read_only
         if FLAGS.firewall_driver not in firewall.drivers:
@@ -243,6 +323,10 @@ class LibvirtConnection(driver.ComputeDriver):
             LOG.debug(_('Connecting to libvirt: %s'), self.uri)
             self._wrapped_conn = self._connect(self.uri,
                                                self.read_only)
+            if self._event_callback:
+                self._wrapped_conn.domainEventRegisterAny(None,
+                        libvirt.VIR_DOMAIN_EVENT_ID_LIFECYCLE,
+                        self._lifecycle_event, None)
         return self._wrapped_conn
     _conn = property(_get_connection)
 
@@ -281,6 +365,66 @@ class LibvirtConnection(driver.ComputeDriver):
         else:
             return libvirt.openAuth(uri, auth, 0)
 
+    def register_event_listener(self, callback):
+        """Pass the lifecycle events of the domains on to callback.
+
+        libvirt's default event loop runs in a native thread through tpool
+        and queues the power state changes, which are handed to callback
+        from a greenthread each time the loop returns.
+        """
+        if not FLAGS.libvirt_lifecycle_events:
+            return False
+        try:
+            libvirt.virEventRegisterDefaultImpl()
+        except (AttributeError, libvirt.libvirtError), e:
+            LOG.warn(_('Domain lifecycle events are unavailable, power '
+                       'state changes will only be found by polling: %s'), e)
+            return False
+
+        self._event_callback = callback
+        greenthread.spawn(self._run_event_loop)
+        # Connections only get events once the event loop is
+        # registered, so reconnect now rather than on the next call
+        self._wrapped_conn = None
+        self._get_connection()
+        return True
+
+    def _run_event_loop(self):
+        while True:
+            try:
+                tpool.execute(libvirt.virEventRunDefaultImpl)
+            except Exception:
+                LOG.exception(_('Error in the libvirt event loop'))
+                greenthread.sleep(1)
+            self._dispatch_pending_events()
+
+    def _lifecycle_event(self, conn, dom, event, detail, opaque):
+        """Called by libvirt in the event loop's native thread.
+
+        Nothing but the event queue may be touched here, as the greenthreads
+        run in another thread.
+        """
+        power_states = {
+            libvirt.VIR_DOMAIN_EVENT_STARTED: power_state.RUNNING,
+            libvirt.VIR_DOMAIN_EVENT_RESUMED: power_state.RUNNING,
+            libvirt.VIR_DOMAIN_EVENT_SUSPENDED: power_state.PAUSED,
+            libvirt.VIR_DOMAIN_EVENT_STOPPED: power_state.SHUTOFF,
+        }
+        if event in power_states:
+            self._pending_events.append((dom.UUIDString(),
+                                         power_states[event]))
+
+    def _dispatch_pending_events(self):
+        # Only popleft() is used here while the event loop's thread
+        # appends, which a deque allows without a lock.
+        while self._pending_events:
+            instance_uuid, state = self._pending_events.popleft()
+            try:
+                self._event_callback(instance_uuid, state)
+            except Exception:
+                LOG.exception(_('Error handling the power state change of '
+                                '%s'), instance_uuid)
+
     def instance_exists(self, instance_id):
         """Efficient override of base instance_exists method."""
         try:
@@ -555,23 +699,32 @@ class LibvirtConnection(driver.ComputeDriver):
         disk_path = source.get('file')
 
         # Export the snapshot to a raw image
-        temp_dir = tempfile.mkdtemp()
+        temp_dir = tempfile.mkdtemp(dir=FLAGS.libvirt_snapshots_directory)
         try:
             out_path = os.path.join(temp_dir, snapshot_name)
-            libvirt_utils.extract_snapshot(disk_path, source_format,
-                                           snapshot_name, out_path,
-                                           image_format)
+            try:
+                libvirt_utils.extract_snapshot(disk_path, source_format,
+                        snapshot_name, out_path, image_format,
+                        compress=FLAGS.libvirt_snapshot_compression)
+            finally:
+                # The guest's disk no longer needs the snapshot once
+                # it is extracted, so don't keep it during the upload
+                snapshot_ptr.delete(0)
+
             # Upload that image to the image service
             with libvirt_utils.file_open(out_path) as image_file:
+                def _progress(step, total_steps):
+                    compute_utils.update_instance_progress(context, instance,
+                                                           step, total_steps)
+
                 image_service.update(context,
                                      image_href,
                                      metadata,
-                                     image_file)
+                                     _UploadReader(image_file, _progress))
 
         finally:
             # Clean up
             shutil.rmtree(temp_dir)
-            snapshot_ptr.delete(0)
 
     @exception.wrap_exception()
     def reboot(self, instance, network_info, reboot_type=None, xml=None):
@@ -874,6 +1027,39 @@ class LibvirtConnection(driver.ComputeDriver):
                 if size:
                     disk.extend(target, size)
 
+    def prefetch_image(self, context, instance, image_meta):
+        """Fetch the kernel, ramdisk and root images into the base cache"""
+        fetches = []
+        if instance['kernel_id']:
+            fetches.append((instance['kernel_id'], instance['kernel_id']))
+            if instance['ramdisk_id']:
+                fetches.append((instance['ramdisk_id'],
+                               instance['ramdisk_id']))
+        if instance['image_ref']:
+            root_fname = hashlib.sha1(str(instance['image_ref'])).hexdigest()
+            fetches.append((root_fname, instance['image_ref']))
+
+        user_id = instance['user_id']
+        project_id = instance['project_id']
+        base_dir = os.path.join(FLAGS.instances_path, '_base')
+        if not os.path.exists(base_dir):
+            libvirt_utils.ensure_tree(base_dir)
+
+        for fname, image_id in fetches:
+            base = os.path.join(base_dir, fname)
+
+            # Same lock as _cache_image, so a spawn that needs the
+            # image waits for the prefetch rather than fetching again.
+            @utils.synchronized(fname)
+            def fetch_if_not_exists():
+                if not os.path.exists(base):
+                    libvirt_utils.fetch_image(context=context,
+                                              target=base,
+                                              image_id=image_id,
+                                              user_id=user_id,
+                                              project_id=project_id)
+            fetch_if_not_exists()
+
     @staticmethod
     def _fetch_image(context, target, image_id, user_id, project_id):
         """Grab image to raw format"""
@@ -1044,7 +1230,7 @@ class LibvirtConnection(driver.ComputeDriver):
                               image_id=config_drive_id,
                               user_id=instance['user_id'],
                               project_id=instance['project_id'],)
-        elif config_drive:
+        elif config_drive and FLAGS.config_drive_format != 'iso9660':
             self._create_local(basepath('disk.config'), 64, unit='M',
                                fs_format='msdos')  # 64MB
 
@@ -1092,7 +1278,11 @@ class LibvirtConnection(driver.ComputeDriver):
                                             'use_ipv6': FLAGS.use_ipv6}]))
 
         metadata = instance.get('metadata')
-        if any((key, net, metadata)):
+        if config_drive and FLAGS.config_drive_format == 'iso9660':
+            LOG.info(_('Creating config drive'), instance=instance)
+            disk.make_config_drive_iso(basepath('disk.config'), key, net,
+                                       metadata)
+        elif any((key, net, metadata)):
             instance_name = instance['name']
 
             if config_drive:  # Should be True or None by now.
@@ -486,6 +486,8 @@ class IptablesFirewallDriver(base_firewall.IptablesFirewallDriver):
             # NOTE(vish): use the passed info instead of the stored info
             self.network_infos.pop(instance['id'])
             self.remove_filters_for_instance(instance)
+            self.instance_security_groups.pop(instance['id'], None)
+            self._remove_unused_security_group_chains()
             self.iptables.apply()
             self.nwfilter.unfilter_instance(instance, network_info)
         else:
@@ -0,0 +1,186 @@
+# vim: tabstop=4 shiftwidth=4 softtabstop=4
+
+# Copyright 2012 OpenStack LLC.
+#
+#    Licensed under the Apache License, Version 2.0 (the "License"); you may
+#    not use this file except in compliance with the License. You may obtain
+#    a copy of the License at
+#
+#         http://www.apache.org/licenses/LICENSE-2.0
+#
+#    Unless required by applicable law or agreed to in writing, software
+#    distributed under the License is distributed on an "AS IS" BASIS, WITHOUT
+#    WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied. See the
+#    License for the specific language governing permissions and limitations
+#    under the License.
+
+"""
+Keeps an in-process copy of the XenAPI records for this host up to date
+by following the XenAPI event stream.
+
+The watcher loads every record of the watched classes once and then
+applies the add/mod/del events returned by event.from (or event.next on
+older hosts) as they arrive.  Readers such as power state sync,
+diagnostics and bandwidth polling can then be answered from memory
+instead of making XenAPI calls to dom0.
+"""
+
+from eventlet import greenthread
+
+from nova import flags
+from nova import log as logging
+from nova.openstack.common import cfg
+
+
+LOG = logging.getLogger("nova.virt.xenapi.event_watcher")
+
+xenapi_event_opts = [
+    cfg.BoolOpt('xenapi_use_event_cache',
+                default=False,
+                help='Keep an in-process cache of VM, VIF and VBD records '
+                     'current using the XenAPI event stream.'),
+    cfg.FloatOpt('xenapi_event_timeout',
+                 default=30.0,
+                 help='Number of seconds a single event.from call waits '
+                      'for new events.'),
+    cfg.FloatOpt('xenapi_event_retry_interval',
+                 default=5.0,
+                 help='Number of seconds to wait before resynchronising '
+                      'the cache after the event stream failed.'),
+    ]
+
+FLAGS = flags.FLAGS
+FLAGS.register_opts(xenapi_event_opts)
+
+
+class EventWatcher(object):
+    """Cache of XenAPI records kept current by the XenAPI event stream."""
+
+    WATCHED_CLASSES = ('VM', 'VIF', 'VBD')
+
+    def __init__(self, session, classes=WATCHED_CLASSES):
+        self.XenAPI = session.get_imported_xenapi()
+        self._session = session
+        self._classes = tuple(classes)
+        self._records = dict((cls, {}) for cls in self._classes)
+        self._token = ''
+        self._use_event_from = True
+        self._ready = False
+        self._running = False
+        self._thread = None
+
+    @property
+    def ready(self):
+        """True once the cache holds a consistent copy of the records."""
+        return self._ready
+
+    def watches(self, cls):
+        return cls in self._records
+
+    def start(self):
+        """Load the records and follow the event stream in the background."""
+        if self._running:
+            return
+        self._running = True
+        self._thread = greenthread.spawn(self._watch)
+
+    def stop(self):
+        self._running = False
+        self._ready = False
+        if self._thread:
+            self._thread.kill()
+            self._thread = None
+
+    def get_all_records(self, cls):
+        """Return a dict of ref -> record for every object of `cls`."""
+        if not (self._ready and self.watches(cls)):
+            return self._session.call_xenapi('%s.get_all_records' % cls)
+        return dict(self._records[cls])
+
+    def get_record(self, cls, ref):
+        """Return the record for `ref`, or None if it does not exist."""
+        if not (self._ready and self.watches(cls)):
+            try:
+                return self._session.call_xenapi('%s.get_record' % cls, ref)
+            except self.XenAPI.Failure:
+                return None
+        return self._records[cls].get(ref)
+
+    def refresh(self):
+        """Reload every watched record from the host."""
+        self._ready = False
+        self._records = dict((cls, {}) for cls in self._classes)
+        if self._use_event_from:
+            # An empty token makes event.from return every existing
+            # object as an event, which loads all of the watched
+            # classes in one call and hands back the token to
+            # follow the stream from.
+            try:
+                result = self._session.call_xenapi_event('event.from',
+                        list(self._classes), '', 0.0)
+            except self.XenAPI.Failure, exc:
+                if exc.details[0] != 'MESSAGE_METHOD_UNKNOWN':
+                    raise
+                LOG.info(_("event.from is not supported, falling back to "
+                           "event.next"))
+                self._use_event_from = False
+            else:
+                self._token = result['token']
+                self.process_events(result['events'])
+
+        if not self._use_event_from:
+            # Register before loading so that no change made while
+            # the records are fetched can be missed.
+            self._session.call_xenapi_event('event.register',
+                                            list(self._classes))
+            for cls in self._classes:
+                self._records[cls] = self._session.call_xenapi(
+                        '%s.get_all_records' % cls)
+
+        self._ready = True
+        LOG.debug(_("Loaded XenAPI records for %s"), ', '.join(self._classes))
+
+    def process_events(self, events):
+        """Apply a batch of XenAPI events to the cached records."""
+        class_map = dict((cls.lower(), cls) for cls in self._classes)
+        for event in events:
+            cls = class_map.get(event['class'].lower())
+            if cls is None:
+                continue
+            ref = event['ref']
+            if event['operation'] == 'del':
+                self._records[cls].pop(ref, None)
+            elif 'snapshot' in event:
+                self._records[cls][ref] = event['snapshot']
+            else:
+                # Event.next on some hosts does not include the
+                # snapshot, so fetch the record itself.
+                try:
+                    self._records[cls][ref] = self._session.call_xenapi(
+                            '%s.get_record' % cls, ref)
+                except self.XenAPI.Failure:
+                    self._records[cls].pop(ref, None)
+
+    def _next_events(self):
+        if self._use_event_from:
+            result = self._session.call_xenapi_event('event.from',
+                    list(self._classes), self._token,
+                    FLAGS.xenapi_event_timeout)
+            self._token = result['token']
+            return result['events']
+        return self._session.call_xenapi_event('event.next')
+
+    def _watch(self):
+        while self._running:
+            try:
+                if not self._ready:
+                    self.refresh()
+                self.process_events(self._next_events())
+            except Exception, exc:
+                # EVENTS_LOST means the host dropped events we had
+                # not read yet; anything else may mean the same, so
+                # resynchronise from scratch in both cases.
+                self._ready = False
+                LOG.warn(_("XenAPI event stream interrupted, reloading "
+                           "records: %s"), exc)
+                greenthread.sleep(FLAGS.xenapi_event_retry_interval)
@@ -20,8 +20,10 @@ Helper methods for operations related to the management of VM records and
 their attributes like VDIs, VIFs, as well as their lookup functions.
 """
 
+import array
 import contextlib
 import json
+import math
 import os
 import pickle
 import re
@@ -30,8 +32,7 @@ import tempfile
 import time
 import urllib
 import uuid
-from decimal import Decimal, InvalidOperation
-from xml.dom import minidom
+from xml.etree import cElementTree as ElementTree
 
 from eventlet import greenthread
 
@@ -914,19 +915,14 @@ class VMHelper(HelperBase):
 
         try:
             diags = {}
-            xml = get_rrd(host_ip, record["uuid"])
-            if xml:
-                rrd = minidom.parseString(xml)
-                for i, node in enumerate(rrd.firstChild.childNodes):
-                    # We don't want all of the extra garbage
-                    if i >= 3 and i <= 11:
-                        ref = node.childNodes
-                        # Name and Value
-                        if len(ref) > 6:
-                            _ref_zero = ref[0].firstChild.data
-                            diags[_ref_zero] = ref[6].firstChild.data
+            rrd = open_rrd(host_ip, record["uuid"])
+            if rrd:
+                try:
+                    diags = parse_rrd_diagnostics(rrd)
+                finally:
+                    rrd.close()
             return diags
-        except cls.XenAPI.Failure as e:
+        except (cls.XenAPI.Failure, SyntaxError) as e:
             return {"Unable to retrieve diagnostics": e}
 
     @classmethod
@@ -940,10 +936,14 @@ class VMHelper(HelperBase):
         except (cls.XenAPI.Failure, KeyError) as e:
             raise exception.CouldNotFetchMetrics()
 
-        xml = get_rrd_updates(host_ip, start_time)
-        if xml:
-            doc = minidom.parseString(xml)
-            return parse_rrd_update(doc, start_time, stop_time)
+        rrd = open_rrd_updates(host_ip, start_time)
+        if rrd:
+            try:
+                return parse_rrd_updates(rrd, start_time, stop_time)
+            except SyntaxError:
+                LOG.exception(_("Unable to parse RRD updates"))
+            finally:
+                rrd.close()
 
         raise exception.CouldNotFetchMetrics()
 
@@ -1049,113 +1049,125 @@ class VMHelper(HelperBase):
         return None
 
 
-def get_rrd(host, vm_uuid):
-    """Return the VM RRD XML as a string"""
+def _open_rrd_url(url):
+    """Return a file-like object streaming the RRD document at url"""
     try:
-        xml = urllib.urlopen("http://%s:%s@%s/vm_rrd?uuid=%s" % (
-            FLAGS.xenapi_connection_username,
-            FLAGS.xenapi_connection_password,
-            host,
-            vm_uuid))
-        return xml.read()
+        return urllib.urlopen(url)
     except IOError:
         return None
 
 
-def get_rrd_updates(host, start_time):
-    """Return the RRD updates XML as a string"""
-    try:
-        xml = urllib.urlopen("http://%s:%s@%s/rrd_updates?start=%s" % (
-            FLAGS.xenapi_connection_username,
-            FLAGS.xenapi_connection_password,
-            host,
-            start_time))
-        return xml.read()
-    except IOError:
-        return None
+def open_rrd(host, vm_uuid):
+    """Return the VM RRD XML as a file-like object"""
+    return _open_rrd_url("http://%s:%s@%s/vm_rrd?uuid=%s" % (
+        FLAGS.xenapi_connection_username,
+        FLAGS.xenapi_connection_password,
+        host,
+        vm_uuid))
+
+
+def open_rrd_updates(host, start_time):
+    """Return the RRD updates XML as a file-like object"""
+    return _open_rrd_url("http://%s:%s@%s/rrd_updates?start=%s" % (
+        FLAGS.xenapi_connection_username,
+        FLAGS.xenapi_connection_password,
+        host,
+        start_time))
+
 
+def parse_rrd_diagnostics(source, max_sources=9):
+    """Return a dict of data source name -> last value from a VM RRD.
 
-def parse_rrd_meta(doc):
-    data = {}
-    meta = doc.getElementsByTagName('meta')[0]
-    for tag in ('start', 'end', 'step'):
-        data[tag] = int(meta.getElementsByTagName(tag)[0].firstChild.data)
-    legend = meta.getElementsByTagName('legend')[0]
-    data['legend'] = [child.firstChild.data for child in legend.childNodes]
-    return data
+    Only the first `max_sources` data sources are wanted, so parsing stops
+    as soon as they have been read, before the archived data is reached.
+    """
+    diags = {}
+    count = 0
+    for event, elem in ElementTree.iterparse(source):
+        if elem.tag == 'ds':
+            fields = list(elem)
+            if len(fields) > 6:
+                diags[fields[0].text] = fields[6].text
+            count += 1
+            if count >= max_sources:
+                break
+        elif elem.tag == 'rra':
+            break
+    return diags
 
 
-def parse_rrd_data(doc):
-    dnode = doc.getElementsByTagName('data')[0]
-    return [dict(
-            time=int(child.getElementsByTagName('t')[0].firstChild.data),
-            values=[Decimal(valnode.firstChild.data)
-                  for valnode in child.getElementsByTagName('v')])
-            for child in dnode.childNodes]
+def parse_rrd_updates(source, start, until=None):
+    """Compute per-VM metrics from an rrd_updates document.
 
+    The document is read incrementally and every row is folded into
+    running per-column totals as soon as it is parsed, then discarded, so
+    memory use depends on the number of columns rather than the number of
+    rows.  vif columns are integrated over time, everything else is
+    averaged.
+
+    rrd_updates lists rows newest first.  The trapezoid for each pair of
+    adjacent rows does not depend on the order they are visited in, so
+    the integral is accumulated in stream order and the segment between
+    `start` and the oldest row is added at the end.
+    """
+    legend = []
+    data_elem = None
+    integrals = averages = counts = newer = None
+    newer_time = None
+    start = int(start)
+
+    for event, elem in ElementTree.iterparse(source, events=('start', 'end')):
+        if event == 'start':
+            if elem.tag == 'data':
+                data_elem = elem
+            continue
+
+        if elem.tag == 'entry':
+            legend.append(elem.text)
+        elif elem.tag == 'legend':
+            ncols = len(legend)
+            integrals = array.array('d', [0.0] * ncols)
+            averages = array.array('d', [0.0] * ncols)
+            counts = array.array('l', [0] * ncols)
+        elif elem.tag == 'row':
+            row_time = int(elem.findtext('t'))
+            if not until or row_time <= until:
+                values = array.array('d', [float(v.text)
+                                           for v in elem.findall('v')])
+                for col, val in enumerate(values):
+                    # NOTE(mdragon): Xenserver occasionally returns odd
+                    # values (see bug 918490); leave them out of averages
+                    # and count them as zero traffic.
+                    finite = not (math.isnan(val) or math.isinf(val))
+                    if finite:
+                        averages[col] += val
+                        counts[col] += 1
+                    else:
+                        values[col] = 0.0
+                    if newer is not None:
+                        integrals[col] += (0.5 * (values[col] + newer[col]) *
+                                           (newer_time - row_time))
+                newer = values
+                newer_time = row_time
+            if data_elem is not None:
+                data_elem.clear()
 
-def parse_rrd_update(doc, start, until=None):
     sum_data = {}
-    meta = parse_rrd_meta(doc)
-    data = parse_rrd_data(doc)
-    for col, collabel in enumerate(meta['legend']):
+    for col, collabel in enumerate(legend):
         datatype, objtype, uuid, name = collabel.split(':')
-        vm_data = sum_data.get(uuid, dict())
+        vm_data = sum_data.setdefault(uuid, {})
         if name.startswith('vif'):
-            vm_data[name] = integrate_series(data, col, start, until)
+            total = integrals[col]
+            if newer is not None:
+                total += newer[col] * (newer_time - start)
+            vm_data[name] = round(total, 4)
+        elif counts[col]:
+            vm_data[name] = round(averages[col] / counts[col], 4)
         else:
-            vm_data[name] = average_series(data, col, start, until)
-        sum_data[uuid] = vm_data
+            vm_data[name] = 0.0
     return sum_data
 
 
-def average_series(data, col, start, until=None):
-    vals = [row['values'][col] for row in data
-            if (not until or (row['time'] <= until)) and
-                row['values'][col].is_finite()]
-    if vals:
-        try:
-            return (sum(vals) / len(vals)).quantize(Decimal('1.0000'))
-        except InvalidOperation:
-            # (mdragon) Xenserver occasionally returns odd values in
-            # data that will throw an error on averaging (see bug 918490)
-            # These are hard to find, since, whatever those values are,
-            # Decimal seems to think they are a valid number, sortof.
-            # We *think* we've got the the cases covered, but just in
-            # case, log and return NaN, so we don't break reporting of
-            # other statistics.
-            LOG.error(_("Invalid statistics data from Xenserver: %s")
-                      % str(vals))
-            return Decimal('NaN')
-    else:
-        return Decimal('0.0000')
-
-
-def integrate_series(data, col, start, until=None):
-    total = Decimal('0.0000')
-    prev_time = int(start)
-    prev_val = None
-    for row in reversed(data):
-        if not until or (row['time'] <= until):
-            time = row['time']
-            val = row['values'][col]
-            if val.is_nan():
-                val = Decimal('0.0000')
-            if prev_val is None:
-                prev_val = val
-            if prev_val >= val:
-                total += ((val * (time - prev_time)) +
-                          (Decimal('0.5000') * (prev_val - val) *
-                          (time - prev_time)))
-            else:
-                total += ((prev_val * (time - prev_time)) +
-                          (Decimal('0.5000') * (val - prev_val) *
-                          (time - prev_time)))
-            prev_time = time
-            prev_val = val
-    return total.quantize(Decimal('1.0000'))
-
-
 #TODO(sirp): This code comes from XS5.6 pluginlib.py, we should refactor to
 # use that implmenetation
 def get_vhd_parent(session, vdi_rec):
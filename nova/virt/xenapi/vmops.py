@@ -33,6 +33,7 @@ from eventlet import greenthread
 
 from nova.compute import api as compute
 from nova.compute import power_state
+from nova.compute import utils as compute_utils
 from nova import context as nova_context
 from nova import db
 from nova import exception
@@ -100,10 +101,11 @@ class VMOps(object):
     """
     Management class for VM-related tasks
     """
-    def __init__(self, session, product_version):
+    def __init__(self, session, product_version, event_watcher=None):
         self.XenAPI = session.get_imported_xenapi()
         self.compute_api = compute.API()
         self._session = session
+        self._event_watcher = event_watcher
         self.poll_rescue_last_ran = None
         VMHelper.XenAPI = self.XenAPI
         if FLAGS.firewall_driver not in firewall.drivers:
@@ -114,20 +116,41 @@ class VMOps(object):
         self.vif_driver = vif_impl(xenapi_session=self._session)
         self._product_version = product_version
 
+    def _get_all_records(self, record_type):
+        """Return every record of a type, from the event cache if one is
+        running, otherwise with a single bulk XenAPI call."""
+        if self._event_watcher:
+            return self._event_watcher.get_all_records(record_type)
+        return self._session.call_xenapi('%s.get_all_records' % record_type)
+
+    def _list_vms(self):
+        for vm_ref, vm_rec in self._get_all_records('VM').iteritems():
+            if vm_rec["is_a_template"] or vm_rec["is_control_domain"]:
+                continue
+            yield vm_ref, vm_rec
+
+    def _get_cached_vm_rec(self, instance):
+        """Return the cached record for an instance, or None if there is
+        no event cache or the instance cannot be found in it."""
+        if not (self._event_watcher and self._event_watcher.ready):
+            return None
+        if isinstance(instance, basestring):
+            name_label = instance
+        else:
+            name_label = getattr(instance, 'name', None)
+        for vm_ref, vm_rec in self._list_vms():
+            if vm_rec["name_label"] == name_label:
+                return vm_rec
+        return None
+
     def list_instances(self):
         """List VM instances."""
-        # TODO(justinsb): Should we just always use the details method?
-        #  Seems to be the same number of API calls..
-        name_labels = []
-        for vm_ref, vm_rec in VMHelper.list_vms(self._session):
-            name_labels.append(vm_rec["name_label"])
-
-        return name_labels
+        return [vm_rec["name_label"] for vm_ref, vm_rec in self._list_vms()]
 
     def list_instances_detail(self):
         """List VM instances, returning InstanceInfo objects."""
         details = []
-        for vm_ref, vm_rec in VMHelper.list_vms(self._session):
+        for vm_ref, vm_rec in self._list_vms():
             name = vm_rec["name_label"]
 
             # TODO(justinsb): This a roundabout way to map the state
@@ -170,9 +193,9 @@ class VMOps(object):
 
         # 5. Start VM
         self._start(instance, vm_ref=vm_ref)
-        self._update_instance_progress(context, instance,
-                                       step=5,
-                                       total_steps=RESIZE_TOTAL_STEPS)
+        compute_utils.update_instance_progress(
+                context, instance, step=5,
+                total_steps=RESIZE_TOTAL_STEPS)
 
     def _start(self, instance, vm_ref=None):
         """Power on a VM instance"""
@@ -207,22 +230,22 @@ class VMOps(object):
             # progress remaining at 0% for too long, which will appear to be
             # an error, we insert a "vanity" step to bump the progress up one
             # notch above 0.
-            self._update_instance_progress(context, instance,
-                                           step=1,
-                                           total_steps=BUILD_TOTAL_STEPS)
+            compute_utils.update_instance_progress(
+                    context, instance, step=1,
+                    total_steps=BUILD_TOTAL_STEPS)
 
             # 2. Fetch the Image over the Network
             vdis = self._create_disks(context, instance, image_meta)
-            self._update_instance_progress(context, instance,
-                                           step=2,
-                                           total_steps=BUILD_TOTAL_STEPS)
+            compute_utils.update_instance_progress(
+                    context, instance, step=2,
+                    total_steps=BUILD_TOTAL_STEPS)
 
             # 3. Create the VM records
             vm_ref = self._create_vm(context, instance, vdis, network_info,
                                      image_meta)
-            self._update_instance_progress(context, instance,
-                                           step=3,
-                                           total_steps=BUILD_TOTAL_STEPS)
+            compute_utils.update_instance_progress(
+                    context, instance, step=3,
+                    total_steps=BUILD_TOTAL_STEPS)
             # 4. Prepare security group filters
             # NOTE(salvatore-orlando): setup_basic_filtering might be empty or
             # not implemented at all, as basic filter could be implemented
@@ -239,9 +262,9 @@ class VMOps(object):
             self._spawn(instance, vm_ref)
             # The VM has started, let's ensure the security groups are enforced
             self.firewall_driver.apply_instance_filter(instance, network_info)
-            self._update_instance_progress(context, instance,
-                                           step=4,
-                                           total_steps=BUILD_TOTAL_STEPS)
+            compute_utils.update_instance_progress(
+                    context, instance, step=4,
+                    total_steps=BUILD_TOTAL_STEPS)
 
         except (self.XenAPI.Failure, OSError, IOError) as spawn_error:
             LOG.exception(_("instance %s: Failed to spawn"),
@@ -687,24 +710,6 @@ class VMOps(object):
     def _get_orig_vm_name_label(self, instance):
         return instance.name + '-orig'
 
-    def _update_instance_progress(self, context, instance, step, total_steps):
-        """Update instance progress percent to reflect current step number
-        """
-        # FIXME(sirp): for now we're taking a KISS approach to instance
-        # progress:
-        # Divide the action's workflow into discrete steps and "bump" the
-        # instance's progress field as each step is completed.
-        #
-        # For a first cut this should be fine, however, for large VM images,
-        # the _create_disks step begins to dominate the equation. A
-        # better approximation would use the percentage of the VM image that
-        # has been streamed to the destination host.
-        progress = round(float(step) / total_steps * 100)
-        instance_uuid = instance['uuid']
-        LOG.debug(_("Updating instance '%(instance_uuid)s' progress to"
-                    " %(progress)d") % locals())
-        db.instance_update(context, instance_uuid, {'progress': progress})
-
     def migrate_disk_and_power_off(self, context, instance, dest,
                                    instance_type):
         """Copies a VHD from one host machine to another, possibly
@@ -716,9 +721,9 @@ class VMOps(object):
 
         """
         # 0. Zero out the progress to begin
-        self._update_instance_progress(context, instance,
-                                       step=0,
-                                       total_steps=RESIZE_TOTAL_STEPS)
+        compute_utils.update_instance_progress(
+                context, instance, step=0,
+                total_steps=RESIZE_TOTAL_STEPS)
 
         vm_ref = VMHelper.lookup(self._session, instance.name)
 
@@ -732,9 +737,9 @@ class VMOps(object):
             # 1. Create Snapshot
             _snapshot_info = self._create_snapshot(instance)
             template_vm_ref, template_vdi_uuids = _snapshot_info
-            self._update_instance_progress(context, instance,
-                                           step=1,
-                                           total_steps=RESIZE_TOTAL_STEPS)
+            compute_utils.update_instance_progress(
+                    context, instance, step=1,
+                    total_steps=RESIZE_TOTAL_STEPS)
 
             base_copy_uuid = template_vdi_uuids['image']
             _vdi_info = VMHelper.get_vdi_for_vm_safely(self._session, vm_ref)
@@ -754,24 +759,24 @@ class VMOps(object):
 
                 # 2. Power down the instance before resizing
                 self._shutdown(instance, vm_ref, hard=False)
-                self._update_instance_progress(context, instance,
-                                               step=2,
-                                               total_steps=RESIZE_TOTAL_STEPS)
+                compute_utils.update_instance_progress(
+                        context, instance, step=2,
+                        total_steps=RESIZE_TOTAL_STEPS)
 
                 # 3. Copy VDI, resize partition and filesystem, forget VDI,
                 # truncate VHD
                 new_ref, new_uuid = VMHelper.resize_disk(self._session,
                                                          vdi_ref,
                                                          instance_type)
-                self._update_instance_progress(context, instance,
-                                               step=3,
-                                               total_steps=RESIZE_TOTAL_STEPS)
+                compute_utils.update_instance_progress(
+                        context, instance, step=3,
+                        total_steps=RESIZE_TOTAL_STEPS)
 
                 # 4. Transfer the new VHD
                 self._migrate_vhd(instance, new_uuid, dest, sr_path)
-                self._update_instance_progress(context, instance,
-                                               step=4,
-                                               total_steps=RESIZE_TOTAL_STEPS)
+                compute_utils.update_instance_progress(
+                        context, instance, step=4,
+                        total_steps=RESIZE_TOTAL_STEPS)
 
                 # Clean up VDI now that it's been copied
                 VMHelper.destroy_vdi(self._session, new_ref)
@@ -786,21 +791,21 @@ class VMOps(object):
 
                 # 2. Transfer the base copy
                 self._migrate_vhd(instance, base_copy_uuid, dest, sr_path)
-                self._update_instance_progress(context, instance,
-                                               step=2,
-                                               total_steps=RESIZE_TOTAL_STEPS)
+                compute_utils.update_instance_progress(
+                        context, instance, step=2,
+                        total_steps=RESIZE_TOTAL_STEPS)
 
                 # 3. Now power down the instance
                 self._shutdown(instance, vm_ref, hard=False)
-                self._update_instance_progress(context, instance,
-                                               step=3,
-                                               total_steps=RESIZE_TOTAL_STEPS)
+                compute_utils.update_instance_progress(
+                        context, instance, step=3,
+                        total_steps=RESIZE_TOTAL_STEPS)
 
                 # 4. Transfer the COW VHD
                 self._migrate_vhd(instance, cow_uuid, dest, sr_path)
-                self._update_instance_progress(context, instance,
-                                               step=4,
-                                               total_steps=RESIZE_TOTAL_STEPS)
+                compute_utils.update_instance_progress(
+                        context, instance, step=4,
+                        total_steps=RESIZE_TOTAL_STEPS)
 
                 # TODO(mdietz): we could also consider renaming these to
                 # something sensible so we don't need to blindly pass
@@ -1392,14 +1397,18 @@ class VMOps(object):
 
     def get_info(self, instance):
         """Return data about VM instance."""
-        vm_ref = self._get_vm_opaque_ref(instance)
-        vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
+        vm_rec = self._get_cached_vm_rec(instance)
+        if vm_rec is None:
+            vm_ref = self._get_vm_opaque_ref(instance)
+            vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
         return VMHelper.compile_info(vm_rec)
 
     def get_diagnostics(self, instance):
         """Return data about VM diagnostics."""
-        vm_ref = self._get_vm_opaque_ref(instance)
-        vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
+        vm_rec = self._get_cached_vm_rec(instance)
+        if vm_rec is None:
+            vm_ref = self._get_vm_opaque_ref(instance)
+            vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
         return VMHelper.compile_diagnostics(self._session, vm_rec)
 
     def get_all_bw_usage(self, start_time, stop_time=None):
@@ -1413,21 +1422,31 @@ class VMOps(object):
             LOG.exception(_("Could not get bandwidth info."),
                           exc_info=sys.exc_info())
             return {}
+        # Fetch every VM and VIF record in two bulk calls rather
+        # than several XenAPI round trips per VM and per VIF.
+        vm_recs = self._get_all_records("VM")
+        vm_recs_by_uuid = dict((rec['uuid'], rec)
+                               for rec in vm_recs.itervalues())
+        vif_recs = self._get_all_records("VIF")
         bw = {}
         for uuid, data in metrics.iteritems():
-            vm_ref = self._session.call_xenapi("VM.get_by_uuid", uuid)
-            vm_rec = self._session.call_xenapi("VM.get_record", vm_ref)
-            vif_map = {}
-            for vif in [self._session.call_xenapi("VIF.get_record", vrec)
-                        for vrec in vm_rec['VIFs']]:
-                vif_map[vif['device']] = vif['MAC']
-            name = vm_rec['name_label']
+            vm_rec = vm_recs_by_uuid.get(uuid)
+            if not vm_rec:
+                continue
             if vm_rec["is_a_template"] or vm_rec["is_control_domain"]:
                 continue
+            vif_map = {}
+            for vif_ref in vm_rec['VIFs']:
+                vif = vif_recs.get(vif_ref)
+                if vif:
+                    vif_map[vif['device']] = vif['MAC']
+            name = vm_rec['name_label']
             vifs_bw = bw.setdefault(name, {})
             for key, val in data.iteritems():
                 if key.startswith('vif_'):
                     vname = key.split('_')[1]
+                    if vname not in vif_map:
+                        continue
                     vif_bw = vifs_bw.setdefault(vif_map[vname], {})
                     if key.endswith('tx'):
                         vif_bw['bw_out'] = int(val)
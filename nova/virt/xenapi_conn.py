@@ -78,6 +78,7 @@ from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
 from nova.virt import driver
+from nova.virt.xenapi import event_watcher
 from nova.virt.xenapi import vm_utils
 from nova.virt.xenapi.vmops import VMOps
 from nova.virt.xenapi.volumeops import VolumeOps
@@ -178,7 +179,11 @@ class XenAPIConnection(driver.ComputeDriver):
         self._volumeops = VolumeOps(self._session)
         self._host_state = None
         self._product_version = self._session.get_product_version()
-        self._vmops = VMOps(self._session, self._product_version)
+        self._event_watcher = None
+        if FLAGS.xenapi_use_event_cache:
+            self._event_watcher = event_watcher.EventWatcher(self._session)
+        self._vmops = VMOps(self._session, self._product_version,
+                            event_watcher=self._event_watcher)
         self._initiator = None
 
     @property
@@ -192,7 +197,8 @@ class XenAPIConnection(driver.ComputeDriver):
         #NOTE(armando): would we need a method
         #to call when shutting down the host?
         #e.g. to do session logout?
-        pass
+        if self._event_watcher:
+            self._event_watcher.start()
 
     def list_instances(self):
         """List VM instances"""
@@ -492,6 +498,10 @@ class XenAPISession(object):
 
     def __init__(self, url, user, pw):
         self.XenAPI = self.get_imported_xenapi()
+        self._url = url
+        self._user = user
+        self._pw = pw
+        self._event_session = None
         self._sessions = queue.Queue()
         exception = self.XenAPI.Failure(_("Unable to log in to XenAPI "
                             "(is the Dom0 disk full?)"))
@@ -540,6 +550,42 @@ class XenAPISession(object):
                 f = getattr(f, m)
             return tpool.execute(f, *args)
 
+    def call_xenapi_event(self, method, *args):
+        """Call a blocking event.* method on a background thread.
+
+        These calls may wait for a long time, so they use a session of
+        their own instead of holding one from the shared pool.  That
+        session is dropped whenever a call fails, so that the next call
+        logs in again if it was invalidated or xapi was restarted.
+        """
+        if self._event_session is None:
+            session = self._create_session(self._url)
+            exception = self.XenAPI.Failure(_("Unable to log in to XenAPI "
+                                "(is the Dom0 disk full?)"))
+            with timeout.Timeout(FLAGS.xenapi_login_timeout, exception):
+                session.login_with_password(self._user, self._pw)
+            self._event_session = session
+        f = self._event_session.xenapi
+        for m in method.split('.'):
+            f = getattr(f, m)
+        try:
+            return tpool.execute(f, *args)
+        except Exception:
+            with utils.save_and_reraise_exception():
+                self._discard_event_session()
+
+    def _discard_event_session(self):
+        """Log out of the session used for event.* calls, if any."""
+        session, self._event_session = self._event_session, None
+        if session is None:
+            return
+        try:
+            tpool.execute(session.xenapi.session.logout)
+        except Exception:
+            # The session is usually already gone
+            LOG.debug(_("Failed to log out of the XenAPI event session"),
+                      exc_info=True)
+
     def call_xenapi_request(self, method, *args):
         """Some interactions with dom0, such as interacting with xenstore's
         param record, require using the xenapi_request method of the session
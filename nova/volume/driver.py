@@ -24,6 +24,8 @@ import os
 import time
 from xml.etree import ElementTree
 
+from eventlet import greenthread
+
 from nova import exception
 from nova import flags
 from nova import log as logging
@@ -60,11 +62,23 @@ volume_opts = [
     cfg.StrOpt('rbd_pool',
                default='rbd',
                help='the rbd pool in which volumes are stored'),
+    cfg.BoolOpt('volume_clear_deferred',
+                default=False,
+                help='Wipe deleted volumes in the background instead of '
+                     'before the delete returns'),
+    cfg.StrOpt('volume_clear_ionice',
+               default='-c3',
+               help='ionice class option the background wipe of deleted '
+                    'volumes runs with, e.g. -c3 for the idle class; '
+                    'empty to run it without ionice'),
     ]
 
 FLAGS = flags.FLAGS
 FLAGS.register_opts(volume_opts)
 
+# Prefix of the logical volumes waiting for a background wipe
+_WIPE_PREFIX = 'wipe-'
+
 
 class VolumeDriver(object):
     """Executes commands relating to Volumes."""
@@ -72,6 +86,8 @@ class VolumeDriver(object):
         # NOTE(vish): db is set by Manager
         self.db = None
         self.set_execute(execute)
+        self._pending_wipes = []
+        self._wipe_thread = None
 
     def set_execute(self, execute):
         self._execute = execute
@@ -130,6 +146,72 @@ class VolumeDriver(object):
                            self._escape_snapshot(volume['name'])),
                           run_as_root=True)
 
+    def _defer_delete_volume(self, volume):
+        """Renames a logical volume, and wipes and removes it later."""
+        wipe_name = _WIPE_PREFIX + volume['name']
+        self._try_execute('lvrename', FLAGS.volume_group, volume['name'],
+                          wipe_name, run_as_root=True)
+        self._schedule_wipe(wipe_name)
+
+    def _schedule_wipe(self, lv_name):
+        self._pending_wipes.append(lv_name)
+        if self._wipe_thread is None:
+            self._wipe_thread = greenthread.spawn(self._wipe_pending)
+
+    def _schedule_pending_wipes(self):
+        """Queues the wipes of volumes deleted before a restart."""
+        out, err = self._execute('lvs', '--noheadings', '-o', 'lv_name',
+                                 FLAGS.volume_group, run_as_root=True)
+        for lv_name in (out or '').split():
+            if (lv_name.startswith(_WIPE_PREFIX) and
+                lv_name not in self._pending_wipes):
+                self._schedule_wipe(lv_name)
+
+    def _wipe_pending(self):
+        """Wipes and removes the queued volumes, one at a time."""
+        try:
+            while self._pending_wipes:
+                lv_name = self._pending_wipes[0]
+                try:
+                    self._wipe_volume(lv_name)
+                except Exception:
+                    # The volume keeps its name, so the wipe is
+                    # retried when the service restarts
+                    LOG.exception(_("Failed to wipe deleted volume %s"),
+                                  lv_name)
+                del self._pending_wipes[0]
+        finally:
+            self._wipe_thread = None
+
+    def _wipe_volume(self, lv_name):
+        LOG.debug(_("Wiping deleted volume %s"), lv_name)
+        path = self.local_path({'name': lv_name})
+        if self._discard_zeroes_data(path):
+            self._execute('blkdiscard', path, run_as_root=True)
+        else:
+            out, err = self._execute('lvs', '--noheadings', '--nosuffix',
+                                     '--units', 'm', '-o', 'lv_size',
+                                     '%s/%s' % (FLAGS.volume_group, lv_name),
+                                     run_as_root=True)
+            cmd = ['dd', 'if=/dev/zero', 'of=%s' % path,
+                   'count=%d' % int(float(out.strip())), 'bs=1M']
+            if FLAGS.volume_clear_ionice:
+                cmd = ['ionice', FLAGS.volume_clear_ionice] + cmd
+            self._execute(*cmd, run_as_root=True)
+        self._try_execute('lvremove', '-f',
+                          '%s/%s' % (FLAGS.volume_group, lv_name),
+                          run_as_root=True)
+
+    @staticmethod
+    def _discard_zeroes_data(path):
+        """Returns whether discarded blocks of a device read as zeroes."""
+        device = os.path.basename(os.path.realpath(path))
+        try:
+            with open('/sys/block/%s/queue/discard_zeroes_data' % device) as f:
+                return f.read().strip() == '1'
+        except IOError:
+            return False
+
     def _sizestr(self, size_in_g):
         if int(size_in_g) == 0:
             return '100M'
@@ -172,7 +254,10 @@ class VolumeDriver(object):
             if (out[0] == 'o') or (out[0] == 'O'):
                 raise exception.VolumeIsBusy(volume_name=volume['name'])
 
-        self._delete_volume(volume, volume['size'])
+        if FLAGS.volume_clear_deferred:
+            self._defer_delete_volume(volume)
+        else:
+            self._delete_volume(volume, volume['size'])
 
     def create_snapshot(self, snapshot):
         """Creates a snapshot."""
@@ -190,6 +275,9 @@ class VolumeDriver(object):
 
         # TODO(yamahata): zeroing out the whole snapshot triggers COW.
         # it's quite slow.
+        # Snapshots are always wiped before the delete returns,
+        # because the origin volume cannot be deleted while they
+        # exist.
         self._delete_volume(snapshot, snapshot['volume_size'])
 
     def local_path(self, volume):
@@ -226,11 +314,14 @@ class VolumeDriver(object):
     def get_volume_stats(self, refresh=False):
         """Return the current state of the volume service. If 'refresh' is
            True, run the update first."""
+        if FLAGS.volume_clear_deferred:
+            return {'volumes_pending_wipe': len(self._pending_wipes)}
         return None
 
     def do_setup(self, context):
         """Any initialization the volume driver does while starting"""
-        pass
+        if FLAGS.volume_clear_deferred:
+            self._schedule_pending_wipes()
 
 
 class ISCSIDriver(VolumeDriver):
@@ -44,6 +44,7 @@ from nova import flags
 from nova import log as logging
 from nova import manager
 from nova.openstack.common import cfg
+from nova import quota
 from nova import rpc
 from nova import utils
 from nova.volume import volume_types
@@ -194,6 +195,9 @@ class VolumeManager(manager.SchedulerDependentManager):
                                       {'status': 'error_deleting'})
 
         self.db.volume_destroy(context, volume_id)
+        quota.apply_usage_delta(context, volume_ref['project_id'],
+                                volumes=-1,
+                                gigabytes=-volume_ref['size'])
         LOG.debug(_("volume %s: deleted successfully"), volume_ref['name'])
         return True
 
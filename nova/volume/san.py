@@ -22,6 +22,7 @@ controller on the SAN hardware.  We expect to access it over SSH or some API.
 """
 
 import base64
+import errno
 import httplib
 import json
 import os
@@ -29,9 +30,12 @@ import paramiko
 import random
 import socket
 import string
+import time
 import uuid
 from xml.etree import ElementTree
 
+from eventlet import pools
+
 from nova import exception
 from nova import flags
 from nova import log as logging
@@ -65,6 +69,13 @@ san_opts = [
     cfg.IntOpt('san_ssh_port',
                default=22,
                help='SSH port to use with SAN'),
+    cfg.IntOpt('san_ssh_pool_size',
+               default=4,
+               help='Maximum number of SSH connections kept open to SAN'),
+    cfg.IntOpt('san_ssh_keepalive_interval',
+               default=30,
+               help='Seconds between keepalive packets on SSH connections '
+                    'to SAN; 0 disables keepalive'),
     cfg.BoolOpt('san_is_local',
                 default='false',
                 help='Execute commands locally instead of over SSH; '
@@ -72,12 +83,62 @@ san_opts = [
     cfg.StrOpt('san_zfs_volume_base',
                default='rpool/',
                help='The ZFS path under which to create zvols for volumes.'),
+    cfg.IntOpt('sf_api_pool_size',
+               default=4,
+               help='Maximum number of HTTPS connections kept open to the '
+                    'SolidFire API'),
+    cfg.IntOpt('sf_cache_ttl',
+               default=300,
+               help='Seconds SolidFire cluster info and accounts are cached; '
+                    '0 disables caching'),
     ]
 
 FLAGS = flags.FLAGS
 FLAGS.register_opts(san_opts)
 
 
+class SSHPool(pools.Pool):
+    """A bounded pool of SSH connections to the SAN controller.
+
+    Connections which have dropped are closed and replaced when they
+    are taken from the pool.
+    """
+
+    def __init__(self, connect, *args, **kwargs):
+        self._connect = connect
+        super(SSHPool, self).__init__(*args, **kwargs)
+
+    def create(self):
+        LOG.debug(_('Opening SSH connection to SAN'))
+        ssh = self._connect()
+        if FLAGS.san_ssh_keepalive_interval:
+            transport = ssh.get_transport()
+            transport.set_keepalive(FLAGS.san_ssh_keepalive_interval)
+        return ssh
+
+    def get(self):
+        """Return a live connection from the pool."""
+        ssh = super(SSHPool, self).get()
+        if ssh is not None:
+            transport = ssh.get_transport()
+            if transport is not None and transport.is_active():
+                return ssh
+            LOG.debug(_('SSH connection to SAN dropped, reconnecting'))
+            ssh.close()
+
+        try:
+            return self.create()
+        except Exception:
+            # Keep the slot of the connection in the pool
+            self.put(None)
+            raise
+
+    def discard(self, ssh):
+        """Close a broken connection in place of returning it."""
+        ssh.close()
+        self.put(None)
+
+
 class SanISCSIDriver(ISCSIDriver):
     """Base class for SAN-style storage volumes
 
@@ -89,6 +150,7 @@ class SanISCSIDriver(ISCSIDriver):
     def __init__(self):
         super(SanISCSIDriver, self).__init__()
         self.run_local = FLAGS.san_is_local
+        self.sshpool = None
 
     def _build_iscsi_target_name(self, volume):
         return "%s%s" % (FLAGS.iscsi_target_prefix, volume['name'])
@@ -123,14 +185,24 @@ class SanISCSIDriver(ISCSIDriver):
             return self._run_ssh(command, check_exit_code)
 
     def _run_ssh(self, command, check_exit_code=True):
-        #TODO(justinsb): SSH connection caching (?)
-        ssh = self._connect_to_ssh()
-
-        #TODO(justinsb): Reintroduce the retry hack
-        ret = ssh_execute(ssh, command, check_exit_code=check_exit_code)
-
-        ssh.close()
-
+        if self.sshpool is None:
+            self.sshpool = SSHPool(self._connect_to_ssh,
+                                   max_size=FLAGS.san_ssh_pool_size,
+                                   order_as_stack=True)
+
+        ssh = self.sshpool.get()
+        try:
+            ret = ssh_execute(ssh, command, check_exit_code=check_exit_code)
+        except (paramiko.SSHException, socket.error, EOFError):
+            #TODO(justinsb): Reintroduce the retry hack
+            # The command may have run, so it is not retried here
+            self.sshpool.discard(ssh)
+            raise
+        except Exception:
+            self.sshpool.put(ssh)
+            raise
+
+        self.sshpool.put(ssh)
         return ret
 
     def ensure_export(self, context, volume):
@@ -656,6 +728,66 @@ class HpSanISCSIDriver(SanISCSIDriver):
 
 class SolidFireSanISCSIDriver(SanISCSIDriver):
 
+    def __init__(self):
+        super(SolidFireSanISCSIDriver, self).__init__()
+        self.connpool = pools.Pool(max_size=FLAGS.sf_api_pool_size,
+                                   order_as_stack=True,
+                                   create=self._create_connection)
+        self._cache = {}
+
+    @staticmethod
+    def _create_connection():
+        # For now 443 is the only port our server accepts requests on
+        return httplib.HTTPSConnection(FLAGS.san_ip, 443)
+
+    def _cache_get(self, key):
+        """Return a cached value, or None if it is missing or expired."""
+        try:
+            expires, value = self._cache[key]
+        except KeyError:
+            return None
+        if expires < time.time():
+            del self._cache[key]
+            return None
+        return value
+
+    def _cache_set(self, key, value):
+        if FLAGS.sf_cache_ttl:
+            self._cache[key] = (time.time() + FLAGS.sf_cache_ttl, value)
+
+    @staticmethod
+    def _post(connection, payload, header):
+        """Post a JSON-RPC request, returning the status and the body.
+
+        The device closes idle connections.  If a reused connection was
+        closed before the device answered, the request is sent again on
+        a new connection.  Any other failure, timeouts included, may come
+        after the device ran the request, so it is raised rather than
+        running the request twice.
+        """
+        reused = connection.sock is not None
+        sent = False
+        try:
+            connection.request('POST', '/json-rpc/1.0', payload, header)
+            sent = True
+            response = connection.getresponse()
+        except httplib.BadStatusLine:
+            if not reused:
+                raise
+        except socket.error, exc:
+            if not (reused and not sent and
+                    exc.errno in (errno.ECONNRESET, errno.EPIPE)):
+                raise
+        else:
+            # The whole response must be read to reuse the connection
+            return response.status, response.read()
+
+        LOG.debug(_("SolidFire API connection closed, reconnecting"))
+        connection.close()
+        connection.request('POST', '/json-rpc/1.0', payload, header)
+        response = connection.getresponse()
+        return response.status, response.read()
+
     def _issue_api_request(self, method_name, params):
         """All API requests to SolidFire device go through this method
 
@@ -664,10 +796,6 @@ class SolidFireSanISCSIDriver(SanISCSIDriver):
         and returns results in a dict as well.
         """
 
-        host = FLAGS.san_ip
-        # For now 443 is the only port our server accepts requests on
-        port = 443
-
         # NOTE(john-griffith): Probably don't need this, but the idea is
         # we provide a request_id so we can correlate
         # responses with requests
@@ -695,28 +823,25 @@ class SolidFireSanISCSIDriver(SanISCSIDriver):
             header['Authorization'] = 'Basic %s' % auth_key
 
         LOG.debug(_("Payload for SolidFire API call: %s" % payload))
-        connection = httplib.HTTPSConnection(host, port)
-        connection.request('POST', '/json-rpc/1.0', payload, header)
-        response = connection.getresponse()
-        data = {}
-
-        if response.status != 200:
+        connection = self.connpool.get()
+        try:
+            status, data = self._post(connection, payload, header)
+        except Exception:
             connection.close()
+            self.connpool.put(connection)
+            raise
+        self.connpool.put(connection)
+
+        if status != 200:
             msg = _("Error in SolidFire API response, status was: %s"
-                    % response.status)
+                    % status)
             raise exception.ApiError(msg)
 
-        else:
-            data = response.read()
-            try:
-                data = json.loads(data)
-
-            except (TypeError, ValueError), exc:
-                connection.close()
-                msg = _("Call to json.loads() raised an exception: %s" % exc)
-                raise exception.SfJsonEncodeFailure(msg)
-
-            connection.close()
+        try:
+            data = json.loads(data)
+        except (TypeError, ValueError), exc:
+            msg = _("Call to json.loads() raised an exception: %s" % exc)
+            raise exception.SfJsonEncodeFailure(msg)
 
         LOG.debug(_("Results of SolidFire API call: %s" % data))
         return data
@@ -728,12 +853,16 @@ class SolidFireSanISCSIDriver(SanISCSIDriver):
             return data['result']['volumes']
 
     def _get_sfaccount_by_name(self, sf_account_name):
-        sfaccount = None
+        sfaccount = self._cache_get(('account', sf_account_name))
+        if sfaccount is not None:
+            return sfaccount
+
         params = {'username': sf_account_name}
         data = self._issue_api_request('GetAccountByName', params)
         if 'result' in data and 'account' in data['result']:
             LOG.debug(_('Found solidfire account: %s' % sf_account_name))
             sfaccount = data['result']['account']
+            self._cache_set(('account', sf_account_name), sfaccount)
         return sfaccount
 
     def _create_sfaccount(self, nova_project_id):
@@ -760,6 +889,10 @@ class SolidFireSanISCSIDriver(SanISCSIDriver):
         return sfaccount
 
     def _get_cluster_info(self):
+        cluster_info = self._cache_get(('cluster_info',))
+        if cluster_info is not None:
+            return cluster_info
+
         params = {}
         data = self._issue_api_request('GetClusterInfo', params)
         if 'result' not in data:
@@ -767,6 +900,7 @@ class SolidFireSanISCSIDriver(SanISCSIDriver):
                     % data)
             raise exception.ApiError(msg)
 
+        self._cache_set(('cluster_info',), data['result'])
         return data['result']
 
     def _do_export(self, volume):
@@ -30,6 +30,7 @@ from nova import exception
 from nova import flags
 from nova import log as logging
 from nova.openstack.common import cfg
+from nova import quota
 from nova import rpc
 from nova import volume
 from nova.compute import instance_types
@@ -338,6 +339,9 @@ class API(base.Base):
         if not host:
             # Deleting volume from database and skipping rpc.
             self.db.volume_destroy(ctxt, volume['id'])
+            quota.apply_usage_delta(ctxt, volume['project_id'],
+                                    volumes=-1,
+                                    gigabytes=-volume['size'])
             return
 
         rpc.cast(ctxt,